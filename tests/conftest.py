@@ -0,0 +1,22 @@
+import nonebot
+from nonebug import NONEBOT_INIT_KWARGS, NONEBOT_START_LIFESPAN
+import pytest
+
+
+def pytest_configure(config: pytest.Config):
+    config.stash[NONEBOT_INIT_KWARGS] = {
+        "driver": "~fastapi+~httpx",
+        "user_agent": "xiaobawang-tests",
+        "sqlalchemy_database_url": "sqlite+aiosqlite:///:memory:",
+        "alembic_startup_check": False,
+    }
+    # 不触发插件的启动钩子（数据库、监听器、定时任务等）
+    config.stash[NONEBOT_START_LIFESPAN] = False
+
+
+@pytest.fixture(scope="session", autouse=True)
+async def after_nonebot_init(after_nonebot_init: None):
+    from nonebot.adapters.onebot.v11 import Adapter as ONEBOT_V11Adapter
+
+    nonebot.get_driver().register_adapter(ONEBOT_V11Adapter)
+    nonebot.load_from_toml("pyproject.toml")
@@ -0,0 +1,116 @@
+"""集群模式：接手宕机节点未确认的条目时覆盖其去重认领"""
+
+from typing import Any
+
+import pytest
+
+
+class _FakePipeline:
+    def __init__(self, redis: "_FakeRedis"):
+        self.redis = redis
+        self.commands: list[tuple] = []
+
+    def set(self, key: str, value: str, nx: bool = False, ex: int | None = None):
+        self.commands.append(("set", key, value, nx))
+
+    def get(self, key: str):
+        self.commands.append(("get", key))
+
+    async def execute(self) -> list[Any]:
+        replies = []
+        for command in self.commands:
+            if command[0] == "set":
+                _, key, value, nx = command
+                if nx and key in self.redis.store:
+                    replies.append(None)
+                    continue
+                self.redis.store[key] = value.encode()
+                replies.append(True)
+            else:
+                replies.append(self.redis.store.get(command[1]))
+        return replies
+
+
+class _FakeRedis:
+    """只实现认领与消费组读取用到的命令"""
+
+    def __init__(self, pending=(), claimable=(), new=()):
+        self.store: dict[str, bytes] = {}
+        self.pending = list(pending)
+        self.claimable = list(claimable)
+        self.new = list(new)
+
+    def pipeline(self, transaction: bool = True) -> _FakePipeline:
+        return _FakePipeline(self)
+
+    async def xreadgroup(self, group, consumer, streams: dict, count=None, block=None):
+        stream, last_id = next(iter(streams.items()))
+        if last_id == ">":
+            entries, self.new = self.new, []
+        else:
+            last_id = last_id.encode() if isinstance(last_id, str) else last_id
+            entries = [entry for entry in self.pending if entry[0] > last_id]
+        return [[stream, entries]] if entries else []
+
+    async def xautoclaim(self, stream, group, consumer, min_idle_time, start_id="0-0", count=None):
+        entries, self.claimable = self.claimable, []
+        return [b"0-0", entries, []]
+
+
+@pytest.fixture
+def fake_redis(monkeypatch: pytest.MonkeyPatch):
+    from xiaobawang.plugins.core.utils.common.cache import cache as redis_cache
+
+    def install(**kwargs: Any) -> _FakeRedis:
+        redis = _FakeRedis(**kwargs)
+        monkeypatch.setattr(redis_cache, "_redis", redis)
+        monkeypatch.setattr(redis_cache, "_initialized", True)
+        return redis
+
+    return install
+
+
+def _entry(entry_id: bytes, killmail_id: int) -> tuple[bytes, dict[bytes, bytes]]:
+    from xiaobawang.plugins.core.helper.zkb.record import KillmailRecord
+
+    record = KillmailRecord({"killmail_id": killmail_id, "victim": {}, "attackers": [], "zkb": {}})
+    return entry_id, {b"n": str(killmail_id).encode(), b"d": record.raw}
+
+
+async def test_read_marks_recovered_entries(fake_redis):
+    from xiaobawang.plugins.core.helper.zkb.cluster import KillmailCluster
+
+    fake_redis(pending=[_entry(b"1-0", 1)], claimable=[_entry(b"2-0", 2)], new=[_entry(b"3-0", 3)])
+    cluster = KillmailCluster("node-b")
+
+    # 重启后接回本节点的、接手其他节点的条目都标记为 recovered，新条目不标记
+    reads = [await cluster.read(10, block_ms=0) for _ in range(3)]
+    assert [[(entry_id, record.killmail_id, recovered) for entry_id, record, recovered in read] for read in reads] == [
+        [(b"1-0", 1, True)],
+        [(b"2-0", 2, True)],
+        [(b"3-0", 3, False)],
+    ]
+    assert cluster.claimed == 1
+
+
+async def test_takeover_overrides_dead_owner_claim(fake_redis, monkeypatch: pytest.MonkeyPatch):
+    from xiaobawang.plugins.core.helper.zkb.listener import KM_DEDUP_PREFIX, zkb_listener
+    from xiaobawang.plugins.core.utils.common.cache import cache as redis_cache
+
+    redis = fake_redis()
+    monkeypatch.setattr(zkb_listener, "_claim_owner", "node-b")
+    key = redis_cache._get_key(f"{KM_DEDUP_PREFIX}42")
+    # 宕机节点在处理前已认领
+    redis.store[key] = b"node-a"
+
+    # 正常投递：其他节点已认领，按重复丢弃
+    assert not await zkb_listener._claim_km(42)
+    assert redis.store[key] == b"node-a"
+
+    # 接手的条目：原认领者已无法完成处理，覆盖认领后由本节点处理
+    assert await zkb_listener._claim_km(42, takeover=True)
+    assert redis.store[key] == b"node-b"
+
+    # 已是本节点的认领，重复投递仍由本节点处理
+    assert await zkb_listener._claim_km(42)
+    assert redis.store[key] == b"node-b"
@@ -0,0 +1,195 @@
+"""订阅条件编译：求值语义、按选择性重排、原因文本与共享叶子的引用计数"""
+
+from datetime import datetime, timezone
+from typing import Any
+
+import pytest
+
+
+def _killmail(**zkb: Any) -> dict[str, Any]:
+    return {
+        "killmail_id": 1,
+        "killmail_time": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "solar_system_id": 30000142,
+        "victim": {"character_id": 1001, "corporation_id": 2001, "alliance_id": 3001, "ship_type_id": 587},
+        "attackers": [
+            {
+                "character_id": 1101,
+                "corporation_id": 2101,
+                "alliance_id": 3101,
+                "ship_type_id": 11567,
+                "final_blow": True,
+            },
+            {"character_id": 1102, "corporation_id": 2102, "ship_type_id": 24690, "final_blow": False},
+        ],
+        "zkb": {"totalValue": 5_000_000_000, "labels": ["pvp", "loc:highsec"], **zkb},
+    }
+
+
+def _entity(entity_type: str, entity_id: int, role: str = "", **extra: Any) -> dict[str, Any]:
+    return {
+        "type": "entity",
+        "entity_type": entity_type,
+        "entity_id": entity_id,
+        "entity_name": str(entity_id),
+        "role": role,
+        **extra,
+    }
+
+
+def _group(logic: str, *conditions: dict, groups: tuple[dict, ...] = ()) -> dict[str, Any]:
+    return {"logic": logic, "conditions": list(conditions), "groups": list(groups)}
+
+
+def _match(condition_groups: dict, killmail: dict | None = None, conditions=None) -> tuple[bool, list[str]]:
+    from xiaobawang.plugins.core.helper.zkb.condition_compiler import CompiledConditionCache
+    from xiaobawang.plugins.core.helper.zkb.condition_matcher import ConditionMatcher
+
+    matcher = ConditionMatcher(killmail or _killmail(), conditions=conditions or CompiledConditionCache())
+    return matcher.match_conditions({"id": 1, "updated_at": "t", "condition_groups": condition_groups})
+
+
+@pytest.mark.parametrize(
+    ("condition", "expected"),
+    [
+        (_entity("corporation", 2001, "victim"), True),
+        (_entity("corporation", 2101, "victim"), False),
+        (_entity("character", 1101, "final_blow"), True),
+        (_entity("character", 1102, "final_blow"), False),
+        (_entity("alliance", 3101, "any_attacker"), True),
+        (_entity("corporation", 2102, "any_attacker"), True),
+        (_entity("alliance", 3001, "any_attacker"), False),
+        (_entity("system", 30000142), True),
+        (_entity("system", 30000144), False),
+        (_entity("ship", 587, ship_role="victim_ship"), True),
+        (_entity("ship", 11567, ship_role="final_blow_ship"), True),
+        (_entity("ship", 24690, ship_role="final_blow_ship"), False),
+        (_entity("corporation", 2001, "unknown_role"), False),
+        (_entity("station", 60003760), False),
+    ],
+)
+def test_entity_roles(condition: dict, expected: bool):
+    assert _match(_group("AND", condition))[0] is expected
+
+
+def test_and_or_semantics():
+    hit = _entity("corporation", 2001, "victim")
+    miss = _entity("corporation", 9999, "victim")
+
+    assert _match(_group("AND", hit, miss)) == (False, [])
+    assert _match(_group("OR", miss, miss)) == (False, [])
+    assert _match(_group("OR", miss, hit))[0]
+    # 嵌套组：AND(命中, OR(未命中, 命中))
+    assert _match(_group("AND", hit, groups=(_group("OR", miss, _entity("alliance", 3101, "any_attacker")),)))[0]
+
+
+def test_reasons_follow_original_order():
+    from xiaobawang.plugins.core.helper.zkb.condition_compiler import CompiledConditionCache
+
+    # 求值顺序按选择性重排，原因仍按条件的原始顺序给出
+    condition_groups = _group(
+        "OR",
+        _entity("alliance", 3101, "any_attacker"),
+        _entity("corporation", 9999, "victim"),
+        _entity("corporation", 2001, "victim"),
+        {"type": "value", "min": 1_000_000_000, "max": None},
+    )
+    conditions = CompiledConditionCache()
+    predicate = conditions.get({"id": 1, "updated_at": "t", "condition_groups": condition_groups})
+    assert predicate.order != predicate.children
+
+    matched, reasons = _match(condition_groups, conditions=conditions)
+    assert matched
+    assert reasons == ["[alliance]参与击杀: 3101", "[corporation]损失: 2001", "价值: 5,000,000,000 ISK"]
+
+
+def test_empty_and_unknown():
+    assert _match({}) == (True, [])
+    assert _match(_group("AND")) == (True, [])
+    assert _match(_group("AND", {"type": "unknown"}))[0] is False
+    hit = _entity("corporation", 2001, "victim")
+    assert _match(_group("XOR", hit, hit))[0] is False
+
+
+@pytest.mark.parametrize(
+    ("value_min", "value_max", "expected"),
+    [
+        (None, None, True),
+        (5_000_000_000, None, True),
+        (5_000_000_001, None, False),
+        (None, 5_000_000_000, True),
+        (None, 4_999_999_999, False),
+        (1_000_000_000, 10_000_000_000, True),
+    ],
+)
+def test_value_bounds(value_min: float | None, value_max: float | None, expected: bool):
+    assert _match(_group("AND", {"type": "value", "min": value_min, "max": value_max}))[0] is expected
+
+
+def test_invalid_value_is_unmatched():
+    # 非法的条件值按不满足处理，不抛出也不影响同一订阅的其他分支
+    invalid = {"type": "value", "min": "1b", "max": None}
+    assert _match(_group("AND", invalid)) == (False, [])
+    assert _match(_group("OR", invalid, _entity("corporation", 2001, "victim")))[0]
+
+
+@pytest.mark.parametrize(
+    ("required", "excluded", "expected", "reasons"),
+    [
+        (["solo", "pvp"], [], True, ["标签: pvp"]),
+        (["solo"], [], False, []),
+        ([], ["npc"], True, ["标签匹配"]),
+        (["pvp"], ["loc:highsec"], False, []),
+        ([], [], True, []),
+    ],
+)
+def test_labels(required: list[str], excluded: list[str], expected: bool, reasons: list[str]):
+    condition = {"type": "label", "required_labels": required, "excluded_labels": excluded}
+    assert _match(_group("AND", condition)) == (expected, reasons)
+
+
+def test_leaves_shared_across_subscriptions():
+    from xiaobawang.plugins.core.helper.zkb.condition_compiler import CompiledConditionCache
+    from xiaobawang.plugins.core.helper.zkb.condition_matcher import ConditionMatcher
+
+    conditions = CompiledConditionCache()
+    shared = _entity("corporation", 2001, "victim")
+    first = {"id": 1, "updated_at": "t", "condition_groups": _group("AND", shared)}
+    second = {
+        "id": 2,
+        "updated_at": "t",
+        "condition_groups": _group("AND", dict(shared, entity_name="别名"), {"type": "value", "min": 1, "max": None}),
+    }
+
+    matcher = ConditionMatcher(_killmail(), conditions=conditions)
+    assert matcher.match_conditions(first) == (True, ["[corporation]损失: 2001"])
+    # 同一叶子复用同一 slot，原因文本仍是各订阅自己的
+    assert matcher.match_conditions(second) == (True, ["[corporation]损失: 别名", "价值: 5,000,000,000 ISK"])
+    assert len(conditions.leaves) == 2
+    assert len(matcher.leaf_results) == 2
+
+
+def test_leaf_refcount():
+    from xiaobawang.plugins.core.helper.zkb.condition_compiler import CompiledConditionCache
+
+    conditions = CompiledConditionCache()
+    shared = _entity("corporation", 2001, "victim")
+    conditions.get({"id": 1, "updated_at": "t", "condition_groups": _group("AND", shared)})
+    conditions.get({"id": 2, "updated_at": "t", "condition_groups": _group("AND", shared)})
+    assert len(conditions.leaves) == 1
+
+    # 订阅更新后旧条件不再被引用
+    updated = _group("AND", _entity("alliance", 3001, "victim"))
+    conditions.get({"id": 2, "updated_at": "t2", "condition_groups": updated})
+    assert len(conditions.leaves) == 2
+
+    conditions.retain([2])
+    assert len(conditions) == 1
+    assert len(conditions.leaves) == 1
+
+    conditions.retain([])
+    assert len(conditions.leaves) == 0
+
+    # 不缓存（无订阅 ID）的编译结果不持有引用
+    conditions.get({"condition_groups": _group("AND", shared)})
+    assert len(conditions.leaves) == 0
@@ -0,0 +1,100 @@
+"""星系跳数矩阵：按位并行 BFS 与逐起点 BFS 的结果一致"""
+
+from collections import deque
+import itertools
+import json
+from pathlib import Path
+import random
+
+import numpy as np
+
+
+def _gate_graph(rng: random.Random) -> dict[int, set[int]]:
+    """
+    随机星门图：一个连通的主星域（随机树 + 额外连接 + 一条长链）和一个不连通的小分量
+
+    节点数超过一批（64 个起点），覆盖多批计算
+    """
+    graph: dict[int, set[int]] = {}
+
+    def connect(a: int, b: int):
+        graph.setdefault(a, set()).add(b)
+        graph.setdefault(b, set()).add(a)
+
+    systems = [30_000_000 + i for i in range(200)]
+    for i, system in enumerate(systems[1:], 1):
+        connect(system, systems[rng.randrange(i)])
+    for _ in range(60):
+        a, b = rng.sample(systems, 2)
+        connect(a, b)
+    chain = [30_001_000 + i for i in range(80)]
+    connect(systems[-1], chain[0])
+    for a, b in itertools.pairwise(chain):
+        connect(a, b)
+
+    island = [31_000_000 + i for i in range(5)]
+    for a, b in itertools.pairwise(island):
+        connect(a, b)
+    return graph
+
+
+def _bfs(graph: dict[int, set[int]], source: int) -> dict[int, int]:
+    distances = {source: 0}
+    queue = deque([source])
+    while queue:
+        system = queue.popleft()
+        for neighbor in graph[system]:
+            if neighbor not in distances:
+                distances[neighbor] = distances[system] + 1
+                queue.append(neighbor)
+    return distances
+
+
+def _edges(graph: dict[int, set[int]]) -> np.ndarray:
+    return np.array([(a, b) for a, neighbors in graph.items() for b in neighbors], dtype=np.int64)
+
+
+def test_matrix_matches_bfs(tmp_path: Path):
+    from xiaobawang.plugins.sde.jumps import JUMP_UNREACHABLE, _compute_matrix
+
+    graph = _gate_graph(random.Random(0))
+    ids = _compute_matrix(_edges(graph), tmp_path / "matrix.u8")
+    assert ids.tolist() == sorted(graph)
+
+    matrix = np.fromfile(tmp_path / "matrix.u8", dtype=np.uint8).reshape(len(ids), len(ids))
+    for row, source in enumerate(ids.tolist()):
+        distances = _bfs(graph, source)
+        expected = [distances.get(target, JUMP_UNREACHABLE) for target in ids.tolist()]
+        assert matrix[row].tolist() == expected, f"system {source}"
+
+
+async def test_load_and_query(tmp_path: Path):
+    from xiaobawang.plugins.sde.jumps import (
+        JUMP_IDS_FILE,
+        JUMP_MATRIX_FILE,
+        JUMP_META_FILE,
+        JUMP_UNREACHABLE,
+        JumpDistances,
+        _compute_matrix,
+    )
+
+    graph = _gate_graph(random.Random(1))
+    ids = _compute_matrix(_edges(graph), tmp_path / JUMP_MATRIX_FILE)
+    np.save(tmp_path / JUMP_IDS_FILE, ids)
+    # 标识与 SDE 文件一致时直接加载，不重新生成
+    db_path = tmp_path / "sde.sqlite"
+    db_path.write_bytes(b"")
+    (tmp_path / JUMP_META_FILE).write_text(json.dumps({"stamp": JumpDistances._stamp(db_path)}), encoding="utf-8")
+
+    jumps = JumpDistances()
+    await jumps.load(db_path)
+    assert jumps.loaded
+
+    source = 30_000_000
+    distances = _bfs(graph, source)
+    assert jumps.distance(source, 30_001_079) == distances[30_001_079]
+    assert jumps.distance(source, 31_000_000) == JUMP_UNREACHABLE
+    assert jumps.distance(source, 1) is None
+    assert sorted(jumps.within(source, 3)) == sorted(s for s, d in distances.items() if d <= 3)
+    assert jumps.within(31_000_000, 10) == [31_000_000 + i for i in range(5)]
+    assert jumps.within(1, 3) is None
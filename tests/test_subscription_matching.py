@@ -0,0 +1,208 @@
+"""
+倒排索引 + 向量化预过滤的匹配结果与逐个订阅完整匹配一致
+
+参考用例的期望值取自改造前的 ConditionMatcher（逐订阅、逐条件异步求值）在同一 killmail 上的结果，
+同时校验编译后的完整匹配与经索引的 validator 两条路径。
+"""
+
+from datetime import datetime, timedelta, timezone
+import random
+from typing import Any
+
+import pytest
+
+# 星系 30000142 在合成表中属于星座 20000017、星域 10000001；受害舰船 587 属于群组 52
+_KILLMAIL_AGE = timedelta(days=5, hours=12)
+
+
+def _reference_killmail() -> dict[str, Any]:
+    return {
+        "killmail_id": 1,
+        "killmail_time": (datetime.now(timezone.utc) - _KILLMAIL_AGE).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "solar_system_id": 30000142,
+        "victim": {"character_id": 1001, "corporation_id": 2001, "alliance_id": 3001, "ship_type_id": 587},
+        "attackers": [
+            {
+                "character_id": 1101,
+                "corporation_id": 2101,
+                "alliance_id": 3101,
+                "ship_type_id": 11567,
+                "final_blow": True,
+            },
+            {"character_id": 1102, "corporation_id": 2102, "ship_type_id": 24690, "final_blow": False},
+        ],
+        "zkb": {"totalValue": 5_000_000_000, "labels": ["pvp", "loc:highsec"]},
+    }
+
+
+def _entity(entity_type: str, entity_id: Any, role: str = "", **extra: Any) -> dict[str, Any]:
+    return {
+        "type": "entity",
+        "entity_type": entity_type,
+        "entity_id": entity_id,
+        "entity_name": "A",
+        "role": role,
+        **extra,
+    }
+
+
+def _group(logic: str, *conditions: dict, groups: tuple[dict, ...] = ()) -> dict[str, Any]:
+    return {"logic": logic, "conditions": list(conditions), "groups": list(groups)}
+
+
+_HIT = _entity("corporation", 2001, "victim")
+_MISS = _entity("corporation", 9999, "victim")
+_VALUE_REASON = "价值: 5,000,000,000 ISK"
+
+REFERENCE_CASES = [
+    # 实体角色
+    pytest.param(_group("AND", _HIT), {}, (True, ["[corporation]损失: A"]), id="victim"),
+    pytest.param(_group("AND", _entity("character", 1101, "victim")), {}, (False, []), id="victim-miss"),
+    pytest.param(
+        _group("AND", _entity("character", 1101, "final_blow")), {}, (True, ["[character]最后一击: A"]), id="final-blow"
+    ),
+    pytest.param(_group("AND", _entity("character", 1102, "final_blow")), {}, (False, []), id="final-blow-miss"),
+    pytest.param(
+        _group("AND", _entity("corporation", 2102, "any_attacker")),
+        {},
+        (True, ["[corporation]参与击杀: A"]),
+        id="any-attacker",
+    ),
+    pytest.param(_group("AND", _entity("alliance", 3001, "any_attacker")), {}, (False, []), id="any-attacker-miss"),
+    pytest.param(_group("AND", _entity("character", 1001)), {}, (False, []), id="no-role"),
+    pytest.param(_group("AND", _entity("ship", 587)), {}, (True, ["受害舰船: A"]), id="victim-ship-default"),
+    pytest.param(
+        _group("AND", _entity("ship", 11567, ship_role="final_blow_ship")),
+        {},
+        (True, ["最后一击舰船: A"]),
+        id="final-blow-ship",
+    ),
+    pytest.param(_group("AND", _entity("system", 30000142)), {}, (True, ["星系: A"]), id="system"),
+    pytest.param(_group("AND", _entity("constellation", 20000017)), {}, (True, ["星座: A"]), id="constellation"),
+    pytest.param(_group("AND", _entity("region", 10000001)), {}, (True, ["区域: A"]), id="region"),
+    pytest.param(_group("AND", _entity("region", 10000002)), {}, (False, []), id="region-miss"),
+    pytest.param(_group("AND", _entity("group", 52)), {}, (True, ["群组: A"]), id="group"),
+    # 逻辑与原因
+    pytest.param(
+        _group("OR", _MISS, _entity("alliance", 3101, "any_attacker"), {"type": "value", "min": 1e9, "max": None}),
+        {},
+        (True, ["[alliance]参与击杀: A", _VALUE_REASON]),
+        id="or-reasons",
+    ),
+    pytest.param(
+        _group("AND", _entity("system", 30000142), {"type": "label", "required_labels": ["solo", "pvp"]}),
+        {},
+        (True, ["星系: A", "标签: pvp"]),
+        id="and-label",
+    ),
+    pytest.param(
+        _group("AND", _HIT, groups=(_group("OR", _MISS, {"type": "label", "excluded_labels": ["npc"]}),)),
+        {},
+        (True, ["[corporation]损失: A", "标签匹配"]),
+        id="nested-excluded-label",
+    ),
+    pytest.param(
+        _group("AND", _HIT, {"type": "label", "required_labels": [], "excluded_labels": []}),
+        {},
+        (True, ["[corporation]损失: A"]),
+        id="empty-label",
+    ),
+    pytest.param(_group("AND", _HIT, {"type": "value", "min": None, "max": 1e9}), {}, (False, []), id="value-max"),
+    pytest.param(_group("AND", _HIT, {"type": "label", "excluded_labels": ["pvp"]}), {}, (False, []), id="excluded"),
+    pytest.param({}, {}, (True, []), id="empty-groups"),
+    # 全局过滤
+    pytest.param(_group("AND", _HIT), {"min_value": 5_000_000_000}, (True, ["[corporation]损失: A"]), id="min-equal"),
+    pytest.param(_group("AND", _HIT), {"min_value": 5_000_000_001}, (False, []), id="min-above"),
+    pytest.param(_group("AND", _HIT), {"max_age_days": 5}, (True, ["[corporation]损失: A"]), id="age-boundary"),
+    pytest.param(_group("AND", _HIT), {"max_age_days": 4}, (False, []), id="age-expired"),
+    pytest.param(_group("AND", _HIT), {"max_age_days": "abc"}, (True, ["[corporation]损失: A"]), id="age-invalid"),
+]
+
+
+@pytest.mark.parametrize(("condition_groups", "filters", "expected"), REFERENCE_CASES)
+async def test_reference_cases(condition_groups: dict, filters: dict, expected: tuple[bool, list[str]]):
+    from xiaobawang.plugins.core.helper.zkb.benchmark import SyntheticMatcher, _StaticSubscriptionManager
+    from xiaobawang.plugins.core.helper.zkb.condition_compiler import (
+        NEED_LOCATION,
+        NEED_SHIP_CLASS,
+        CompiledConditionCache,
+    )
+    from xiaobawang.plugins.core.helper.zkb.record import KillmailRecord
+    from xiaobawang.plugins.core.helper.zkb.validator_v2 import KillmailValidatorV2
+
+    subscription = {
+        "id": 1,
+        "platform": "qq",
+        "bot_id": "10000",
+        "session_id": "1",
+        "session_type": "group",
+        "name": "ref",
+        "is_enabled": True,
+        "min_value": 1_000_000,
+        "max_age_days": None,
+        "condition_groups": condition_groups,
+        "updated_at": "t",
+        **filters,
+    }
+    record = KillmailRecord(_reference_killmail())
+
+    # 完整匹配：全局过滤 + 条件组
+    matcher = SyntheticMatcher(record, conditions=CompiledConditionCache())
+    await matcher.resolve({NEED_LOCATION, NEED_SHIP_CLASS})
+    assert matcher.match_subscription(subscription) == expected
+
+    # 经倒排索引与向量化预过滤
+    validator = KillmailValidatorV2(
+        _StaticSubscriptionManager([subscription]),
+        conditions=CompiledConditionCache(),
+        matcher_cls=SyntheticMatcher,
+    )
+    matched, reasons = expected
+    session_key = ("qq", "10000", "1", "group", record.total_value)
+    assert (await validator.validate_and_match(record) or {}) == ({session_key: ["[ref]", *reasons]} if matched else {})
+
+
+@pytest.mark.parametrize("attackers", [1, 30, 500])
+async def test_index_matches_full_scan(attackers: int):
+    from xiaobawang.plugins.core.helper.zkb.benchmark import (
+        SyntheticMatcher,
+        _StaticSubscriptionManager,
+        make_killmail,
+        make_subscriptions,
+    )
+    from xiaobawang.plugins.core.helper.zkb.condition_compiler import (
+        NEED_LOCATION,
+        NEED_SHIP_CLASS,
+        CompiledConditionCache,
+    )
+    from xiaobawang.plugins.core.helper.zkb.record import KillmailRecord
+    from xiaobawang.plugins.core.helper.zkb.validator_v2 import KillmailValidatorV2
+
+    rng = random.Random(attackers)
+    subscriptions = make_subscriptions(rng, 3000)
+    validator = KillmailValidatorV2(
+        _StaticSubscriptionManager(subscriptions),
+        conditions=CompiledConditionCache(),
+        matcher_cls=SyntheticMatcher,
+    )
+    baseline_conditions = CompiledConditionCache()
+
+    total = 0
+    for killmail_id in range(1, 201):
+        record = KillmailRecord(make_killmail(rng, killmail_id, attackers))
+        matched = await validator.validate_and_match(record) or {}
+
+        # 基线：不经索引，对每个启用的订阅做全局过滤 + 条件匹配
+        matcher = SyntheticMatcher(record, conditions=baseline_conditions)
+        await matcher.resolve({NEED_LOCATION, NEED_SHIP_CLASS})
+        expected = {
+            (sub["platform"], sub["bot_id"], sub["session_id"], sub["session_type"], record.total_value)
+            for sub in subscriptions
+            if sub["is_enabled"] and matcher.match_subscription(sub)[0]
+        }
+
+        assert set(matched) == expected, f"killmail {killmail_id}"
+        total += len(expected)
+
+    # 合成数据应当覆盖到匹配的情况
+    assert total > 0
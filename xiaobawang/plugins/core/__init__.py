@@ -3,10 +3,12 @@ import os
 
 from nonebot import get_driver, logger, require
 
+from .api.esi.names import name_store
 from .command import *  # noqa: F403
 from .command.subscription import start_km_listen_, stop_km_listen_
 from .config import plugin_config
 from .handler.group_event import *  # noqa: F403
+from .helper.subscription_cache import subscription_cache
 from .router import *  # noqa: F403
 from .utils.common.cache import cache as c
 from .utils.common.command_record import HelperExtension
@@ -34,7 +36,7 @@ async def _subscription_auth_handler(payload: dict, user_info: Uninfo) -> str:
     从 Uninfo 提取会话信息，生成访问 token，并将结果写入等待队列供前端轮询获取。
     """
     from .helper.token_manager import TokenManager
-    from .router.auth import AUTH_STATE_PREFIX, AUTH_CODE_EXPIRE
+    from .router.auth import AUTH_CODE_EXPIRE, AUTH_STATE_PREFIX
 
     code = payload.get("code")
 
@@ -94,6 +96,7 @@ async def init():
 
     add_global_extension(HelperExtension())
 
+    subscription_cache.start()
     await start_km_listen_()
 
     if not os.getenv("DOCKER", "").lower() == "true":
@@ -103,5 +106,7 @@ async def init():
 @driver.on_shutdown
 async def shutdown():
     await stop_km_listen_()
+    await subscription_cache.stop()
     await close_client()
     await c.close()
+    name_store.close()
@@ -0,0 +1,262 @@
+"""
+本地实体名称库
+
+角色、军团、联盟等 ID -> (分类, 名称) 持久化在 SQLite，热点条目保留在进程内 LRU。
+批量查询时只把本地没有的 ID 以每批 1000 个 POST 到 /universe/names/：
+- 某批含无效 ID 时 ESI 整批返回 404，此时二分拆批，最终定位到的无效 ID 记为否定条目，过期前不再查询；
+- 查询中的 ID 由并发请求共享，不重复发送；
+- 超过 NAME_STALE_AGE 的名称照常返回，由定时任务在后台刷新（角色、军团可能改名）。
+"""
+
+import asyncio
+from collections import OrderedDict
+import sqlite3
+import threading
+import time
+import traceback
+from typing import Any
+
+import httpx
+from nonebot import logger, require
+
+from ...config import DATA_PATH
+from .universe import esi_client
+
+require("nonebot_plugin_apscheduler")
+
+from nonebot_plugin_apscheduler import scheduler
+
+NAME_DB_PATH = DATA_PATH / "entity_names.sqlite3"  # 名称库文件
+NAME_BATCH_SIZE = 1000  # /universe/names/ 单次请求的最大 ID 数
+NAME_LRU_SIZE = 50_000  # 进程内保留的条目数
+NAME_STALE_AGE = 7 * 24 * 60 * 60  # 名称超过该时长（秒）视为过期，后台刷新
+NAME_NEGATIVE_TTL = 24 * 60 * 60  # 无效 ID 的否定缓存时长（秒）
+NAME_REFRESH_LIMIT = 5000  # 每次定时刷新的最多条目数
+_SQL_CHUNK = 900  # SQLite 单条语句的参数上限以内
+
+_Entry = tuple[str | None, str | None, int]  # (分类, 名称, 更新时间)，分类为 None 表示否定条目
+
+
+class NameStore:
+    """ID -> (分类, 名称) 的 SQLite + LRU 两级存储"""
+
+    def __init__(self):
+        self._conn: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()  # sqlite3 连接在线程池中使用，串行访问
+        self._lru: OrderedDict[int, _Entry] = OrderedDict()
+        self._in_flight: dict[int, asyncio.Future] = {}
+
+        self.lru_hits = 0
+        self.db_hits = 0
+        self.fetched = 0
+        self.invalid = 0
+
+    # ── SQLite ──────────────────────────────────────────
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            NAME_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(NAME_DB_PATH, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS names ("
+                "id INTEGER PRIMARY KEY, category TEXT, name TEXT, updated_at INTEGER NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_names_updated_at ON names (updated_at)")
+            self._conn = conn
+        return self._conn
+
+    def _select(self, ids: list[int]) -> dict[int, _Entry]:
+        result = {}
+        with self._db_lock:
+            conn = self._connect()
+            for i in range(0, len(ids), _SQL_CHUNK):
+                chunk = ids[i : i + _SQL_CHUNK]
+                rows = conn.execute(
+                    f"SELECT id, category, name, updated_at FROM names WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+                for entity_id, category, name, updated_at in rows:
+                    result[entity_id] = (category, name, updated_at)
+        return result
+
+    def _upsert(self, entries: dict[int, _Entry]):
+        with self._db_lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO names (id, category, name, updated_at) VALUES (?, ?, ?, ?)",
+                    [(entity_id, *entry) for entity_id, entry in entries.items()],
+                )
+
+    def _select_stale(self, before: int, limit: int) -> list[int]:
+        with self._db_lock:
+            rows = self._connect().execute(
+                "SELECT id FROM names WHERE updated_at < ? AND category IS NOT NULL ORDER BY updated_at LIMIT ?",
+                (before, limit),
+            )
+            return [entity_id for (entity_id,) in rows]
+
+    def close(self):
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # ── LRU ─────────────────────────────────────────────
+
+    def _remember(self, entries: dict[int, _Entry]):
+        lru = self._lru
+        for entity_id, entry in entries.items():
+            lru[entity_id] = entry
+            lru.move_to_end(entity_id)
+        while len(lru) > NAME_LRU_SIZE:
+            lru.popitem(last=False)
+
+    # ── 查询 ────────────────────────────────────────────
+
+    async def get_names(self, ids: list[int] | set[int]) -> dict[str, dict[int, str]]:
+        """
+        批量获取名称，结构与 esi_client.get_names 相同
+
+        Args:
+            ids: ID 列表
+
+        Returns:
+            {分类: {ID: 名称}}，无效或查询失败的 ID 不出现在结果中
+        """
+        entries = await self.lookup(ids)
+        result: dict[str, dict[int, str]] = {}
+        for entity_id, (category, name, _) in entries.items():
+            if category is not None:
+                result.setdefault(category, {})[entity_id] = name
+        return result
+
+    async def lookup(self, ids: list[int] | set[int]) -> dict[int, _Entry]:
+        """依次查 LRU、SQLite，仍未知（或否定条目已过期）的 ID 请求 ESI"""
+        now = int(time.time())
+        wanted = {int(entity_id) for entity_id in ids if entity_id}
+        found: dict[int, _Entry] = {}
+
+        lru = self._lru
+        for entity_id in wanted:
+            entry = lru.get(entity_id)
+            if entry is not None and self._usable(entry, now):
+                lru.move_to_end(entity_id)
+                found[entity_id] = entry
+        self.lru_hits += len(found)
+
+        missing = [entity_id for entity_id in wanted if entity_id not in found]
+        if missing:
+            try:
+                stored = await asyncio.to_thread(self._select, missing)
+            except Exception as e:
+                logger.warning(f"读取本地名称库失败: {e}")
+                stored = {}
+            stored = {entity_id: entry for entity_id, entry in stored.items() if self._usable(entry, now)}
+            self._remember(stored)
+            self.db_hits += len(stored)
+            found.update(stored)
+            missing = [entity_id for entity_id in missing if entity_id not in stored]
+
+        if missing:
+            found.update(await self._fetch_shared(missing))
+        return found
+
+    @staticmethod
+    def _usable(entry: _Entry, now: int) -> bool:
+        """名称条目总是可用（过期的由后台刷新）；否定条目在 TTL 内可用"""
+        category, _, updated_at = entry
+        return category is not None or now - updated_at < NAME_NEGATIVE_TTL
+
+    async def _fetch_shared(self, ids: list[int]) -> dict[int, _Entry]:
+        """请求 ESI，已在其他请求中查询的 ID 等待其结果"""
+        loop = asyncio.get_running_loop()
+        waiting = {entity_id: self._in_flight[entity_id] for entity_id in ids if entity_id in self._in_flight}
+        own = [entity_id for entity_id in ids if entity_id not in waiting]
+        futures = {entity_id: loop.create_future() for entity_id in own}
+        self._in_flight.update(futures)
+
+        found: dict[int, _Entry] = {}
+        try:
+            if own:
+                found = await self._fetch(own)
+        finally:
+            for entity_id, future in futures.items():
+                self._in_flight.pop(entity_id, None)
+                future.set_result(found.get(entity_id))
+
+        for entity_id, future in waiting.items():
+            entry = await future
+            if entry is not None:
+                found[entity_id] = entry
+        return found
+
+    async def _fetch(self, ids: list[int]) -> dict[int, _Entry]:
+        """按批请求 ESI 并写入本地库，返回查到的条目（含否定条目）"""
+        now = int(time.time())
+        found: dict[int, _Entry] = {}
+        for i in range(0, len(ids), NAME_BATCH_SIZE):
+            await self._fetch_batch(ids[i : i + NAME_BATCH_SIZE], now, found)
+
+        if found:
+            self._remember(found)
+            try:
+                await asyncio.to_thread(self._upsert, found)
+            except Exception as e:
+                logger.warning(f"写入本地名称库失败: {e}")
+        return found
+
+    async def _fetch_batch(self, ids: list[int], now: int, found: dict[int, _Entry]):
+        """请求一批 ID；ESI 因无效 ID 整批返回 404 时二分定位"""
+        try:
+            items = await esi_client.post_names(ids)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 404:
+                logger.error(f"获取名称失败 ({len(ids)} 个 ID): {e}")
+                return
+            if len(ids) == 1:
+                found[ids[0]] = (None, None, now)
+                self.invalid += 1
+                return
+            middle = len(ids) // 2
+            await self._fetch_batch(ids[:middle], now, found)
+            await self._fetch_batch(ids[middle:], now, found)
+            return
+        except Exception as e:
+            logger.error(f"获取名称失败 ({len(ids)} 个 ID): {e}\n{traceback.format_exc()}")
+            return
+
+        for item in items:
+            found[int(item["id"])] = (item["category"], item["name"], now)
+        self.fetched += len(items)
+
+    # ── 定时刷新 ────────────────────────────────────────
+
+    async def refresh_stale(self, limit: int = NAME_REFRESH_LIMIT):
+        """重新查询最久未更新的过期名称"""
+        try:
+            stale = await asyncio.to_thread(self._select_stale, int(time.time()) - NAME_STALE_AGE, limit)
+        except Exception as e:
+            logger.warning(f"读取过期名称失败: {e}")
+            return
+        if not stale:
+            return
+        refreshed = await self._fetch(stale)
+        logger.info(f"已刷新 {len(refreshed)}/{len(stale)} 个过期名称")
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "lru_size": len(self._lru),
+            "in_flight": len(self._in_flight),
+            "lru_hits": self.lru_hits,
+            "db_hits": self.db_hits,
+            "fetched": self.fetched,
+            "invalid": self.invalid,
+        }
+
+
+name_store = NameStore()
+
+scheduler.add_job(name_store.refresh_stale, "cron", minute=17, id="entity_name_refresh")
@@ -15,7 +15,6 @@ class ESIClient(BaseClient):
     def __init__(self):
         super().__init__()
         self._base_url = "https://esi.evetech.net"
-        self.batch_size = 500
         self.headers["X-Compatibility-Date"] = "2025-12-16"
 
     @cache_result(expire_time=cache.TIME_DAY, prefix="esi:get_universe_id", exclude_args=[0])
@@ -43,47 +42,39 @@ class ESIClient(BaseClient):
         else:
             return r
 
-    @cache_result(expire_time=cache.TIME_DAY, prefix="esi:get_names", exclude_args=[0])
     async def get_names(
         self,
         ids: list[int],
     ) -> dict[str, dict[str, str] | int] | None:
         """
-        获取名称
+        获取名称，经本地名称库查询，只有未知的 ID 才请求 ESI
         Res:
             ids: ID列表
         Return:
             分类的名称列表
         """
-        result = {}
-        endpoint = "/universe/names/?datasource=tranquility"
+        from .names import name_store
 
         if isinstance(ids, int):
             ids = [ids]
 
-        for i in range(0, len(ids), self.batch_size):
-            batch_ids = ids[i : i + self.batch_size]
-            data = batch_ids
-            try:
-                r = await self._post(endpoint, data)
-
-                for item in r:
-                    category = item["category"]
-                    item_id = item["id"]
-                    name = item["name"]
-
-                    if category not in result:
-                        result[category] = {}
-
-                    result[category][item_id] = name
-
-            except Exception as e:
-                logger.error(f"获取名称失败 (批次 {i // self.batch_size + 1}): {e}\n{traceback.format_exc()}")
+        result = await name_store.get_names(ids)
         if result != {}:
             return result
         else:
             return None
 
+    async def post_names(self, ids: list[int]) -> list[dict[str, Any]]:
+        """
+        直接请求 /universe/names/，不经缓存
+        Res:
+            ids: ID列表，最多 1000 个；含无效 ID 时 ESI 整批返回 404
+        Return:
+            [{"id", "category", "name"}]
+        """
+        endpoint = "/universe/names/?datasource=tranquility"
+        return await self._post(endpoint, ids)
+
     @cache_result(expire_time=7 * cache.TIME_DAY, prefix="esi_system_", exclude_args=[0])  # 缓存1天
     async def get_system_info(self, system_id: int) -> dict[str, Any]:
         """
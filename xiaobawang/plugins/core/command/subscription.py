@@ -1,4 +1,5 @@
 import asyncio
+from pathlib import Path
 
 from arclet.alconna import Alconna, Args, Arparma, CommandMeta, MultiVar, Option, Subcommand
 from nonebot import logger
@@ -12,12 +13,21 @@ from ..api.esi.universe import esi_client
 from ..helper.rule import is_admin, super_admin
 from ..helper.subscription import KillmailSubscriptionManager
 from ..helper.token_manager import TokenManager
+from ..helper.zkb import benchmark
 from ..helper.zkb.listener import zkb_listener
 
 __all__ = ["get_sub_token", "start_km_listen", "start_km_listen_", "stop_km_listen_", "sub", "sub_high"]
 
 
-start_km_alc = Alconna("wss", Subcommand("start"), Subcommand("stop"), CommandMeta(hide=True))
+start_km_alc = Alconna(
+    "wss",
+    Subcommand("start"),
+    Subcommand("stop"),
+    Subcommand("status"),
+    Subcommand("replay", Args["path", str]["speed", float, 0.0], Option("--send")),
+    Subcommand("bench", Args["subs", int, 0]["attackers", int, 0], Option("--save")),
+    CommandMeta(hide=True),
+)
 
 
 start_km_listen = on_alconna(start_km_alc, use_cmd_start=True, permission=SUPERUSER)
@@ -58,6 +68,85 @@ async def stop_km_listen_():
     logger.info("停止监听zkb")
 
 
+@start_km_listen.assign("status")
+async def status_km_listen_():
+    stats = zkb_listener.get_stats()
+    controller = stats["controller"]
+    decision = controller["last_decision"]
+    msg = (
+        f"监听状态: {'运行中' if stats['active'] else '已停止'} ({stats['method']})\n"
+        f"已入队: {stats['enqueued']} 已处理: {stats['processed']} 去重: {stats['deduped']} "
+        f"预过滤: {stats['filtered']}\n"
+        f"队列: {stats['queue_depth']} (高优先级 {stats['queue_high']}, 内存 {stats['queue_in_memory']}) "
+        f"渲染积压: {stats['render_backlog']} 发送积压: {stats['send_backlog']}\n"
+        f"workers: {controller['workers']} {controller['bounds']['workers']} "
+        f"速率: {controller['rate']}/s {controller['bounds']['rate']}"
+    )
+    if decision:
+        msg += f"\n上次调整: {decision['action']} p90={decision['p90_latency']}s 样本={decision['samples']}"
+    for name, source in stats["sources"].items():
+        if not source["received"] and not source["errors"]:
+            continue
+        msg += (
+            f"\n[{name}] {'正常' if source['healthy'] else '停滞'} 收到: {source['received']} "
+            f"首达: {source['first']} 重复: {source['duplicate']} 错误: {source['errors']} 重启: {source['restarts']} "
+            f"延迟: {source['lag']}s 落后: {source['behind']}s"
+        )
+    if cluster := stats["cluster"]:
+        msg += (
+            f"\n集群节点: {cluster['node_id']} ({'leader' if cluster['is_leader'] else 'follower'}) "
+            f"发布: {cluster['published']} 领取: {cluster['consumed']} 接手: {cluster['claimed']} "
+            f"确认: {cluster['acked']}"
+        )
+    await start_km_listen.finish(msg)
+
+
+@start_km_listen.assign("replay")
+async def replay_km_listen_(result: Arparma):
+    report = await zkb_listener.replay(
+        Path(result.path),
+        speed=result.speed,
+        dry_send=not result.replay.options.get("send"),
+    )
+    if report is None:
+        await start_km_listen.finish("无法开始回放：监听器运行中或文件不存在")
+
+    msg = (
+        f"回放完成: {report['file']} (倍速: {report['speed'] or '不限'}, 跳过投递: {report['dry_send']})\n"
+        f"读取: {report['read']} 入队: {report['enqueued']} 已处理: {report['processed']} "
+        f"去重: {report['deduped']} 预过滤: {report['filtered']}\n"
+        f"耗时: {report['elapsed']}s 吞吐: {report['throughput']}/s"
+    )
+    for stage, timing in report["stages"].items():
+        msg += (
+            f"\n[{stage}] n={timing['count']} avg={timing['avg']}ms p50={timing['p50']}ms "
+            f"p95={timing['p95']}ms max={timing['max']}ms"
+        )
+    await start_km_listen.finish(msg)
+
+
+@start_km_listen.assign("bench")
+async def bench_km_listen_(result: Arparma):
+    if zkb_listener.active:
+        await start_km_listen.finish("监听器运行中（含回放），请先停止后再运行基准测试")
+
+    report = await benchmark.run_benchmark_isolated(
+        subscription_sizes=(result.subs,) if result.subs else benchmark.BENCH_SUBSCRIPTION_SIZES,
+        attacker_sizes=(result.attackers,) if result.attackers else benchmark.BENCH_ATTACKER_SIZES,
+        save=bool(result.bench.options.get("save")),
+    )
+    msg = "订阅匹配基准测试完成"
+    for name, scenario in report["scenarios"].items():
+        msg += (
+            f"\n[{name}] 吞吐: {scenario['kps']}/s p50={scenario['p50']}ms p99={scenario['p99']}ms "
+            f"分配: {scenario['alloc_kb']}KB 建索引: {scenario['build_ms']}ms "
+            f"命中: {scenario['matched']}/{scenario['kills']}"
+        )
+    if report["regressions"]:
+        msg += "\n相比基线退化:\n" + "\n".join(report["regressions"])
+    await start_km_listen.finish(msg)
+
+
 category_type_list = {
     "char": "character",
     "corp": "corporation",
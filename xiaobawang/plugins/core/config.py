@@ -19,6 +19,22 @@ class Config(BaseModel):
 
     zkb_listener_method: str = "r2z2"
     zkb_listener_url: str = "https://zkillredisq.stream/listen.php"
+    zkb_queue_memory_size: int = 500  # KM 队列每条优先级通道驻留内存的最大条数，其余分页到磁盘日志
+    # KM 队列日志每批写入后 fsync，已写入的条目掉电也不丢；默认只写入系统缓存，进程崩溃不丢已写入的条目。
+    # 两种模式下，入队后尚未批量写入的尾部（通常不足一个事件循环周期）在崩溃时都会丢失
+    zkb_journal_fsync: bool = False
+
+    # KM 处理自适应并发控制上下限
+    zkb_workers_min: int = 2
+    zkb_workers_max: int = 20
+    zkb_rate_min: float = 1.0
+    zkb_rate_max: float = 20.0
+    zkb_check_latency_target: float = 10.0  # km.check p90 耗时目标（秒）
+    zkb_downstream_backlog_limit: int = 30  # 渲染/发送积压上限
+
+    # 集群模式：多个实例共用 Redis，选举一个 leader 拉取数据，经 Redis Stream 消费组分摊处理
+    zkb_cluster: bool = False
+    zkb_cluster_node_id: str = ""  # 节点 ID，留空为 主机名-进程号；固定后重启可接回本节点未确认的条目
 
     tq_status_url: str = None
 
@@ -9,6 +9,7 @@ from ..db.models.killmail import (
     KillmailHighValueSubscription,
     KillmailSubscription,
 )
+from ..helper.subscription_cache import subscription_cache
 
 try:
     from ...structure_notifications.models import StructureNotificationSub
@@ -75,6 +76,7 @@ async def _(event: GroupDecreaseNoticeEvent):
         await session.commit()
 
     if total_disabled:
+        await subscription_cache.bump()
         logger.info(f"群 {group_id} 退群处理完成，共停用 {total_disabled} 条订阅")
     else:
         logger.debug(f"群 {group_id} 无活跃订阅，无需处理")
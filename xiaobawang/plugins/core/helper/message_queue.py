@@ -82,6 +82,10 @@ class MessageQueueSender:
                 pass
         logger.info("消息队列发送器已停止")
 
+    def pending_count(self) -> int:
+        """所有会话队列中等待发送的消息总数"""
+        return sum(len(dq) for dq in self.message_queue.values())
+
     async def add_message(
         self,
         platform: str,
@@ -0,0 +1,161 @@
+"""
+进程内订阅快照
+
+启用订阅解析后的列表常驻进程内存，每个 killmail 读取时不产生任何 Redis/数据库 I/O。
+订阅被创建、修改、删除或批量停用后，修改方调用 bump()：
+- 本进程立即标记快照过期；
+- Redis 全局版本号自增，并通过 pub/sub 通知其他实例标记过期。
+过期后下一次读取从数据库重新加载。监听断开期间的通知可能丢失，因此还会定期比对全局版本号兜底。
+"""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from nonebot import logger
+
+from ..utils.common.cache import cache as redis_cache
+
+SUB_INVALIDATE_CHANNEL = "sub:invalidate"  # 订阅变更通知频道
+SUB_VERSION_KEY = "sub:version"  # 订阅全局版本号
+SUB_VERSION_CHECK_INTERVAL = 60  # 比对全局版本号的间隔（秒）
+
+Loader = Callable[[], Awaitable[list[dict[str, Any]]]]
+
+
+class SubscriptionCache:
+    """启用订阅的进程内快照，version 在每次重新加载后递增"""
+
+    def __init__(self):
+        self.version = 0  # 本地快照版本，供下游（订阅索引等）判断是否需要重建
+        self._subscriptions: list[dict[str, Any]] | None = None
+        self._stale = True
+        self._global_version: int | None = None  # 最近一次得知的 Redis 全局版本号
+        self._lock = asyncio.Lock()
+        self._listen_task: asyncio.Task | None = None
+
+        self.loads = 0
+        self.invalidations = 0
+
+    async def get(self, loader: Loader) -> list[dict[str, Any]]:
+        """
+        返回订阅快照，过期时调用 loader 重新加载（并发调用只加载一次）
+
+        Args:
+            loader: 从数据库读取启用订阅的协程函数
+
+        Returns:
+            订阅列表，调用方不得修改；重新加载失败时沿用旧快照，从未加载成功时抛出异常
+        """
+        if not self._stale and self._subscriptions is not None:
+            return self._subscriptions
+
+        async with self._lock:
+            if self._stale or self._subscriptions is None:
+                # 先清除过期标记，加载期间到达的新通知会再次置位
+                self._stale = False
+                try:
+                    self._subscriptions = await loader()
+                except Exception:
+                    self._stale = True
+                    if self._subscriptions is None:
+                        raise
+                    # 加载失败时沿用旧快照，下次读取再重试
+                    logger.warning("重新加载订阅失败，继续使用旧快照")
+                    return self._subscriptions
+                self.version += 1
+                self.loads += 1
+                logger.debug(f"订阅快照已加载: {len(self._subscriptions)} 个订阅 (v{self.version})")
+            return self._subscriptions
+
+    def invalidate(self):
+        """标记本进程快照过期"""
+        self._stale = True
+        self.invalidations += 1
+
+    async def bump(self):
+        """订阅变更后调用：本进程立即失效，并通知其他实例"""
+        self.invalidate()
+        if not redis_cache._initialized:
+            return
+        try:
+            redis = redis_cache.redis
+            version = await redis.incr(redis_cache._get_key(SUB_VERSION_KEY))
+            self._global_version = version
+            await redis.publish(redis_cache._get_key(SUB_INVALIDATE_CHANNEL), version)
+        except Exception as e:
+            logger.warning(f"发布订阅变更通知失败，其他实例将在版本比对时更新: {e}")
+
+    # ── 跨实例失效通知 ──────────────────────────────────
+
+    def start(self):
+        """启动 pub/sub 监听"""
+        if self._listen_task is None or self._listen_task.done():
+            self._listen_task = asyncio.create_task(self._listen_loop())
+
+    async def stop(self):
+        if self._listen_task is not None:
+            self._listen_task.cancel()
+            try:
+                await self._listen_task
+            except asyncio.CancelledError:
+                pass
+            self._listen_task = None
+
+    def _on_version(self, version: int | None):
+        """收到或查询到全局版本号，与已知版本不同则失效"""
+        if version is None or version == self._global_version:
+            return
+        if self._global_version is not None:
+            logger.debug(f"订阅全局版本变化: {self._global_version} -> {version}")
+            self.invalidate()
+        self._global_version = version
+
+    async def _check_version(self):
+        raw = await redis_cache.redis.get(redis_cache._get_key(SUB_VERSION_KEY))
+        self._on_version(int(raw) if raw is not None else 0)
+
+    async def _listen_loop(self):
+        channel = redis_cache._get_key(SUB_INVALIDATE_CHANNEL)
+        while True:
+            pubsub = None
+            try:
+                pubsub = redis_cache.redis.pubsub(ignore_subscribe_messages=True)
+                await pubsub.subscribe(channel)
+                # 订阅成功后比对一次，覆盖断开期间错过的通知
+                await self._check_version()
+                loop = asyncio.get_running_loop()
+                next_check = loop.time() + SUB_VERSION_CHECK_INTERVAL
+                while True:
+                    message = await pubsub.get_message(timeout=SUB_VERSION_CHECK_INTERVAL)
+                    if message and message.get("type") == "message":
+                        self._on_version(int(message["data"]))
+                    if loop.time() >= next_check:
+                        await self._check_version()
+                        next_check = loop.time() + SUB_VERSION_CHECK_INTERVAL
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"订阅变更监听异常，5 秒后重连: {e}")
+                # 断开期间无法得知变更，保守地让快照过期
+                self.invalidate()
+                await asyncio.sleep(5)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "version": self.version,
+            "global_version": self._global_version,
+            "size": len(self._subscriptions) if self._subscriptions is not None else None,
+            "stale": self._stale,
+            "loads": self.loads,
+            "invalidations": self.invalidations,
+        }
+
+
+subscription_cache = SubscriptionCache()
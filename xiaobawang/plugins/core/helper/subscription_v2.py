@@ -5,19 +5,26 @@
 """
 
 import json
-from typing import Any
+from typing import Any, ClassVar
 
 from loguru import logger
-from sqlalchemy import select
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..db.models.killmail import KillmailSubscription
 from ..utils.common.cache import cache, cache_result
+from .subscription_cache import subscription_cache
+
+DEFAULT_MAX_AGE_DAYS = 10  # 未设置 max_age_days 时匹配器使用的默认值，也是验证器的全局上限
 
 
 class KillmailSubscriptionManagerV2:
     """新版击毁邮件订阅管理器 - 支持灵活的条件组合"""
 
+    # 所有启用订阅的全局下界 {"count", "min_value", "max_age_days"}，None 表示尚未加载
+    # 监听器在入队前据此丢弃任何订阅都不可能匹配的 killmail
+    ingress_bounds: ClassVar[dict[str, Any] | None] = None
+
     def __init__(self, session: AsyncSession | None):
         """
         初始化订阅管理器
@@ -27,15 +34,34 @@ class KillmailSubscriptionManagerV2:
         """
         self.session = session
 
-    @cache_result(expire_time=30 * cache.TIME_SECOND, prefix="sub_get_all_subscriptions")
+    @property
+    def subscriptions_version(self) -> int:
+        """get_all_subscriptions 快照的版本号，重新加载后递增"""
+        return subscription_cache.version
+
     async def get_all_subscriptions(self) -> list[dict[str, Any]]:
-        """获取所有启用的订阅"""
+        """获取所有启用的订阅（进程内快照，订阅变更时失效），返回的列表不得修改"""
         if not self.session:
             return []
+        try:
+            return await subscription_cache.get(self._load_all_subscriptions)
+        except Exception:
+            return []
+
+    async def _notify_changed(self):
+        """订阅变更后刷新全局下界，并使各实例的订阅快照失效"""
+        await subscription_cache.bump()
+        await self.refresh_ingress_bounds()
+
+    async def _load_all_subscriptions(self) -> list[dict[str, Any]]:
+        """从数据库读取所有启用的订阅"""
 
         try:
-            query = select(KillmailSubscription).where(
-                KillmailSubscription.is_enabled.is_(True)
+            # 长期持有的会话中已加载的对象不会自动过期，强制用查询结果覆盖，确保读到其他会话的修改
+            query = (
+                select(KillmailSubscription)
+                .where(KillmailSubscription.is_enabled.is_(True))
+                .execution_options(populate_existing=True)
             )
             result = await self.session.execute(query)
             subscriptions = result.scalars().all()
@@ -69,7 +95,33 @@ class KillmailSubscriptionManagerV2:
             return subscription_data
         except Exception as e:
             logger.error(f"获取订阅列表失败: {e}")
-            return []
+            raise
+
+    async def refresh_ingress_bounds(self) -> dict[str, Any] | None:
+        """重新计算启用订阅的最低 min_value 与最大 max_age_days"""
+        if not self.session:
+            return None
+
+        try:
+            query = select(
+                func.count(KillmailSubscription.id),
+                func.min(KillmailSubscription.min_value),
+                func.max(func.coalesce(KillmailSubscription.max_age_days, DEFAULT_MAX_AGE_DAYS)),
+            ).where(KillmailSubscription.is_enabled.is_(True))
+            count, min_value, max_age_days = (await self.session.execute(query)).one()
+
+            bounds = {
+                "count": count or 0,
+                "min_value": float(min_value) if min_value is not None else 0.0,
+                "max_age_days": min(int(max_age_days), DEFAULT_MAX_AGE_DAYS)
+                if max_age_days is not None
+                else DEFAULT_MAX_AGE_DAYS,
+            }
+            KillmailSubscriptionManagerV2.ingress_bounds = bounds
+            return bounds
+        except Exception as e:
+            logger.error(f"计算订阅全局下界失败: {e}")
+            return None
 
     @cache_result(expire_time=30 * cache.TIME_SECOND, prefix="sub_get_subscription_by_id")
     async def get_subscription_by_id(self, subscription_id: int) -> dict[str, Any] | None:
@@ -186,6 +238,7 @@ class KillmailSubscriptionManagerV2:
             await self.session.refresh(new_sub)
 
             logger.info(f"创建订阅成功: {new_sub.id} - {name}")
+            await self._notify_changed()
             return new_sub.id
 
         except json.JSONDecodeError as e:
@@ -267,6 +320,7 @@ class KillmailSubscriptionManagerV2:
 
             await self.session.commit()
             logger.info(f"更新订阅成功: {subscription_id}")
+            await self._notify_changed()
             return True
 
         except Exception as e:
@@ -301,6 +355,7 @@ class KillmailSubscriptionManagerV2:
             await self.session.delete(sub)
             await self.session.commit()
             logger.info(f"删除订阅成功: {subscription_id}")
+            await self._notify_changed()
             return True
 
         except Exception as e:
@@ -338,7 +393,7 @@ class KillmailSubscriptionManagerV2:
                 continue
 
             # 其他非标签条件
-            if condition_type in ["value", "entity", "region", "ship"]:
+            if condition_type in ["value", "entity", "region", "ship", "proximity"]:
                 has_non_tag_condition = True
                 break
 
@@ -0,0 +1,25 @@
+from typing import Any
+
+from nonebot import require
+
+from ..api.esi.universe import esi_client
+
+require("xiaobawang.plugins.sde")
+
+from xiaobawang.plugins.sde.universe import universe
+
+
+async def get_system_info(system_id: int) -> dict[str, Any]:
+    """
+    获取星系信息，优先查 SDE 内存表，SDE 中没有的星系（如新增星系）回退到 ESI
+
+    Args:
+        system_id: 星系ID
+
+    Returns:
+        包含星系信息的字典，查询失败时为空字典
+    """
+    system_info = universe.get_system(system_id)
+    if system_info is not None:
+        return system_info
+    return await esi_client.get_system_info(system_id)
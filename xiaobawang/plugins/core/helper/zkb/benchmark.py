@@ -0,0 +1,394 @@
+"""
+订阅匹配规模基准测试
+
+生成合成 killmail（单人到 2000 名攻击者）与合成订阅集（100 到 100,000 个，条件组按真实比例混合），
+端到端运行 KillmailValidatorV2.validate_and_match，统计吞吐、延迟分位数与单次匹配的内存分配。
+星系归属与舰船群组由内存中的合成表提供，不访问 SDE、ESI 或 Redis；
+每个场景使用独立的编译缓存、叶子表与选择性统计，不触碰线上匹配状态，
+run_benchmark_isolated() 在单独线程的事件循环中运行，但匹配仍与机器人争用 GIL，
+因此命令只在监听器停止时运行，默认规模也只取几秒内能跑完的场景。
+结果可保存为基线，之后的运行与基线对比，超过阈值的退化会列出。
+"""
+
+import asyncio
+from datetime import datetime, timezone
+import json
+from pathlib import Path
+import random
+import time
+import tracemalloc
+from typing import Any
+
+from nonebot import logger
+
+from ...config import DATA_PATH
+from .condition_compiler import CompiledConditionCache
+from .condition_matcher import ConditionMatcher
+from .record import KillmailRecord
+from .timing import StageTimings
+from .validator_v2 import KillmailValidatorV2
+
+BENCH_BASELINE_PATH = DATA_PATH / "zkb_benchmark_baseline.json"  # 基线文件
+# 默认规模在机器人进程内几秒即可跑完；10 万订阅、2000 攻击者等大规模场景需显式指定，且会长时间占用 GIL
+BENCH_SUBSCRIPTION_SIZES = (100, 1_000, 10_000)  # 默认订阅规模
+BENCH_ATTACKER_SIZES = (1, 10, 100)  # 默认攻击者规模
+BENCH_KILLS = 200  # 每个场景计时的 killmail 数
+BENCH_ALLOC_KILLS = 20  # 每个场景统计内存分配的 killmail 数（tracemalloc 开销大，单独少量运行）
+BENCH_REGRESSION_RATIO = 1.2  # 与基线相比变差超过该倍数视为退化
+BENCH_SEED = 20240501
+
+# 合成实体 ID 池，订阅与 killmail 从同一批 ID 中抽取，保证有一定命中率
+_CHARACTERS = (2_100_000_000, 50_000)
+_CORPORATIONS = (98_000_000, 5_000)
+_ALLIANCES = (99_000_000, 1_000)
+_SYSTEMS = (30_000_001, 8_000)
+_SHIP_TYPES = (1_000, 400)
+_LABELS = ("pvp", "solo", "npc", "awox", "ganked", "padding", "cat:6", "loc:nullsec", "loc:lowsec", "loc:highsec")
+
+
+def _pick(rng: random.Random, pool: tuple[int, int]) -> int:
+    start, size = pool
+    return start + rng.randrange(size)
+
+
+def _constellation_of(system_id: int) -> int:
+    return 20_000_000 + (system_id - _SYSTEMS[0]) // 8
+
+
+def _region_of(system_id: int) -> int:
+    return 10_000_000 + (system_id - _SYSTEMS[0]) // 80
+
+
+def _group_of(ship_type_id: int) -> int:
+    return 25 + ship_type_id % 40
+
+
+def make_killmail(rng: random.Random, killmail_id: int, attackers: int) -> dict[str, Any]:
+    """
+    生成一个合成 killmail
+
+    Args:
+        rng: 随机数生成器
+        killmail_id: killmail ID
+        attackers: 攻击者数量
+    """
+    final_blow = rng.randrange(attackers)
+    attacker_list = []
+    # 大规模舰队战中攻击者集中在少数联盟/军团
+    fleet_alliances = [_pick(rng, _ALLIANCES) for _ in range(max(1, attackers // 200))]
+    fleet_corporations = [_pick(rng, _CORPORATIONS) for _ in range(max(1, attackers // 20))]
+    for i in range(attackers):
+        attacker_list.append(
+            {
+                "character_id": _pick(rng, _CHARACTERS),
+                "corporation_id": rng.choice(fleet_corporations),
+                "alliance_id": rng.choice(fleet_alliances),
+                "ship_type_id": _pick(rng, _SHIP_TYPES),
+                "weapon_type_id": _pick(rng, _SHIP_TYPES),
+                "damage_done": rng.randrange(1, 50_000),
+                "final_blow": i == final_blow,
+                "security_status": round(rng.uniform(-10, 5), 1),
+            }
+        )
+
+    return {
+        "killmail_id": killmail_id,
+        "killmail_time": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "solar_system_id": _pick(rng, _SYSTEMS),
+        "victim": {
+            "character_id": _pick(rng, _CHARACTERS),
+            "corporation_id": _pick(rng, _CORPORATIONS),
+            "alliance_id": _pick(rng, _ALLIANCES),
+            "ship_type_id": _pick(rng, _SHIP_TYPES),
+            "damage_taken": rng.randrange(1_000, 10_000_000),
+            "items": [],
+        },
+        "attackers": attacker_list,
+        "zkb": {
+            "totalValue": round(10 ** rng.uniform(6, 11), 2),
+            "labels": rng.sample(_LABELS, rng.randrange(1, 4)),
+        },
+    }
+
+
+def _entity_condition(rng: random.Random) -> dict[str, Any]:
+    entity_type, pool = rng.choice(
+        (("character", _CHARACTERS), ("corporation", _CORPORATIONS), ("alliance", _ALLIANCES))
+    )
+    entity_id = _pick(rng, pool)
+    return {
+        "type": "entity",
+        "entity_type": entity_type,
+        "entity_id": entity_id,
+        "entity_name": str(entity_id),
+        "role": rng.choice(("victim", "final_blow", "any_attacker", "any_attacker")),
+    }
+
+
+def _location_condition(rng: random.Random) -> dict[str, Any]:
+    system_id = _pick(rng, _SYSTEMS)
+    entity_type, entity_id = rng.choice(
+        (("system", system_id), ("constellation", _constellation_of(system_id)), ("region", _region_of(system_id)))
+    )
+    return {"type": "entity", "entity_type": entity_type, "entity_id": entity_id, "entity_name": str(entity_id)}
+
+
+def _ship_condition(rng: random.Random) -> dict[str, Any]:
+    ship_type_id = _pick(rng, _SHIP_TYPES)
+    if rng.random() < 0.5:
+        return {"type": "entity", "entity_type": "group", "entity_id": _group_of(ship_type_id), "entity_name": "G"}
+    return {
+        "type": "entity",
+        "entity_type": "ship",
+        "entity_id": ship_type_id,
+        "entity_name": str(ship_type_id),
+        "ship_role": rng.choice(("victim_ship", "final_blow_ship")),
+    }
+
+
+def _value_condition(rng: random.Random) -> dict[str, Any]:
+    return {"type": "value", "min": rng.choice((1e8, 1e9, 1e10)), "max": None}
+
+
+def _label_condition(rng: random.Random) -> dict[str, Any]:
+    if rng.random() < 0.5:
+        return {"type": "label", "required_labels": rng.sample(_LABELS, 2), "excluded_labels": []}
+    return {"type": "label", "required_labels": [], "excluded_labels": ["npc"]}
+
+
+def make_condition_groups(rng: random.Random) -> dict[str, Any]:
+    """
+    生成一个合成条件组，比例参考线上订阅：
+    大部分是单个实体，其次是位置、舰船、多实体 OR、实体+价值/标签 AND，少量仅价值/标签的不可索引订阅
+    """
+    roll = rng.random()
+    if roll < 0.40:
+        return {"logic": "AND", "conditions": [_entity_condition(rng)], "groups": []}
+    if roll < 0.55:
+        return {"logic": "AND", "conditions": [_location_condition(rng)], "groups": []}
+    if roll < 0.65:
+        return {"logic": "AND", "conditions": [_ship_condition(rng)], "groups": []}
+    if roll < 0.80:
+        return {
+            "logic": "OR",
+            "conditions": [_entity_condition(rng) for _ in range(rng.randrange(2, 6))],
+            "groups": [],
+        }
+    if roll < 0.95:
+        extra = _value_condition(rng) if rng.random() < 0.5 else _label_condition(rng)
+        return {
+            "logic": "AND",
+            "conditions": [extra],
+            "groups": [{"logic": "OR", "conditions": [_entity_condition(rng), _location_condition(rng)], "groups": []}],
+        }
+    return {"logic": "AND", "conditions": [_value_condition(rng), _label_condition(rng)], "groups": []}
+
+
+def make_subscriptions(rng: random.Random, count: int) -> list[dict[str, Any]]:
+    """
+    生成合成订阅，字段与 KillmailSubscriptionManagerV2.get_all_subscriptions 的返回一致
+
+    Args:
+        rng: 随机数生成器
+        count: 订阅数量
+    """
+    now = datetime.now()
+    sessions = max(1, count // 3)
+    subscriptions = []
+    for sub_id in range(1, count + 1):
+        subscriptions.append(
+            {
+                "id": sub_id,
+                "platform": "qq",
+                "bot_id": "10000",
+                "session_id": str(100_000 + rng.randrange(sessions)),
+                "session_type": "group",
+                "name": f"bench-{sub_id}",
+                "description": "",
+                "is_enabled": rng.random() < 0.95,
+                "min_value": rng.choice((1_000_000, 10_000_000, 100_000_000, 1_000_000_000)),
+                "max_age_days": rng.choice((None, 1, 10)),
+                "condition_groups": make_condition_groups(rng),
+                "created_at": now,
+                "updated_at": now,
+            }
+        )
+    return subscriptions
+
+
+class _StaticSubscriptionManager:
+    """返回固定订阅列表的订阅管理器替身"""
+
+    subscriptions_version = 1
+
+    def __init__(self, subscriptions: list[dict[str, Any]]):
+        self.subscriptions = subscriptions
+
+    async def get_all_subscriptions(self) -> list[dict[str, Any]]:
+        return self.subscriptions
+
+
+class SyntheticMatcher(ConditionMatcher):
+    """星系归属与舰船群组由合成的内存表提供的匹配上下文"""
+
+    async def _resolve_location(self):
+        self.constellation_id = _constellation_of(self.solar_system_id)
+        self.region_id = _region_of(self.solar_system_id)
+
+    async def _resolve_ship_class(self):
+        self.group_id = _group_of(self.victim_ids["ship"])
+        self.category_id = 6
+
+
+async def run_scenario(
+    subscriptions: list[dict[str, Any]],
+    records: list[KillmailRecord],
+    alloc_kills: int = BENCH_ALLOC_KILLS,
+) -> dict[str, Any]:
+    """
+    对一组订阅和 killmail 运行端到端匹配
+
+    Args:
+        subscriptions: 订阅列表
+        records: 计时用的 killmail 记录
+        alloc_kills: 额外统计内存分配的 killmail 数
+
+    Returns:
+        {kills, matched, build_ms, kps, avg, p50, p99, max, alloc_kb}，延迟单位为毫秒
+    """
+    # 独立的编译缓存与选择性统计，合成订阅不进入线上状态
+    validator = KillmailValidatorV2(
+        _StaticSubscriptionManager(subscriptions),
+        conditions=CompiledConditionCache(),
+        matcher_cls=SyntheticMatcher,
+    )
+
+    # 首次调用会建立索引并编译条件，单独计时
+    started = time.perf_counter()
+    await validator.validate_and_match(records[0])
+    build_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    timings = StageTimings(maxlen=len(records))
+    timings.enabled = True
+    matched = 0
+    started = time.perf_counter()
+    for record in records:
+        with timings.measure("match"):
+            result = await validator.validate_and_match(record)
+        if result:
+            matched += 1
+    elapsed = time.perf_counter() - started
+    summary = timings.summary()["match"]
+
+    # 单次匹配的峰值内存分配
+    alloc_peaks = []
+    tracemalloc.start()
+    try:
+        for record in records[:alloc_kills]:
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            await validator.validate_and_match(record)
+            alloc_peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "kills": len(records),
+        "matched": matched,
+        "build_ms": build_ms,
+        "kps": round(len(records) / elapsed, 1) if elapsed else 0,
+        "avg": summary["avg"],
+        "p50": summary["p50"],
+        "p99": summary["p99"],
+        "max": summary["max"],
+        "alloc_kb": round(sum(alloc_peaks) / len(alloc_peaks) / 1024, 1) if alloc_peaks else 0,
+    }
+
+
+def load_baseline(path: Path = BENCH_BASELINE_PATH) -> dict[str, Any]:
+    """读取基线，不存在或损坏时为空"""
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_baseline(scenarios: dict[str, Any], path: Path = BENCH_BASELINE_PATH):
+    """保存本次结果为基线（与已有基线合并，同名场景覆盖）"""
+    baseline = load_baseline(path)
+    baseline.update(scenarios)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(baseline, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+def compare_baseline(
+    scenarios: dict[str, Any], baseline: dict[str, Any], ratio: float = BENCH_REGRESSION_RATIO
+) -> list[str]:
+    """
+    与基线对比
+
+    Returns:
+        退化描述列表，如 "subs=10000 attackers=100: p99 1.2ms -> 2.0ms"
+    """
+    regressions = []
+    for name, result in scenarios.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric in ("p50", "p99", "alloc_kb"):
+            if base.get(metric) and result[metric] > base[metric] * ratio:
+                regressions.append(f"{name}: {metric} {base[metric]} -> {result[metric]}")
+        if base.get("kps") and result["kps"] * ratio < base["kps"]:
+            regressions.append(f"{name}: kps {base['kps']} -> {result['kps']}")
+    return regressions
+
+
+async def run_benchmark(
+    subscription_sizes: tuple[int, ...] = BENCH_SUBSCRIPTION_SIZES,
+    attacker_sizes: tuple[int, ...] = BENCH_ATTACKER_SIZES,
+    kills: int = BENCH_KILLS,
+    save: bool = False,
+    seed: int = BENCH_SEED,
+) -> dict[str, Any]:
+    """
+    运行全部场景（订阅规模 × 攻击者规模）
+
+    Args:
+        subscription_sizes: 订阅规模
+        attacker_sizes: 攻击者规模
+        kills: 每个场景计时的 killmail 数
+        save: 是否把本次结果保存为基线
+        seed: 随机种子，相同种子生成相同的数据
+
+    Returns:
+        {"scenarios": {场景名: 结果}, "regressions": [...], "baseline": 基线文件路径}
+    """
+    rng = random.Random(seed)
+    kills = max(1, kills)
+    killmails = {
+        attackers: [KillmailRecord(make_killmail(rng, i + 1, attackers)) for i in range(kills)]
+        for attackers in attacker_sizes
+    }
+
+    scenarios = {}
+    for count in subscription_sizes:
+        subscriptions = make_subscriptions(rng, count)
+        for attackers in attacker_sizes:
+            name = f"subs={count} attackers={attackers}"
+            scenarios[name] = await run_scenario(subscriptions, killmails[attackers])
+            logger.info(f"KM 基准测试 {name}: {scenarios[name]}")
+
+    regressions = compare_baseline(scenarios, load_baseline())
+    if save:
+        save_baseline(scenarios)
+    return {"scenarios": scenarios, "regressions": regressions, "baseline": str(BENCH_BASELINE_PATH)}
+
+
+async def run_benchmark_isolated(**kwargs: Any) -> dict[str, Any]:
+    """
+    在单独线程的事件循环中运行 run_benchmark，参数相同
+
+    匹配是纯 CPU 计算，放在线程中仍会与机器人争用 GIL：事件循环可以继续调度，但会明显变慢，
+    不要在监听器处理 killmail 时运行大规模场景。
+    """
+    return await asyncio.to_thread(asyncio.run, run_benchmark(**kwargs))
@@ -0,0 +1,57 @@
+"""
+KM 时效判断使用的时钟
+
+线上直接使用系统时间；离线回放时切换为回放时钟，避免历史数据在入口预过滤、订阅时效和优先级分流中被当作过期丢弃：
+- 按倍速回放：第一条记录的击杀时间 + 已流逝时间 × 倍速；
+- 不限速回放：已读入记录中最晚的击杀时间。
+"""
+
+import time
+
+
+class KillmailClock:
+    """系统时间 / 回放时钟"""
+
+    def __init__(self):
+        self._replaying = False
+        self._speed = 0.0
+        self._first: float | None = None  # 回放第一条记录的击杀时间戳
+        self._latest: float | None = None  # 已读入记录中最晚的击杀时间戳
+        self._started = 0.0  # 读入第一条记录时的 monotonic 时间
+
+    @property
+    def replaying(self) -> bool:
+        return self._replaying
+
+    def start_replay(self, speed: float):
+        """切换到回放时钟，第一条记录读入前仍返回系统时间"""
+        self._replaying = True
+        self._speed = speed
+        self._first = None
+        self._latest = None
+
+    def observe(self, timestamp: float | None):
+        """回放读入一条记录时调用，推进回放时钟"""
+        if not self._replaying or timestamp is None:
+            return
+        if self._first is None:
+            self._first = timestamp
+            self._started = time.monotonic()
+        if self._latest is None or timestamp > self._latest:
+            self._latest = timestamp
+
+    def stop_replay(self):
+        self._replaying = False
+        self._first = None
+        self._latest = None
+
+    def now(self) -> float:
+        """当前时间戳（秒）"""
+        if not self._replaying or self._first is None:
+            return time.time()
+        if self._speed > 0:
+            return max(self._first + (time.monotonic() - self._started) * self._speed, self._latest)
+        return self._latest
+
+
+km_clock = KillmailClock()
@@ -0,0 +1,201 @@
+"""
+多实例集群模式
+
+多个 bot 进程共用一个 Redis 时：
+- 通过带 TTL 的 Redis 租约选出一个 leader，只有 leader 运行 R2Z2/RedisQ 数据源并持有 sequence，
+  把预过滤、去重后的 killmail 发布到 Redis Stream；
+- 所有节点（含 leader）经同一个消费组领取条目交给本地 worker，处理完成后 XACK；
+- 节点宕机后，其未确认的条目在空闲超过 CLUSTER_CLAIM_IDLE 后由其他节点 XAUTOCLAIM 接手；
+  接手（以及重启后接回）的条目标记为 recovered，worker 会覆盖原节点留下的去重认领，而不是当作重复丢弃。
+"""
+
+import os
+import socket
+import time
+from typing import Any
+
+from nonebot import logger
+
+from ...utils.common.cache import cache as redis_cache
+from .record import KillmailRecord
+
+CLUSTER_STREAM_KEY = "zkb:cluster:stream"  # killmail 发布的 Redis Stream
+CLUSTER_GROUP = "km_workers"  # 消费组名称
+CLUSTER_LEADER_KEY = "zkb:cluster:leader"  # leader 租约 key
+CLUSTER_LEADER_TTL = 15  # leader 租约有效期（秒），每 1/3 周期续约一次
+CLUSTER_STREAM_MAXLEN = 100_000  # Stream 近似最大长度
+CLUSTER_CLAIM_IDLE = 300  # 未确认条目空闲超过该时长（秒）即可被其他节点接手
+CLUSTER_CLAIM_INTERVAL = 30  # 检查可接手条目的间隔（秒）
+
+# 仅当租约仍属于本节点时续约/释放
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class KillmailCluster:
+    """基于 Redis 租约与 Stream 消费组的集群协调"""
+
+    def __init__(self, node_id: str | None = None):
+        """
+        Args:
+            node_id: 节点 ID，同时作为消费者名称；固定后重启可直接接回本节点未确认的条目
+        """
+        self.node_id = node_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.is_leader = False
+
+        self._stream = redis_cache._get_key(CLUSTER_STREAM_KEY)
+        self._leader_key = redis_cache._get_key(CLUSTER_LEADER_KEY)
+        self._own_pending: bytes | str | None = "0"  # 本节点上次未确认条目的读取游标，读完后为 None
+        self._last_claim: float = 0
+        self._pending_acks: list[bytes] = []
+
+        self.published = 0
+        self.consumed = 0
+        self.claimed = 0
+        self.acked = 0
+        self.leader_changes = 0
+
+    # ── leader 选举 ──────────────────────────────────────
+
+    async def ensure_group(self):
+        """创建消费组（已存在时忽略），并重置本节点的读取状态"""
+        try:
+            await redis_cache.redis.xgroup_create(self._stream, CLUSTER_GROUP, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._own_pending = "0"
+        self._last_claim = 0
+
+    async def try_lead(self) -> bool:
+        """
+        尝试获取或续约 leader 租约
+
+        Returns:
+            本节点当前是否为 leader
+        """
+        redis = redis_cache.redis
+        ttl_ms = CLUSTER_LEADER_TTL * 1000
+        if self.is_leader:
+            leading = bool(await redis.eval(_RENEW_SCRIPT, 1, self._leader_key, self.node_id, ttl_ms))
+        else:
+            leading = bool(await redis.set(self._leader_key, self.node_id, nx=True, px=ttl_ms))
+        if leading != self.is_leader:
+            self.leader_changes += 1
+        self.is_leader = leading
+        return leading
+
+    async def resign(self):
+        """主动释放 leader 租约"""
+        if not self.is_leader:
+            return
+        self.is_leader = False
+        try:
+            await redis_cache.redis.eval(_RELEASE_SCRIPT, 1, self._leader_key, self.node_id)
+        except Exception as e:
+            logger.warning(f"KM 集群: 释放 leader 租约失败: {e}")
+
+    # ── Stream 读写 ──────────────────────────────────────
+
+    async def publish(self, record: KillmailRecord):
+        """leader 发布一条 killmail"""
+        await redis_cache.redis.xadd(
+            self._stream,
+            {"n": record.killmail_id or 0, "d": record.raw},
+            maxlen=CLUSTER_STREAM_MAXLEN,
+            approximate=True,
+        )
+        self.published += 1
+
+    def _decode(self, entries, recovered: bool = False) -> list[tuple[bytes, KillmailRecord, bool]]:
+        """解析 Stream 条目，已被裁剪或损坏的条目直接确认丢弃"""
+        result = []
+        for entry_id, fields in entries or ():
+            raw = (fields or {}).get(b"d")
+            if not raw:
+                self.ack(entry_id)
+                continue
+            try:
+                result.append((entry_id, KillmailRecord.from_bytes(raw), recovered))
+            except ValueError:
+                logger.warning(f"KM 集群: 条目 {entry_id} 解析失败，已丢弃")
+                self.ack(entry_id)
+        return result
+
+    async def read(self, count: int, block_ms: int = 2000) -> list[tuple[bytes, KillmailRecord, bool]]:
+        """
+        领取待处理条目：先接回本节点上次未确认的，再定期接手宕机节点的，最后读取新条目
+
+        Args:
+            count: 最多领取条数
+            block_ms: 没有新条目时的阻塞时长（毫秒）
+
+        Returns:
+            [(Stream 条目 ID, killmail 记录, 是否为接回/接手的条目)]
+        """
+        redis = redis_cache.redis
+
+        if self._own_pending is not None:
+            response = await redis.xreadgroup(
+                CLUSTER_GROUP, self.node_id, {self._stream: self._own_pending}, count=count
+            )
+            entries = response[0][1] if response else []
+            if entries:
+                self._own_pending = entries[-1][0]
+                self.consumed += len(entries)
+                return self._decode(entries, recovered=True)
+            self._own_pending = None
+
+        now = time.monotonic()
+        if now - self._last_claim > CLUSTER_CLAIM_INTERVAL:
+            self._last_claim = now
+            response = await redis.xautoclaim(
+                self._stream, CLUSTER_GROUP, self.node_id, CLUSTER_CLAIM_IDLE * 1000, start_id="0-0", count=count
+            )
+            entries = response[1] if response and len(response) > 1 else []
+            if entries:
+                self.claimed += len(entries)
+                logger.info(f"KM 集群: 接手 {len(entries)} 条其他节点未确认的 killmail")
+                return self._decode(entries, recovered=True)
+
+        response = await redis.xreadgroup(CLUSTER_GROUP, self.node_id, {self._stream: ">"}, count=count, block=block_ms)
+        entries = response[0][1] if response else []
+        self.consumed += len(entries)
+        return self._decode(entries)
+
+    def ack(self, entry_id: bytes):
+        """标记条目已处理，由 flush_acks 批量确认"""
+        self._pending_acks.append(entry_id)
+
+    async def flush_acks(self):
+        """批量 XACK"""
+        if not self._pending_acks:
+            return
+        batch, self._pending_acks = self._pending_acks, []
+        try:
+            await redis_cache.redis.xack(self._stream, CLUSTER_GROUP, *batch)
+            self.acked += len(batch)
+        except Exception as e:
+            # 未确认的条目会在超时后被重新领取并再次处理（至少一次）
+            logger.warning(f"KM 集群: 批量确认 {len(batch)} 条失败: {e}")
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "node_id": self.node_id,
+            "is_leader": self.is_leader,
+            "published": self.published,
+            "consumed": self.consumed,
+            "claimed": self.claimed,
+            "acked": self.acked,
+            "leader_changes": self.leader_changes,
+        }
@@ -0,0 +1,119 @@
+"""
+KM 处理自适应并发控制器
+
+按 AIMD（加性增、乘性减）根据 km.check 耗时、队列深度和下游渲染/发送积压，
+在配置的上下限内调整 worker 数量和令牌桶速率。
+"""
+
+from collections import deque
+import math
+import time
+from typing import Any
+
+
+class AdaptiveController:
+    """AIMD 自适应并发控制器"""
+
+    def __init__(
+        self,
+        workers: int,
+        rate: float,
+        min_workers: int,
+        max_workers: int,
+        min_rate: float,
+        max_rate: float,
+        latency_target: float,
+        backlog_limit: int,
+    ):
+        """
+        Args:
+            workers: 初始 worker 数量
+            rate: 初始速率（次/秒）
+            min_workers: worker 数量下限
+            max_workers: worker 数量上限
+            min_rate: 速率下限
+            max_rate: 速率上限
+            latency_target: km.check 的 p90 耗时目标（秒），超过即降速
+            backlog_limit: 下游渲染/发送积压上限，超过即降速
+        """
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        self.min_rate = max(0.1, min_rate)
+        self.max_rate = max(self.min_rate, max_rate)
+        self.latency_target = latency_target
+        self.backlog_limit = backlog_limit
+
+        self.workers = min(max(workers, self.min_workers), self.max_workers)
+        self.rate = min(max(rate, self.min_rate), self.max_rate)
+
+        self._latencies: deque[float] = deque(maxlen=500)  # 上次调整以来的 km.check 耗时
+        self.last_decision: dict[str, Any] = {}
+
+    def record_latency(self, seconds: float):
+        """记录一次 km.check 的耗时"""
+        self._latencies.append(seconds)
+
+    def _p90_latency(self) -> float | None:
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, math.ceil(len(ordered) * 0.9) - 1)]
+
+    def adjust(self, queue_depth: int, downstream_backlog: int) -> dict[str, Any]:
+        """
+        根据当前观测值做一次调整
+
+        Args:
+            queue_depth: KM 队列待处理条数
+            downstream_backlog: 下游渲染/发送积压条数
+
+        Returns:
+            本次决策
+        """
+        p90 = self._p90_latency()
+        samples = len(self._latencies)
+        self._latencies.clear()
+
+        if (p90 is not None and p90 > self.latency_target) or downstream_backlog > self.backlog_limit:
+            # 下游已经吃不消：乘性减
+            self.workers = max(self.min_workers, int(self.workers * 0.7))
+            self.rate = max(self.min_rate, self.rate * 0.7)
+            action = "decrease"
+        elif queue_depth > self.workers:
+            # 队列有积压且下游健康：加性增
+            self.workers = min(self.max_workers, self.workers + 1)
+            self.rate = min(self.max_rate, self.rate + 1.0)
+            action = "increase"
+        elif queue_depth == 0 and samples == 0:
+            # 空闲：缓慢回落到下限
+            self.workers = max(self.min_workers, self.workers - 1)
+            self.rate = max(self.min_rate, self.rate - 0.5)
+            action = "idle"
+        else:
+            action = "hold"
+
+        self.last_decision = {
+            "time": time.time(),
+            "action": action,
+            "workers": self.workers,
+            "rate": round(self.rate, 2),
+            "p90_latency": round(p90, 3) if p90 is not None else None,
+            "samples": samples,
+            "queue_depth": queue_depth,
+            "downstream_backlog": downstream_backlog,
+        }
+        return self.last_decision
+
+    def snapshot(self) -> dict[str, Any]:
+        """当前控制器状态，用于监控"""
+        return {
+            "workers": self.workers,
+            "rate": round(self.rate, 2),
+            "bounds": {
+                "workers": [self.min_workers, self.max_workers],
+                "rate": [self.min_rate, self.max_rate],
+            },
+            "latency_target": self.latency_target,
+            "backlog_limit": self.backlog_limit,
+            "last_decision": self.last_decision,
+        }
@@ -0,0 +1,661 @@
+"""
+订阅条件编译
+
+把订阅的 condition_groups JSON 一次性编译成谓词对象树，字符串的大小写归一、类型分发和
+匹配原因文本都在编译期完成，匹配时只剩对匹配上下文的属性比较与集合查询（同步求值）。
+- AND 遇到第一个不满足的子项即返回；
+- OR 需要汇总所有满足子项的原因，因此仍会求值全部子项。
+每个谓词声明所需的上下文数据（needs），匹配前由上下文统一查询一次。
+编译结果按 (订阅 ID, updated_at) 缓存，进程内所有 worker 共享。
+
+匹配分两步：test() 只判断是否满足，按估计的选择性重排子项并完全短路
+（AND 先执行最可能失败的廉价检查，OR 先执行最可能满足的，满足一个即停止）；
+只有满足的订阅才调用 evaluate() 按原始顺序收集匹配原因，因此原因文本不受重排影响。
+选择性估计见 selectivity.py，估计更新后缓存的谓词在下次使用时重新编译。
+
+叶子条件在所有订阅间去重（LeafTable），订阅树只持有带原因文本的引用（LeafRef）；
+每个 killmail 上每个不同的叶子最多计算一次，开销随不同条件数而非订阅总数增长。
+叶子按缓存的编译结果引用计数，订阅重新编译或被删除后不再被引用的叶子从表中移除。
+"""
+
+from collections.abc import Iterable, Iterator
+import itertools
+import json
+from typing import TYPE_CHECKING, Any
+
+from nonebot import logger
+
+from xiaobawang.plugins.sde.jumps import jump_distances
+
+from .selectivity import SelectivityStats, entity_prior, label_prior, selectivity
+from .subscription_index import _norm_id
+
+if TYPE_CHECKING:
+    from .condition_matcher import ConditionMatcher
+
+MatchResult = tuple[bool, list[str]]
+
+NEED_LOCATION = "location"  # 星座/星域归属
+NEED_SHIP_CLASS = "ship_class"  # 受害舰船群组/分类
+
+PROXIMITY_MAX_JUMPS = 30  # 跳数条件允许的最大跳数
+
+_NO_MATCH: MatchResult = (False, [])
+_NO_NEEDS: frozenset[str] = frozenset()
+_MIN_P = 1e-6  # 概率下限，避免排序键除零
+
+
+class Predicate:
+    """
+    谓词基类
+
+    cost 为单次 test() 的相对开销，p 为估计的满足概率，用于父节点排序子项
+    """
+
+    __slots__ = ()
+
+    needs: frozenset[str] = _NO_NEEDS
+    cost: float = 1.0
+    p: float = 0.5
+
+    def test(self, m: "ConditionMatcher") -> bool:
+        """只判断是否满足"""
+        raise NotImplementedError
+
+    def evaluate(self, m: "ConditionMatcher") -> MatchResult:
+        """判断是否满足并给出匹配原因"""
+        raise NotImplementedError
+
+
+class ConstPredicate(Predicate):
+    """恒定结果（空条件组、未知逻辑或永远不会满足的条件）"""
+
+    __slots__ = ("p", "result")
+
+    cost = 0.0
+
+    def __init__(self, result: bool):
+        self.result = result
+        self.p = 1.0 if result else 0.0
+
+    def test(self, m: "ConditionMatcher") -> bool:
+        return self.result
+
+    def evaluate(self, m: "ConditionMatcher") -> MatchResult:
+        return self.result, []
+
+
+class _Composite(Predicate):
+    __slots__ = ("children", "cost", "needs", "order", "p")
+
+    def __init__(self, children: list[Predicate]):
+        self.children = children  # 原始顺序，evaluate() 按此顺序收集原因
+        self.order = children  # test() 的求值顺序
+        self.needs = frozenset().union(*(child.needs for child in children))
+
+
+class AndPredicate(_Composite):
+    __slots__ = ()
+
+    def __init__(self, children: list[Predicate]):
+        super().__init__(children)
+        # 单位开销下失败概率最高的先执行
+        self.order = sorted(children, key=lambda c: c.cost / max(1 - c.p, _MIN_P))
+        p = 1.0
+        cost = 0.0
+        for child in self.order:
+            cost += p * child.cost
+            p *= child.p
+        self.p = p
+        self.cost = cost
+
+    def test(self, m: "ConditionMatcher") -> bool:
+        for child in self.order:
+            if not child.test(m):
+                return False
+        return True
+
+    def evaluate(self, m: "ConditionMatcher") -> MatchResult:
+        reasons = []
+        for child in self.children:
+            matched, child_reasons = child.evaluate(m)
+            if not matched:
+                return _NO_MATCH
+            reasons.extend(child_reasons)
+        return True, reasons
+
+
+class OrPredicate(_Composite):
+    __slots__ = ()
+
+    def __init__(self, children: list[Predicate]):
+        super().__init__(children)
+        # 单位开销下满足概率最高的先执行
+        self.order = sorted(children, key=lambda c: c.cost / max(c.p, _MIN_P))
+        miss = 1.0
+        cost = 0.0
+        for child in self.order:
+            cost += miss * child.cost
+            miss *= 1 - child.p
+        self.p = 1 - miss
+        self.cost = cost
+
+    def test(self, m: "ConditionMatcher") -> bool:
+        for child in self.order:
+            if child.test(m):
+                return True
+        return False
+
+    def evaluate(self, m: "ConditionMatcher") -> MatchResult:
+        matched_any = False
+        reasons = []
+        for child in self.children:
+            matched, child_reasons = child.evaluate(m)
+            if matched:
+                matched_any = True
+                reasons.extend(child_reasons)
+        return (True, reasons) if matched_any else _NO_MATCH
+
+
+class _Leaf:
+    """
+    共享叶子条件
+
+    相同的条件（类型、角色与 ID 均相同）在所有订阅间只有一个实例，由 LeafTable 分配全局唯一的 slot；
+    订阅树通过 LeafRef 引用，每个 killmail 的结果按 slot 记在匹配上下文中，只计算一次。
+    """
+
+    __slots__ = ("entity_id", "p", "slot")
+
+    needs: frozenset[str] = _NO_NEEDS
+    cost: float = 1.0
+
+    def __init__(self, entity_id: Any, p: float = 0.5):
+        self.entity_id = entity_id
+        self.p = p
+        self.slot = -1
+
+    @property
+    def key(self) -> tuple:
+        """去重键"""
+        return type(self).__name__, self.entity_id
+
+    def check(self, m: "ConditionMatcher") -> bool:
+        raise NotImplementedError
+
+    def reasons(self, m: "ConditionMatcher", reason: str) -> list[str]:
+        """满足时的原因，reason 为引用方（订阅）编译期生成的文本"""
+        return [reason] if reason else []
+
+
+class SystemPredicate(_Leaf):
+    __slots__ = ()
+
+    def check(self, m: "ConditionMatcher") -> bool:
+        return m.solar_system_id == self.entity_id
+
+
+class LocationPredicate(_Leaf):
+    """星座/星域条件"""
+
+    __slots__ = ("field",)
+
+    needs = frozenset({NEED_LOCATION})
+
+    def __init__(self, field: str, entity_id: Any, p: float = 0.5):
+        super().__init__(entity_id, p)
+        self.field = field
+
+    @property
+    def key(self) -> tuple:
+        return "location", self.field, self.entity_id
+
+    def check(self, m: "ConditionMatcher") -> bool:
+        value = getattr(m, self.field)
+        return value is not None and value == self.entity_id
+
+
+class VictimShipPredicate(_Leaf):
+    __slots__ = ()
+
+    def check(self, m: "ConditionMatcher") -> bool:
+        return m.victim_ids["ship"] == self.entity_id
+
+
+class FinalBlowShipPredicate(_Leaf):
+    __slots__ = ()
+
+    def check(self, m: "ConditionMatcher") -> bool:
+        return m.final_blow_ids["ship"] == self.entity_id
+
+
+class GroupPredicate(_Leaf):
+    """受害舰船群组条件，编译期已把 entity_id 转为字符串"""
+
+    __slots__ = ()
+
+    needs = frozenset({NEED_SHIP_CLASS})
+    cost = 1.5
+
+    def check(self, m: "ConditionMatcher") -> bool:
+        return bool(m.group_id) and str(m.group_id) == self.entity_id
+
+
+class VictimEntityPredicate(_Leaf):
+    __slots__ = ("entity_type",)
+
+    def __init__(self, entity_type: str, entity_id: Any, p: float = 0.5):
+        super().__init__(entity_id, p)
+        self.entity_type = entity_type
+
+    @property
+    def key(self) -> tuple:
+        return type(self).__name__, self.entity_type, self.entity_id
+
+    def check(self, m: "ConditionMatcher") -> bool:
+        target_id = m.victim_ids[self.entity_type]
+        return bool(target_id) and target_id == self.entity_id
+
+
+class FinalBlowEntityPredicate(VictimEntityPredicate):
+    __slots__ = ()
+
+    def check(self, m: "ConditionMatcher") -> bool:
+        target_id = m.final_blow_ids[self.entity_type]
+        return bool(target_id) and target_id == self.entity_id
+
+
+class AttackerEntityPredicate(VictimEntityPredicate):
+    __slots__ = ()
+
+    def check(self, m: "ConditionMatcher") -> bool:
+        try:
+            return self.entity_id in m.attacker_ids[self.entity_type]
+        except TypeError:
+            # 不可哈希的 entity_id 永远不会匹配
+            return False
+
+
+class ProximityPredicate(_Leaf):
+    """距某星系 N 跳内，查预先计算的跳数矩阵"""
+
+    __slots__ = ("jumps",)
+
+    def __init__(self, entity_id: Any, jumps: int, p: float = 0.5):
+        super().__init__(entity_id, p)
+        self.jumps = jumps
+
+    @property
+    def key(self) -> tuple:
+        return "proximity", self.entity_id, self.jumps
+
+    def check(self, m: "ConditionMatcher") -> bool:
+        distance = jump_distances.distance(self.entity_id, m.solar_system_id)
+        return distance is not None and distance <= self.jumps
+
+    def reasons(self, m: "ConditionMatcher", reason: str) -> list[str]:
+        return [f"{reason} ({jump_distances.distance(self.entity_id, m.solar_system_id)} 跳)"]
+
+
+class LabelPredicate(_Leaf):
+    """标签条件：排除标签任一存在即不匹配，必需标签至少命中一个"""
+
+    __slots__ = ("excluded", "required", "required_order")
+
+    cost = 2.0
+
+    def __init__(self, required: list[str], excluded: list[str], p: float = 0.5):
+        super().__init__(None, p)
+        self.required_order = tuple(required)
+        self.required = frozenset(required)
+        self.excluded = frozenset(excluded)
+
+    @property
+    def key(self) -> tuple:
+        return "label", self.required_order, self.excluded
+
+    def check(self, m: "ConditionMatcher") -> bool:
+        labels = m.labels
+        if self.excluded and not self.excluded.isdisjoint(labels):
+            return False
+        return not self.required or not self.required.isdisjoint(labels)
+
+    def reasons(self, m: "ConditionMatcher", reason: str) -> list[str]:
+        if not self.required:
+            return ["标签匹配"]
+        labels = m.labels
+        matched_labels = [label for label in self.required_order if label in labels]
+        return ["标签: " + ", ".join(matched_labels)]
+
+
+class ValuePredicate(_Leaf):
+    __slots__ = ("value_max", "value_min")
+
+    def __init__(self, value_min: float | None, value_max: float | None):
+        super().__init__(None)
+        self.value_min = value_min
+        self.value_max = value_max
+
+    @property
+    def key(self) -> tuple:
+        return "value", self.value_min, self.value_max
+
+    def check(self, m: "ConditionMatcher") -> bool:
+        total_value = m.total_value
+        if self.value_min and total_value < self.value_min:
+            return False
+        return not (self.value_max and total_value > self.value_max)
+
+    def reasons(self, m: "ConditionMatcher", reason: str) -> list[str]:
+        return [f"价值: {m.total_value:,.0f} ISK"]
+
+
+class LeafRef(Predicate):
+    """订阅树中对共享叶子的引用，携带该订阅自己的原因文本"""
+
+    __slots__ = ("cost", "leaf", "needs", "p", "reason", "slot")
+
+    def __init__(self, leaf: _Leaf, reason: str = ""):
+        self.leaf = leaf
+        self.slot = leaf.slot
+        self.reason = reason
+        self.needs = leaf.needs
+        self.cost = leaf.cost
+        self.p = leaf.p
+
+    def test(self, m: "ConditionMatcher") -> bool:
+        results = m.leaf_results
+        result = results.get(self.slot)
+        if result is None:
+            try:
+                result = self.leaf.check(m)
+            except Exception as e:
+                # 条件值非法（如价值下限为字符串）时按不满足处理，不影响其他订阅
+                logger.warning(f"条件 {type(self.leaf).__name__} 求值出错，按不满足处理: {e}")
+                result = False
+            results[self.slot] = result
+        return result
+
+    def evaluate(self, m: "ConditionMatcher") -> MatchResult:
+        if not self.test(m):
+            return _NO_MATCH
+        return True, self.leaf.reasons(m, self.reason)
+
+
+def _leaf_refs(predicate: Predicate) -> Iterator[LeafRef]:
+    """遍历谓词树中的全部叶子引用"""
+    if isinstance(predicate, LeafRef):
+        yield predicate
+    elif isinstance(predicate, _Composite):
+        for child in predicate.children:
+            yield from _leaf_refs(child)
+
+
+class LeafTable:
+    """所有订阅共享的叶子条件表，按引用计数移除不再使用的叶子"""
+
+    def __init__(self):
+        self._leaves: dict[tuple, _Leaf] = {}
+        self._refs: dict[tuple, int] = {}  # 去重键 -> 引用次数
+        self._slots = itertools.count()  # slot 永不复用，清空后旧匹配上下文中的结果也不会错配
+
+    def ref(self, leaf: _Leaf, reason: str = "") -> LeafRef:
+        """
+        登记叶子条件并返回引用，已有相同条件时复用
+
+        Args:
+            leaf: 新编译的叶子条件（其 p 为最新估计）
+            reason: 引用方的原因文本
+        """
+        try:
+            key = leaf.key
+            shared = self._leaves.get(key)
+        except TypeError:
+            # 不可哈希的条件值不参与去重
+            key, shared = None, None
+        if shared is None:
+            shared = leaf
+            shared.slot = next(self._slots)
+            if key is not None:
+                self._leaves[key] = shared
+        else:
+            shared.p = leaf.p
+        if key is not None:
+            self._refs[key] = self._refs.get(key, 0) + 1
+        return LeafRef(shared, reason)
+
+    def release(self, predicate: Predicate):
+        """释放谓词树对叶子的引用，引用归零的叶子移出表（已有的 LeafRef 仍可正常求值）"""
+        for leaf_ref in _leaf_refs(predicate):
+            leaf = leaf_ref.leaf
+            try:
+                key = leaf.key
+                if self._leaves.get(key) is not leaf:
+                    continue
+            except TypeError:
+                continue
+            count = self._refs.get(key, 0) - 1
+            if count > 0:
+                self._refs[key] = count
+            else:
+                self._refs.pop(key, None)
+                del self._leaves[key]
+
+    def clear(self):
+        self._leaves.clear()
+        self._refs.clear()
+
+    def __len__(self) -> int:
+        return len(self._leaves)
+
+
+leaf_table = LeafTable()
+
+
+_FALSE = ConstPredicate(False)
+_TRUE = ConstPredicate(True)
+
+
+def _compile_entity(condition: dict, leaves: LeafTable, stats: SelectivityStats) -> Predicate:
+    entity_type = condition.get("entity_type", "").lower()
+    entity_id = condition.get("entity_id")
+    entity_name = condition.get("entity_name", "")
+    role = condition.get("role", "").lower()
+
+    if not entity_type or not entity_id:
+        return _FALSE
+
+    def estimate(*key_parts: Any, role: str | None = None) -> float:
+        """触发键（与订阅索引一致）的满足概率估计"""
+        return stats.hit_rate((*key_parts, _norm_id(entity_id)), entity_prior(entity_type, role))
+
+    if entity_type == "system":
+        return leaves.ref(SystemPredicate(entity_id, estimate("system")), f"星系: {entity_name}")
+    if entity_type == "region":
+        return leaves.ref(LocationPredicate("region_id", entity_id, estimate("region")), f"区域: {entity_name}")
+    if entity_type == "constellation":
+        return leaves.ref(
+            LocationPredicate("constellation_id", entity_id, estimate("constellation")), f"星座: {entity_name}"
+        )
+
+    if entity_type == "ship":
+        role_type = condition.get("ship_role", "victim_ship")
+        if role_type == "victim_ship":
+            return leaves.ref(VictimShipPredicate(entity_id, estimate("ship", role_type)), f"受害舰船: {entity_name}")
+        if role_type == "final_blow_ship":
+            return leaves.ref(
+                FinalBlowShipPredicate(entity_id, estimate("ship", role_type)), f"最后一击舰船: {entity_name}"
+            )
+        return _FALSE
+
+    if entity_type == "group":
+        return leaves.ref(GroupPredicate(str(entity_id), estimate("group")), f"群组: {entity_name}")
+
+    if entity_type not in ("character", "corporation", "alliance"):
+        return _FALSE
+    if role == "victim":
+        return leaves.ref(
+            VictimEntityPredicate(entity_type, entity_id, estimate(entity_type, role)),
+            f"[{entity_type}]损失: {entity_name}",
+        )
+    if role == "final_blow":
+        return leaves.ref(
+            FinalBlowEntityPredicate(entity_type, entity_id, estimate(entity_type, role)),
+            f"[{entity_type}]最后一击: {entity_name}",
+        )
+    if role == "any_attacker":
+        return leaves.ref(
+            AttackerEntityPredicate(entity_type, entity_id, estimate(entity_type, role, role=role)),
+            f"[{entity_type}]参与击杀: {entity_name}",
+        )
+    return _FALSE
+
+
+def _compile_proximity(condition: dict, leaves: LeafTable) -> Predicate:
+    """{"type": "proximity", "entity_id": 星系ID, "entity_name": 名称, "jumps": N}"""
+    system_id = condition.get("entity_id")
+    try:
+        jumps = int(condition.get("jumps", 0))
+    except (TypeError, ValueError):
+        return _FALSE
+    if not system_id or not 0 <= jumps <= PROXIMITY_MAX_JUMPS:
+        return _FALSE
+    entity_name = condition.get("entity_name", "")
+    # 索引以展开后的星系为触发键，没有单独的命中统计，直接使用先验
+    return leaves.ref(
+        ProximityPredicate(_norm_id(system_id), jumps, entity_prior("region")), f"{entity_name} {jumps} 跳内"
+    )
+
+
+def compile_condition(
+    condition: dict, leaves: LeafTable = leaf_table, stats: SelectivityStats = selectivity
+) -> Predicate:
+    """
+    编译单个条件
+
+    Args:
+        condition: 条件配置
+        leaves: 登记叶子条件的表
+        stats: 提供满足概率估计的选择性统计
+    """
+    cond_type = condition.get("type", "").lower()
+    if cond_type == "entity":
+        return _compile_entity(condition, leaves, stats)
+    if cond_type == "label":
+        required_labels = condition.get("required_labels", [])
+        excluded_labels = condition.get("excluded_labels", [])
+        if not required_labels and not excluded_labels:
+            return _TRUE
+        # 必需标签至少出现一个的概率
+        p = 1.0
+        if required_labels:
+            miss = 1.0
+            for label in required_labels:
+                miss *= 1 - stats.hit_rate(("label", label), label_prior(label))
+            p = 1 - miss
+        # 排除标签均不出现的概率
+        for label in excluded_labels:
+            p *= 1 - stats.hit_rate(("label", label), label_prior(label))
+        return leaves.ref(LabelPredicate(required_labels, excluded_labels, p))
+    if cond_type == "value":
+        return leaves.ref(ValuePredicate(condition.get("min"), condition.get("max")))
+    if cond_type == "proximity":
+        return _compile_proximity(condition, leaves)
+
+    logger.warning(f"Unknown condition type: {cond_type}")
+    return _FALSE
+
+
+def compile_group(group: dict, leaves: LeafTable = leaf_table, stats: SelectivityStats = selectivity) -> Predicate:
+    """
+    递归编译条件组
+
+    Args:
+        group: 条件组配置 {"logic": "AND|OR", "conditions": [...], "groups": [...]}
+        leaves: 登记叶子条件的表
+        stats: 提供满足概率估计的选择性统计
+    """
+    logic = group.get("logic", "AND").upper()
+    children = []
+    for condition in group.get("conditions", []):
+        try:
+            children.append(compile_condition(condition, leaves, stats))
+        except Exception as e:
+            logger.error(f"条件编译出错 (type={condition.get('type')}): {e}")
+            children.append(_FALSE)
+    children += [compile_group(sub_group, leaves, stats) for sub_group in group.get("groups", [])]
+
+    # 空条件组视为通过
+    if not children:
+        return _TRUE
+    if logic == "AND":
+        return children[0] if len(children) == 1 else AndPredicate(children)
+    if logic == "OR":
+        return children[0] if len(children) == 1 else OrPredicate(children)
+
+    logger.warning(f"Unknown logic operator: {logic}")
+    return _FALSE
+
+
+class CompiledConditionCache:
+    """按 (订阅 ID, updated_at, 选择性统计周期) 缓存编译结果，订阅更新或统计更新后旧版本被替换"""
+
+    def __init__(self, leaves: LeafTable | None = None, stats: SelectivityStats | None = None):
+        """
+        Args:
+            leaves: 叶子条件表，默认新建（压测等场景使用独立实例，不影响线上）
+            stats: 选择性统计，默认新建
+        """
+        self.leaves = LeafTable() if leaves is None else leaves
+        self.stats = SelectivityStats() if stats is None else stats
+        self._compiled: dict[Any, tuple[tuple[str, int], Predicate]] = {}  # 订阅 ID -> ((updated_at, 统计周期), 谓词树)
+
+    def get(self, subscription: dict) -> Predicate:
+        """
+        获取订阅的谓词树，首次或订阅更新后重新编译
+
+        Args:
+            subscription: 订阅配置字典，包含 condition_groups 字段
+        """
+        sub_id = subscription.get("id")
+        # 选择性统计进入新周期后按新的估计重新编译（重排子项）
+        version = (str(subscription.get("updated_at")), self.stats.epoch)
+        cached = self._compiled.get(sub_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        condition_groups = subscription.get("condition_groups", {})
+        if isinstance(condition_groups, str):
+            condition_groups = json.loads(condition_groups)
+        predicate = compile_group(condition_groups or {}, self.leaves, self.stats)
+        if sub_id is None:
+            # 不缓存的编译结果不持有叶子引用
+            self.leaves.release(predicate)
+        else:
+            self._compiled[sub_id] = (version, predicate)
+            if cached is not None:
+                self.leaves.release(cached[1])
+        return predicate
+
+    def retain(self, subscription_ids: Iterable[Any]):
+        """只保留仍存在的订阅的编译结果，释放已删除订阅引用的叶子"""
+        keep = set(subscription_ids)
+        for sub_id in [sub_id for sub_id in self._compiled if sub_id not in keep]:
+            self.leaves.release(self._compiled.pop(sub_id)[1])
+
+    def needs_of(self, subscription: dict) -> frozenset[str]:
+        """订阅匹配所需的上下文数据，条件无法编译时为空（匹配时会按出错处理）"""
+        try:
+            return self.get(subscription).needs
+        except Exception:
+            return _NO_NEEDS
+
+    def clear(self):
+        self._compiled.clear()
+        self.leaves.clear()
+
+    def __len__(self) -> int:
+        return len(self._compiled)
+
+
+compiled_conditions = CompiledConditionCache(leaf_table, selectivity)
@@ -1,35 +1,106 @@
-from datetime import datetime, timezone
-import json
+import asyncio
+from collections.abc import Iterable
 
 from nonebot import logger
 
 from xiaobawang.plugins.sde.oper import sde_search
+from xiaobawang.plugins.sde.universe import universe
 
-from ...api.esi.universe import esi_client
+from ..universe import get_system_info
+from .clock import km_clock
+from .condition_compiler import NEED_LOCATION, NEED_SHIP_CLASS, CompiledConditionCache, compiled_conditions
+from .record import KillmailRecord
+
+ENTITY_TYPES = ("character", "corporation", "alliance")
 
 
 class ConditionMatcher:
-    """条件匹配引擎 - 支持灵活的条件组合和标签匹配"""
+    """
+    条件匹配引擎 - 单个 killmail 的匹配上下文
+
+    构造时一次性算好攻击者 ID 集合、最后一击和受害者 ID；星座/星域、舰船群组/分类
+    由 resolve() 按需查询一次。之后每个订阅的匹配都是同步的集合/属性查询。
+    """
 
-    def __init__(self, killmail_data: dict, label_helper_result: dict = None):
+    def __init__(
+        self,
+        killmail_data: dict | KillmailRecord,
+        label_helper_result: dict | None = None,
+        conditions: CompiledConditionCache | None = None,
+    ):
         """
         初始化匹配器
 
         Args:
-            killmail_data: zkillboard推送的完整killmail数据
+            killmail_data: 紧凑 killmail 记录，或 zkillboard 推送的完整 killmail 数据
             label_helper_result: 已废弃，改为直接从killmail的zkb.labels读取
+            conditions: 编译结果缓存，默认为进程级实例
         """
-        self.data = killmail_data
-        self.victim = killmail_data.get("victim", {})
-        self.attackers = killmail_data.get("attackers", [])
-        self.final_blow = next((a for a in self.attackers if a.get("final_blow")), {})
-        self.zkb = killmail_data.get("zkb", {})
+        self.conditions = compiled_conditions if conditions is None else conditions
+        self.record = KillmailRecord.of(killmail_data)
         # 直接从killmail的zkb.labels数组读取标签
-        self.labels = set(self.zkb.get("labels", []))
-        self.solar_system_id = killmail_data.get("solar_system_id")
-        self.killmail_id = killmail_data.get("killmail_id")
+        self.labels = self.record.labels
+        self.total_value = self.record.total_value
+        self.solar_system_id = self.record.solar_system_id
+        self.killmail_id = self.record.killmail_id
+
+        record = self.record
+        self.victim_ids = {t: record.victim_id(t) for t in (*ENTITY_TYPES, "ship")}
+        self.final_blow_ids = {t: record.final_blow_id(t) for t in (*ENTITY_TYPES, "ship")}
+        self.attacker_ids = {t: frozenset(record.attacker_ids(t)) for t in ENTITY_TYPES}
+
+        # 按需查询的上下文
+        self.constellation_id: int | None = None
+        self.region_id: int | None = None
+        self.group_id: int | None = None
+        self.category_id: int | None = None
+        self._resolved: set[str] = set()
+
+        # 共享叶子条件的结果 slot -> bool，同一 killmail 上被多个订阅引用的条件只计算一次
+        self.leaf_results: dict[int, bool] = {}
+
+    async def resolve(self, needs: Iterable[str]):
+        """
+        查询匹配所需的外部数据，每项每个 killmail 只查询一次
+
+        Args:
+            needs: NEED_LOCATION / NEED_SHIP_CLASS 的组合
+        """
+        needs = set(needs) - self._resolved
+        if not needs:
+            return
+        self._resolved |= needs
+
+        tasks = []
+        if NEED_LOCATION in needs and self.solar_system_id:
+            tasks.append(self._resolve_location())
+        if NEED_SHIP_CLASS in needs and self.victim_ids["ship"]:
+            tasks.append(self._resolve_ship_class())
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def _resolve_location(self):
+        location = universe.locate(self.solar_system_id)
+        if location is not None:
+            self.constellation_id, self.region_id = location
+            return
+        try:
+            system_info = await get_system_info(self.solar_system_id)
+        except Exception as e:
+            logger.error(f"[KM:{self.killmail_id}] 查询星系归属失败: {e}")
+            return
+        self.constellation_id = system_info.get("constellation_id")
+        self.region_id = system_info.get("region_id")
+
+    async def _resolve_ship_class(self):
+        ship_type_id = self.victim_ids["ship"]
+        try:
+            self.group_id = await sde_search.get_type_group(ship_type_id, _id=True)
+            self.category_id = (await sde_search.get_type_category_ids([ship_type_id])).get(ship_type_id)
+        except Exception as e:
+            logger.error(f"[KM:{self.killmail_id}] 查询舰船群组失败: {e}")
 
-    async def match_subscription(self, subscription: dict) -> tuple[bool, list[str]]:
+    def match_subscription(self, subscription: dict) -> tuple[bool, list[str]]:
         """
         匹配订阅条件
 
@@ -39,26 +110,35 @@ class ConditionMatcher:
         Returns:
             (是否匹配, 匹配原因列表)
         """
-        sub_id = subscription.get("id", "unknown")
-        # logger.debug(f"[KM:{self.killmail_id}] 开始匹配订阅 {sub_id}")
-
         try:
             # 检查全局过滤
-            if not await self._check_global_filters(subscription):
-                # logger.debug(f"[KM:{self.killmail_id}] 订阅 {sub_id} 在全局过滤被丢弃")
+            if not self._check_global_filters(subscription):
                 return False, []
+        except Exception as e:
+            logger.error(f"订阅 {subscription.get('id')} 匹配出错: {e}")
+            return False, []
 
-            # 解析条件配置(支持字典或JSON字符串)
-            condition_groups = subscription.get("condition_groups", {})
-            if isinstance(condition_groups, str):
-                condition_config = json.loads(condition_groups)
-            else:
-                condition_config = condition_groups or {}
+        return self.match_conditions(subscription)
 
-            # logger.debug(f"[KM:{self.killmail_id}] 订阅 {sub_id} 条件配置: {condition_config}")
+    def match_conditions(self, subscription: dict) -> tuple[bool, list[str]]:
+        """
+        只匹配订阅的条件组，全局过滤已由调用方（如列存表的向量化预过滤）完成
 
-            # 递归匹配条件组
-            matched, reasons = await self._match_condition_group(condition_config)
+        Args:
+            subscription: 订阅配置字典,包含condition_groups字段
+
+        Returns:
+            (是否匹配, 匹配原因列表)
+        """
+        sub_id = subscription.get("id", "unknown")
+        try:
+            # 取出按 (订阅 ID, updated_at) 缓存的谓词树(首次时编译，支持字典或JSON字符串)
+            predicate = self.conditions.get(subscription)
+
+            # 按选择性排序短路判断，满足时再按原始顺序收集原因（所需数据须已由 resolve() 查询）
+            if not predicate.test(self):
+                return False, []
+            matched, reasons = predicate.evaluate(self)
 
             if matched:
                 logger.debug(f"[KM:{self.killmail_id}] 订阅 {sub_id} 匹配成功,原因: {reasons}")
@@ -68,12 +148,12 @@ class ConditionMatcher:
             logger.error(f"订阅 {subscription.get('id')} 匹配出错: {e}")
             return False, []
 
-    async def _check_global_filters(self, subscription: dict) -> bool:
+    def _check_global_filters(self, subscription: dict) -> bool:
         """检查全局过滤条件"""
         sub_id = subscription.get("id", "unknown")
 
         # 价值检查
-        total_value = float(self.zkb.get("totalValue", 0))
+        total_value = self.total_value
         min_value = subscription.get("min_value", 1_000_000)
         # logger.debug(f"[KM:{self.killmail_id}] 订阅 {sub_id} 价值检查: {total_value:,.0f} >= {min_value:,.0f}")
         if total_value < min_value:
@@ -82,292 +162,33 @@ class ConditionMatcher:
 
         max_age_days = subscription.get("max_age_days", 10)
         # logger.debug(f"[KM:{self.killmail_id}] 订阅 {sub_id} 时效检查: max_age_days={max_age_days}")
-        if not await self._check_killmail_age(max_age_days):
+        if not self._check_killmail_age(max_age_days):
             logger.debug(f"[KM:{self.killmail_id}] 订阅 {sub_id} 时效超期被丢弃")
             return False
 
         return True
 
-    async def _check_killmail_age(self, max_age_days: int = 10) -> bool:
+    def _check_killmail_age(self, max_age_days: int = 10) -> bool:
         """检查击杀时间"""
-        killmail_time_str = self.data.get("killmail_time", "")
-        if not killmail_time_str:
+        if not self.record.killmail_time:
             logger.warning("收到无效的 killmail 数据: 缺少时间信息")
             return False
 
-        try:
-            killmail_time = datetime.fromisoformat(killmail_time_str.replace("Z", "+00:00"))
-            # 确保 max_age_days 为有效整数，默认回退到 10
-            if max_age_days is None:
-                max_age_days = 10
-            else:
-                try:
-                    max_age_days = int(max_age_days)
-                except (TypeError, ValueError):
-                    logger.warning(f"无效的 max_age_days 值: {max_age_days}，使用默认 10")
-                    max_age_days = 10
-
-            current_time = datetime.now(timezone.utc)
-            time_diff = current_time - killmail_time
-
-            if time_diff.days > max_age_days:
-                return False
-            return True
-        except Exception as e:
-            logger.warning(f"解析击杀时间失败: {e}, 时间字符串: {killmail_time_str}")
+        if self.record.timestamp is None:
+            logger.warning(f"解析击杀时间失败, 时间字符串: {self.record.killmail_time}")
             return False
 
-    async def _match_condition_group(self, group: dict) -> tuple[bool, list[str]]:
-        """
-        匹配条件组 - 支持递归AND/OR逻辑
-
-        Args:
-            group: 条件组配置 {"logic": "AND|OR", "conditions": [...], "groups": [...]}
-
-        Returns:
-            (是否匹配, 匹配原因列表)
-        """
-        logic = group.get("logic", "AND").upper()
-        conditions = group.get("conditions", [])
-        sub_groups = group.get("groups", [])
-
-        # logger.debug(f"[KM:{self.killmail_id}]
-        # 匹配条件组: logic={logic}, conditions={len(conditions)}, sub_groups={len(sub_groups)}")
-
-        results = []
-        reasons = []
-
-        # 匹配直接条件
-        for idx, condition in enumerate(conditions):
-            matched, reason = await self._match_single_condition(condition)
-            # logger.debug(f"[KM:{self.killmail_id}] 条件 #{idx+1} {condition.get('type')}: {'✓' if matched else '✗'} {reason or ''}")
-            results.append(matched)
-            if matched and reason:
-                reasons.append(reason)
-
-        # 递归匹配子组
-        for idx, sub_group in enumerate(sub_groups):
-            matched, sub_reasons = await self._match_condition_group(sub_group)
-            # logger.debug(f"[KM:{self.killmail_id}] 子组 #{idx+1}: {'✓' if matched else '✗'}")
-            results.append(matched)
-            reasons.extend(sub_reasons)
-
-        # 空条件组视为通过
-        if not results:
-            # logger.debug(f"[KM:{self.killmail_id}] 空条件组,默认通过")
-            return True, reasons
-
-        # 应用逻辑运算
-        if logic == "AND":
-            final_match = all(results)
-        elif logic == "OR":
-            final_match = any(results)
-        else:
-            logger.warning(f"Unknown logic operator: {logic}")
-            final_match = False
-
-        # logger.debug(f"[KM:{self.killmail_id}]
-        # 条件组结果: {logic} -> {'✓ 通过' if final_match else '✗ 失败'} (results={results})")
-
-        return final_match, reasons if final_match else []
-
-    async def _match_single_condition(self, condition: dict) -> tuple[bool, str]:
-        """
-        匹配单个条件
-
-        Args:
-            condition: 条件配置 {"type": "...", ...}
-
-        Returns:
-            (是否匹配, 匹配原因)
-        """
-        cond_type = condition.get("type", "").lower()
-        # logger.debug(f"[KM:{self.killmail_id}] 检查条件: type={cond_type}, config={condition}")
-
-        try:
-            if cond_type == "entity":
-                return await self._match_entity_condition(condition)
-            elif cond_type == "label":
-                return self._match_label_condition(condition)
-            elif cond_type == "value":
-                return self._match_value_condition(condition)
-            else:
-                logger.warning(f"Unknown condition type: {cond_type}")
-                return False, ""
-        except Exception as e:
-            logger.error(f"条件匹配出错 (type={cond_type}): {e}")
-            return False, ""
-
-    async def _match_entity_condition(self, condition: dict) -> tuple[bool, str]:
-        """
-        匹配实体条件 (character/corporation/alliance/ship/system/region/constellation)
-
-        Args:
-            condition: {
-                "type": "entity",
-                "entity_type": "character|corporation|alliance|ship|system|region|constellation",
-                "entity_id": int,
-                "entity_name": str,
-                "role": "victim|final_blow|any_attacker" (如果是位置类型则不需要role)
-            }
-
-        Returns:
-            (是否匹配, 匹配原因)
-        """
-        entity_type = condition.get("entity_type", "").lower()
-        entity_id = condition.get("entity_id")
-        entity_name = condition.get("entity_name", "")
-        role = condition.get("role", "").lower()
-
-        if not entity_type or not entity_id:
-            return False, ""
-
-        # 处理位置类型实体
-        if entity_type == "system":
-            if self.solar_system_id == entity_id:
-                return True, f"星系: {entity_name}"
-            return False, ""
-
-        elif entity_type == "region":
-            # 通过ESI获取星系信息来确定所属区域
-            system_info = await esi_client.get_system_info(self.solar_system_id)
-            if system_info.get("region_id") == entity_id:
-                return True, f"区域: {entity_name}"
-            return False, ""
-
-        elif entity_type == "constellation":
-            # 通过ESI获取星系信息来确定所属星座
-            system_info = await esi_client.get_system_info(self.solar_system_id)
-            if system_info.get("constellation_id") == entity_id:
-                return True, f"星座: {entity_name}"
-            return False, ""
-
-        # 处理舰船类型实体
-        elif entity_type == "ship":
-            role_type = condition.get("ship_role", "victim_ship")
-            if role_type == "victim_ship":
-                if self.victim.get("ship_type_id") == entity_id:
-                    return True, f"受害舰船: {entity_name}"
-            elif role_type == "final_blow_ship":
-                if self.final_blow.get("ship_type_id") == entity_id:
-                    return True, f"最后一击舰船: {entity_name}"
-            return False, ""
-
-        # 群组类型实体
-        elif entity_type == "group":
-            group_id = await sde_search.get_type_group(self.victim.get("ship_type_id"), _id=True)
-            if not group_id:
-                return False, ""
-            elif str(group_id) == str(entity_id):
-                return True, f"群组: {entity_name}"
-            else:
-                return False, ""
-
-        # 处理实体角色 (character/corporation/alliance)
+        # 确保 max_age_days 为有效整数，默认回退到 10
+        if max_age_days is None:
+            max_age_days = 10
         else:
-            if not role:
-                return False, ""
-
-            if role == "victim":
-                if self._check_entity_match(self.victim, entity_type, entity_id):
-                    return True, f"[{entity_type}]损失: {entity_name}"
-                return False, ""
-
-            elif role == "final_blow":
-                if self._check_entity_match(self.final_blow, entity_type, entity_id):
-                    return True, f"[{entity_type}]最后一击: {entity_name}"
-                return False, ""
-
-            elif role == "any_attacker":
-                for attacker in self.attackers:
-                    if self._check_entity_match(attacker, entity_type, entity_id):
-                        return True, f"[{entity_type}]参与击杀: {entity_name}"
-                return False, ""
-
-        return False, ""
-
-    @staticmethod
-    def _check_entity_match(target: dict, entity_type: str, entity_id: int) -> bool:
-        """
-        检查实体是否匹配
-
-        Args:
-            target: 目标对象 (victim或attacker)
-            entity_type: 实体类型
-            entity_id: 实体ID
+            try:
+                max_age_days = int(max_age_days)
+            except (TypeError, ValueError):
+                logger.warning(f"无效的 max_age_days 值: {max_age_days}，使用默认 10")
+                max_age_days = 10
 
-        Returns:
-            是否匹配
-        """
-        if not target:
+        age_days = int((km_clock.now() - self.record.timestamp) // 86400)
+        if age_days > max_age_days:
             return False
-
-        entity_type = entity_type.lower()
-        if entity_type == "character":
-            return target.get("character_id") == entity_id
-        elif entity_type == "corporation":
-            return target.get("corporation_id") == entity_id
-        elif entity_type == "alliance":
-            return target.get("alliance_id") == entity_id
-
-        return False
-
-    def _match_label_condition(self, condition: dict) -> tuple[bool, str]:
-        """
-        匹配标签条件 (基于killmail的zkb.labels数组)
-
-        Args:
-            condition: {
-                "type": "label",
-                "required_labels": [str] (可选，至少匹配一个),
-                "excluded_labels": [str] (可选，排除任意一个都不匹配)
-            }
-
-        Returns:
-            (是否匹配, 匹配原因)
-        """
-        required_labels = condition.get("required_labels", [])
-        excluded_labels = condition.get("excluded_labels", [])
-
-        if not required_labels and not excluded_labels:
-            return True, ""
-
-        # 检查排除标签 - 如果任意一个排除标签存在则不匹配
-        for excluded in excluded_labels:
-            if excluded in self.labels:
-                return False, ""
-
-        # 检查必需标签 - 如果指定了必需标签，需要至少匹配一个
-        if required_labels:
-            if not any(label in self.labels for label in required_labels):
-                return False, ""
-
-        # 构建匹配原因
-        matched_labels = [label for label in required_labels if label in self.labels]
-        reason = "标签: " + ", ".join(matched_labels) if matched_labels else "标签匹配"
-        return True, reason
-
-    def _match_value_condition(self, condition: dict) -> tuple[bool, str]:
-        """
-        匹配价值条件
-
-        Args:
-            condition: {
-                "type": "value",
-                "min": float (可选),
-                "max": float (可选)
-            }
-
-        Returns:
-            (是否匹配, 匹配原因)
-        """
-        value_min = condition.get("min")
-        value_max = condition.get("max")
-        total_value = float(self.zkb.get("totalValue", 0))
-
-        if value_min and total_value < value_min:
-            return False, ""
-        if value_max and total_value > value_max:
-            return False, ""
-
-        return True, f"价值: {total_value:,.0f} ISK"
+        return True
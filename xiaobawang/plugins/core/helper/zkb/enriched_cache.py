@@ -0,0 +1,134 @@
+"""
+补全后的 KM 数据缓存
+
+同一个 killmail 会被订阅推送、/km 命令、链接预览和重试多次请求，补全结果按 killmail_id 缓存：
+- 进程内 LRU 保存最近的结果；
+- Redis 保存 zlib 压缩的 JSON，供其他实例与重启后复用；
+- 同一 killmail 的并发请求共享一次计算。
+键中包含 ENRICHED_SCHEMA_VERSION，process_killmail_data 的输出结构变化时递增，旧条目自然失效。
+有降级字段（enrich_degraded）或处理失败的结果不缓存。
+"""
+
+import asyncio
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+import json
+from typing import Any
+import zlib
+
+from nonebot import logger
+
+from ...utils.common.cache import cache as redis_cache
+
+ENRICHED_SCHEMA_VERSION = 2  # 补全结果的结构版本
+ENRICHED_LRU_SIZE = 256  # 进程内保留的条目数
+ENRICHED_REDIS_EXPIRE = 6 * 60 * 60  # Redis 条目过期时间（秒），价格会变化，不宜过长
+ENRICHED_COMPRESS_LEVEL = 6
+
+
+class EnrichedKillmailCache:
+    """按 killmail_id 缓存 process_killmail_data 的结果"""
+
+    def __init__(self, maxsize: int = ENRICHED_LRU_SIZE):
+        self._maxsize = maxsize
+        self._entries: OrderedDict[int, dict[str, Any]] = OrderedDict()
+        self._in_flight: dict[int, asyncio.Task] = {}
+
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def _redis_key(killmail_id: int) -> str:
+        return redis_cache._get_key(f"km_enriched:v{ENRICHED_SCHEMA_VERSION}:{killmail_id}")
+
+    async def get(self, killmail_id: int | str, compute: Callable[[], Awaitable[dict[str, Any]]]) -> dict[str, Any]:
+        """
+        获取补全结果，未缓存时调用 compute 计算
+
+        Args:
+            killmail_id: killmail ID
+            compute: 计算补全结果的协程函数
+
+        Returns:
+            补全结果的浅拷贝，调用方可以直接添加顶层字段
+        """
+        try:
+            killmail_id = int(killmail_id)
+        except (TypeError, ValueError):
+            return await compute()
+
+        result = self._entries.get(killmail_id)
+        if result is not None:
+            self._entries.move_to_end(killmail_id)
+            self.hits += 1
+            return dict(result)
+
+        task = self._in_flight.get(killmail_id)
+        if task is None:
+            task = asyncio.create_task(self._load(killmail_id, compute))
+            self._in_flight[killmail_id] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(killmail_id, None))
+        else:
+            self.coalesced += 1
+        # shield: 某个请求方被取消时不影响其他等待者
+        return dict(await asyncio.shield(task))
+
+    async def _load(self, killmail_id: int, compute: Callable[[], Awaitable[dict[str, Any]]]) -> dict[str, Any]:
+        result = await self._read_redis(killmail_id)
+        if result is not None:
+            self.redis_hits += 1
+            self._remember(killmail_id, result)
+            return result
+
+        self.misses += 1
+        result = await compute()
+        if result and not result.get("enrich_degraded"):
+            self._remember(killmail_id, result)
+            await self._write_redis(killmail_id, result)
+        return result
+
+    def _remember(self, killmail_id: int, result: dict[str, Any]):
+        self._entries[killmail_id] = result
+        self._entries.move_to_end(killmail_id)
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+    async def _read_redis(self, killmail_id: int) -> dict[str, Any] | None:
+        if not redis_cache._initialized:
+            return None
+        try:
+            data = await redis_cache.redis.get(self._redis_key(killmail_id))
+            if data is None:
+                return None
+            return json.loads(zlib.decompress(data))
+        except Exception as e:
+            logger.warning(f"[{killmail_id}] 读取 KM 补全缓存失败: {e}")
+            return None
+
+    async def _write_redis(self, killmail_id: int, result: dict[str, Any]):
+        if not redis_cache._initialized:
+            return
+        try:
+            data = zlib.compress(json.dumps(result, ensure_ascii=False).encode(), ENRICHED_COMPRESS_LEVEL)
+            await redis_cache.redis.set(self._redis_key(killmail_id), data, ex=ENRICHED_REDIS_EXPIRE)
+        except Exception as e:
+            logger.warning(f"[{killmail_id}] 写入 KM 补全缓存失败: {e}")
+
+    def clear(self):
+        """清空进程内条目（Redis 条目随版本号或过期时间失效）"""
+        self._entries.clear()
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "size": len(self._entries),
+            "in_flight": len(self._in_flight),
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
+
+
+enriched_cache = EnrichedKillmailCache()
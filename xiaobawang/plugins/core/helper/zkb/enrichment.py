@@ -0,0 +1,109 @@
+"""
+KM 数据补全依赖图
+
+渲染前需要的名称、物品、价格、星系、天体等查询彼此大多独立，按依赖关系组成一个小图并发执行：
+每个节点在依赖全部完成后立即开始，各自有超时和降级值，某个 ESI 接口变慢或出错只影响对应字段，不再拖住整条推送。
+每个节点的耗时记入 stage_timings（阶段名 enrich.<节点名>）。
+"""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+import time
+from typing import Any
+
+from nonebot import logger
+
+from .timing import stage_timings
+
+ENRICH_DEFAULT_TIMEOUT = 10  # 节点默认超时（秒）
+
+
+class _EnrichNode:
+    __slots__ = ("deps", "fallback", "func", "name", "timeout")
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[..., Awaitable[Any]],
+        deps: tuple[str, ...],
+        timeout: float,
+        fallback: Callable[[], Any],
+    ):
+        self.name = name
+        self.func = func
+        self.deps = deps
+        self.timeout = timeout
+        self.fallback = fallback
+
+
+class EnrichmentGraph:
+    """补全节点的依赖图，节点必须在其依赖之后添加，因此不会成环"""
+
+    def __init__(self):
+        self._nodes: dict[str, _EnrichNode] = {}
+        self.degraded: list[str] = []  # 最近一次 run 中使用了降级值的节点
+
+    def add(
+        self,
+        name: str,
+        func: Callable[..., Awaitable[Any]],
+        *,
+        deps: tuple[str, ...] = (),
+        timeout: float = ENRICH_DEFAULT_TIMEOUT,
+        fallback: Callable[[], Any] = dict,
+    ) -> "EnrichmentGraph":
+        """
+        添加节点
+
+        Args:
+            name: 节点名，也是结果字典的键
+            func: 协程函数，按 deps 的顺序接收依赖节点的结果
+            deps: 依赖的节点名
+            timeout: 超时（秒），只计本节点自身的执行时间
+            fallback: 超时或出错时生成降级值的工厂函数
+        """
+        if name in self._nodes:
+            raise ValueError(f"重复的补全节点: {name}")
+        missing = [dep for dep in deps if dep not in self._nodes]
+        if missing:
+            raise ValueError(f"补全节点 {name} 的依赖尚未添加: {missing}")
+        self._nodes[name] = _EnrichNode(name, func, deps, timeout, fallback)
+        return self
+
+    async def run(self) -> dict[str, Any]:
+        """
+        并发执行全部节点
+
+        Returns:
+            {节点名: 结果或降级值}，不会因单个节点失败而抛出异常
+        """
+        results: dict[str, Any] = {}
+        tasks: dict[str, asyncio.Task] = {}
+        self.degraded = []
+
+        async def run_node(node: _EnrichNode):
+            if node.deps:
+                await asyncio.gather(*(tasks[dep] for dep in node.deps))
+            started = time.perf_counter()
+            try:
+                value = await asyncio.wait_for(node.func(*(results[dep] for dep in node.deps)), node.timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"KM 数据补全 {node.name} 超时 ({node.timeout}s)，使用降级值")
+                value = node.fallback()
+                self.degraded.append(node.name)
+            except Exception as e:
+                logger.warning(f"KM 数据补全 {node.name} 失败，使用降级值: {e}")
+                value = node.fallback()
+                self.degraded.append(node.name)
+            stage_timings.record(f"enrich.{node.name}", time.perf_counter() - started)
+            results[node.name] = value
+
+        # 字典按添加顺序即为拓扑序，依赖的任务总是先创建
+        for name, node in self._nodes.items():
+            tasks[name] = asyncio.create_task(run_node(node))
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+        return results
@@ -0,0 +1,443 @@
+"""
+Killmail 入队日志（追加写分段文件）
+
+所有入队的 killmail 追加到本地分段日志，再交给 worker 消费；
+worker 处理完成后 ack，确认水位持久化到磁盘。重启时从水位之后重放已写入磁盘的条目。
+内存中最多保留 max_in_memory 条，超出部分只在磁盘上，消费到时再按批分页读入。
+
+磁盘读写都不在事件循环中执行：put() 只把条目放入写缓冲，由后台写入任务按批在线程池中追加；
+分页读入、确认水位落盘和删除已确认分段同样在线程池中进行。
+丢失窗口：put() 返回时条目还在写缓冲中，进程在其写入前崩溃会丢失缓冲中的尾部
+（通常是最近一个事件循环周期加一次批量写入耗时内入队的条目）；flush() 返回后的条目不受进程崩溃影响。
+落盘策略：默认每批写入后 flush 到操作系统缓存，已写入的条目在进程崩溃后仍在，掉电可能丢失最后一批；
+fsync=True 时每批写入和确认水位替换前都 fsync，已写入的条目掉电也不丢，代价是每批多一次磁盘同步。
+fsync 不缩短 put() 之后、批量写入之前的窗口。
+
+KillmailPriorityQueue 在此之上按优先级分为高/低两条通道，每条通道各自一份日志。
+条目均为紧凑的 KillmailRecord，磁盘上直接写入其原始 JSON bytes。
+"""
+
+import asyncio
+from collections import deque
+import json
+import os
+from pathlib import Path
+import time
+
+from nonebot import logger
+
+from .clock import km_clock
+from .record import KillmailRecord
+
+ACK_FILE_NAME = "ack"
+SEGMENT_SUFFIX = ".log"
+ACK_FLUSH_INTERVAL = 1.0  # ack 水位最短落盘间隔（秒）
+
+
+class KillmailJournal:
+    """带内存上限的持久化 killmail 队列"""
+
+    def __init__(self, path: Path, max_in_memory: int = 500, segment_size: int = 1000, fsync: bool = False):
+        """
+        Args:
+            path: 日志目录
+            max_in_memory: 内存中最多保留的条目数
+            segment_size: 每个分段文件包含的条目数
+            fsync: 每批写入后是否 fsync
+        """
+        self.path = path
+        self.max_in_memory = max(1, max_in_memory)
+        self.segment_size = max(1, segment_size)
+        self.fsync = fsync
+
+        self._mem: deque[tuple[int, KillmailRecord]] = deque()  # 连续区间 [_next_read, _mem_end) 的条目
+        self._mem_end = 0
+        self._next_read = 0  # 下一个交给 worker 的条目 ID
+        self._next_write = 0  # 下一个写入的条目 ID
+        self._unacked: set[int] = set()  # 已交付未确认的条目
+        self._acked_upto = -1  # 已持久化的确认水位（含）
+        self._last_ack_flush: float = 0
+
+        self._write_buffer: list[tuple[int, bytes]] = []  # 待写入磁盘的 (条目 ID, 行)
+        self._written_upto = -1  # 已写入磁盘的最大条目 ID
+        self._writer_task: asyncio.Task | None = None
+        self._ack_task: asyncio.Task | None = None
+        self._page_lock = asyncio.Lock()
+
+        self._writer = None  # 只在线程池中使用
+        self._writer_segment: int | None = None
+        self._not_empty = asyncio.Event()
+        self._all_done = asyncio.Event()
+        self._all_done.set()
+
+    # ── 生命周期 ─────────────────────────────────────────
+
+    async def open(self) -> int:
+        """
+        打开日志目录并从确认水位恢复
+
+        Returns:
+            需要重放的条目数
+        """
+        self._mem.clear()
+        self._unacked.clear()
+        self._write_buffer.clear()
+
+        self._acked_upto, last_id = await asyncio.to_thread(self._recover)
+        self._written_upto = last_id
+        self._next_read = self._acked_upto + 1
+        self._mem_end = self._next_read
+        self._next_write = last_id + 1
+        await asyncio.to_thread(self._drop_acked_segments, self._acked_upto)
+
+        pending = self.qsize()
+        self._update_events()
+        if pending:
+            logger.info(f"KM 日志: 从确认水位 {self._acked_upto} 恢复，待重放 {pending} 条")
+        return pending
+
+    async def close(self):
+        """写完缓冲、落盘确认水位并关闭写句柄"""
+        await self.flush()
+        if self._ack_task is not None:
+            await asyncio.gather(self._ack_task, return_exceptions=True)
+            self._ack_task = None
+        await self._persist_ack()
+        await asyncio.to_thread(self._close_writer)
+
+    # ── 队列接口 ─────────────────────────────────────────
+
+    def qsize(self) -> int:
+        """尚未交付给 worker 的条目数"""
+        return self._next_write - self._next_read
+
+    def in_memory(self) -> int:
+        """当前驻留内存的条目数"""
+        return len(self._mem)
+
+    def put(self, record: KillmailRecord) -> int:
+        """追加一条 killmail，返回条目 ID；磁盘写入由后台任务按批完成，需要确认已落盘时 await flush()"""
+        entry_id = self._next_write
+        # raw 已是 JSON，直接拼接，不再重新序列化
+        self._write_buffer.append((entry_id, b'{"n":%d,"d":%s}\n' % (entry_id, record.raw)))
+        self._next_write += 1
+        self._schedule_write()
+
+        # 内存只保留连续前缀，一旦溢出，后续条目都留在磁盘上等待分页
+        if self._mem_end == entry_id and len(self._mem) < self.max_in_memory:
+            self._mem.append((entry_id, record))
+            self._mem_end = entry_id + 1
+
+        self._update_events()
+        return entry_id
+
+    def get_nowait(self) -> tuple[int, KillmailRecord] | None:
+        """取出内存中的下一条 killmail，没有时返回 None（只在磁盘上的条目需先 page_in）"""
+        if not self._mem:
+            return None
+
+        entry_id, record = self._mem.popleft()
+        self._next_read = entry_id + 1
+        self._unacked.add(entry_id)
+        self._update_events()
+        return entry_id, record
+
+    async def get(self) -> tuple[int, KillmailRecord]:
+        """取出下一条 killmail，队列为空时等待"""
+        while True:
+            item = self.get_nowait()
+            if item is not None:
+                return item
+            if self.needs_page_in():
+                await self.page_in()
+                continue
+            await self._not_empty.wait()
+
+    def ack(self, entry_id: int):
+        """确认条目已处理完成，确认水位按 ACK_FLUSH_INTERVAL 节流后在后台落盘"""
+        self._unacked.discard(entry_id)
+        self._update_events()
+        if (self._ack_task is None or self._ack_task.done()) and (
+            time.monotonic() - self._last_ack_flush >= ACK_FLUSH_INTERVAL
+        ):
+            self._ack_task = asyncio.create_task(self._persist_ack())
+
+    async def join(self):
+        """等待所有条目被确认"""
+        await self._all_done.wait()
+
+    def needs_page_in(self) -> bool:
+        """是否有待交付的条目只在磁盘上"""
+        return self._next_read < self._next_write and not self._mem
+
+    async def page_in(self):
+        """从磁盘按批读入 [_next_read, ...) 的条目"""
+        async with self._page_lock:
+            if not self.needs_page_in():
+                return
+            start = self._next_read
+            end = min(self._next_write, start + self.max_in_memory)
+            await self.flush()
+            entries = await asyncio.to_thread(self._read_range, start, end)
+            if not entries:
+                # 磁盘数据缺失（被手动删除等），跳过这一段避免死等
+                logger.warning(f"KM 日志: 条目 {start}~{end - 1} 在磁盘上缺失，已跳过")
+                self._next_read = end
+                self._mem_end = end
+            else:
+                self._mem.extend(entries)
+                self._mem_end = entries[-1][0] + 1
+            self._update_events()
+
+    async def flush(self):
+        """等待写缓冲全部写入磁盘"""
+        while self._write_buffer or (self._writer_task is not None and not self._writer_task.done()):
+            self._schedule_write()
+            # shield: 等待方被取消时不中断写入
+            await asyncio.shield(self._writer_task)
+
+    # ── 内部实现 ─────────────────────────────────────────
+
+    def _update_events(self):
+        if self._next_read < self._next_write:
+            self._not_empty.set()
+        else:
+            self._not_empty.clear()
+
+        if self._next_read >= self._next_write and not self._unacked:
+            self._all_done.set()
+        else:
+            self._all_done.clear()
+
+    def _schedule_write(self):
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = asyncio.create_task(self._write_loop())
+
+    async def _write_loop(self):
+        """把写缓冲按批写入分段文件，写入期间新到的条目在下一批写入"""
+        while self._write_buffer:
+            batch, self._write_buffer = self._write_buffer, []
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except OSError as e:
+                logger.error(f"KM 日志: 写入分段失败 ({len(batch)} 条): {e}")
+            self._written_upto = batch[-1][0]
+
+    async def _persist_ack(self):
+        """推进并持久化确认水位，同时删除已完全确认且已写入的分段"""
+        watermark = (min(self._unacked) if self._unacked else self._next_read) - 1
+        if watermark <= self._acked_upto:
+            return
+
+        self._last_ack_flush = time.monotonic()
+        try:
+            await asyncio.to_thread(self._write_ack, watermark)
+        except OSError as e:
+            logger.error(f"KM 日志: 写入确认水位失败: {e}")
+            return
+
+        self._acked_upto = watermark
+        await asyncio.to_thread(self._drop_acked_segments, min(watermark, self._written_upto))
+
+    # ── 磁盘操作（在线程池中执行） ───────────────────────────
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.path / f"{segment:012d}{SEGMENT_SUFFIX}"
+
+    def _list_segments(self) -> list[int]:
+        segments = []
+        for file in self.path.glob(f"*{SEGMENT_SUFFIX}"):
+            try:
+                segments.append(int(file.stem))
+            except ValueError:
+                continue
+        return sorted(segments)
+
+    def _read_segment(self, segment: int, decode: bool = True):
+        """逐条读取分段文件，跳过崩溃时写了一半的行；decode 为 False 时只返回条目 ID"""
+        path = self._segment_path(segment)
+        if not path.exists():
+            return
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    yield entry["n"], KillmailRecord(entry["d"]) if decode else None
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    continue
+
+    def _recover(self) -> tuple[int, int]:
+        """读取确认水位和最后一个条目 ID"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        acked_upto = -1
+        ack_file = self.path / ACK_FILE_NAME
+        if ack_file.exists():
+            try:
+                acked_upto = int(ack_file.read_text(encoding="utf-8").strip() or -1)
+            except ValueError:
+                logger.warning(f"KM 日志确认水位文件损坏，从头重放: {ack_file}")
+
+        last_id = acked_upto
+        segments = self._list_segments()
+        if segments:
+            for entry_id, _ in self._read_segment(segments[-1], decode=False):
+                last_id = max(last_id, entry_id)
+        return acked_upto, last_id
+
+    def _read_range(self, start: int, end: int) -> list[tuple[int, KillmailRecord]]:
+        entries = []
+        for segment in range(start // self.segment_size, (end - 1) // self.segment_size + 1):
+            for entry_id, record in self._read_segment(segment):
+                if start <= entry_id < end:
+                    entries.append((entry_id, record))
+        return entries
+
+    def _write_batch(self, batch: list[tuple[int, bytes]]):
+        for entry_id, line in batch:
+            segment = entry_id // self.segment_size
+            if self._writer_segment != segment:
+                self._close_writer()
+                self._writer = open(self._segment_path(segment), "ab")
+                self._writer_segment = segment
+            self._writer.write(line)
+        self._writer.flush()
+        if self.fsync:
+            os.fsync(self._writer.fileno())
+
+    def _close_writer(self):
+        if self._writer is None:
+            return
+        self._writer.flush()
+        if self.fsync:
+            os.fsync(self._writer.fileno())
+        self._writer.close()
+        self._writer = None
+        self._writer_segment = None
+
+    def _write_ack(self, watermark: int):
+        ack_file = self.path / ACK_FILE_NAME
+        tmp_file = ack_file.with_suffix(".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write(str(watermark))
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_file, ack_file)
+
+    def _drop_acked_segments(self, upto: int):
+        """删除条目全部不超过 upto 的分段"""
+        for segment in self._list_segments():
+            if segment == self._writer_segment:
+                continue
+            if (segment + 1) * self.segment_size - 1 <= upto:
+                try:
+                    self._segment_path(segment).unlink()
+                except OSError:
+                    pass
+
+
+class KillmailPriorityQueue:
+    """
+    高/低两条通道的持久化优先级队列
+
+    高价值且新鲜的 killmail 进入高通道优先处理；
+    低通道有积压时，每连续取 high_burst 条高通道后必取一条低通道，避免饿死。
+    """
+
+    LANES = ("high", "low")
+
+    def __init__(
+        self,
+        path: Path,
+        max_in_memory: int = 500,
+        high_value: float = 8_000_000_000,
+        high_labels: frozenset[str] = frozenset(),
+        max_high_age: float = 3600,
+        high_burst: int = 4,
+        fsync: bool = False,
+    ):
+        """
+        Args:
+            path: 日志根目录，每条通道一个子目录
+            max_in_memory: 每条通道内存中最多保留的条目数
+            high_value: 进入高通道的最低价值
+            high_labels: 带有任一标签即进入高通道
+            max_high_age: 超过该时长（秒）的旧 killmail 一律进入低通道
+            high_burst: 低通道有积压时，最多连续取多少条高通道
+            fsync: 每批写入后是否 fsync
+        """
+        self.high_value = high_value
+        self.high_labels = high_labels
+        self.max_high_age = max_high_age
+        self.high_burst = max(1, high_burst)
+
+        self._lanes = {
+            lane: KillmailJournal(path / lane, max_in_memory=max_in_memory, fsync=fsync) for lane in self.LANES
+        }
+        self._high_streak = 0
+        self._not_empty = asyncio.Event()
+
+    def classify(self, record: KillmailRecord) -> str:
+        """仅依据 zkb 价值、标签和击杀时间判断通道，不做任何外部查询"""
+        if record.timestamp is not None and km_clock.now() - record.timestamp > self.max_high_age:
+            return "low"
+        if record.total_value >= self.high_value:
+            return "high"
+        if self.high_labels.intersection(record.labels):
+            return "high"
+        return "low"
+
+    async def open(self) -> int:
+        return sum(await asyncio.gather(*(journal.open() for journal in self._lanes.values())))
+
+    async def close(self):
+        await asyncio.gather(*(journal.close() for journal in self._lanes.values()))
+
+    def qsize(self, lane: str | None = None) -> int:
+        if lane is not None:
+            return self._lanes[lane].qsize()
+        return sum(journal.qsize() for journal in self._lanes.values())
+
+    def in_memory(self) -> int:
+        return sum(journal.in_memory() for journal in self._lanes.values())
+
+    def put(self, record: KillmailRecord) -> tuple[str, int]:
+        lane = self.classify(record)
+        entry_id = self._lanes[lane].put(record)
+        self._not_empty.set()
+        return lane, entry_id
+
+    def _lane_order(self) -> tuple[str, ...]:
+        if self._high_streak >= self.high_burst and self._lanes["low"].qsize():
+            return "low", "high"
+        return self.LANES
+
+    def get_nowait(self) -> tuple[tuple[str, int], KillmailRecord] | None:
+        for lane in self._lane_order():
+            item = self._lanes[lane].get_nowait()
+            if item is not None:
+                self._high_streak = self._high_streak + 1 if lane == "high" else 0
+                entry_id, record = item
+                return (lane, entry_id), record
+        return None
+
+    async def get(self) -> tuple[tuple[str, int], KillmailRecord]:
+        """按优先级取出下一条，返回 ((通道, 条目 ID), 数据)"""
+        while True:
+            # 应当取的通道只有磁盘上的条目时先分页读入，避免低通道越过高通道
+            lane = next((lane for lane in self._lane_order() if self._lanes[lane].qsize()), None)
+            if lane is not None and self._lanes[lane].needs_page_in():
+                await self._lanes[lane].page_in()
+            item = self.get_nowait()
+            if item is not None:
+                return item
+            if lane is None:
+                self._not_empty.clear()
+                await self._not_empty.wait()
+
+    def ack(self, token: tuple[str, int]):
+        lane, entry_id = token
+        self._lanes[lane].ack(entry_id)
+
+    async def join(self):
+        await asyncio.gather(*(journal.join() for journal in self._lanes.values()))
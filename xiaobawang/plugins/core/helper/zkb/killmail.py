@@ -10,21 +10,31 @@ from ...helper.subscription_v2 import KillmailSubscriptionManagerV2
 from ...utils.render import render_template, templates_path
 from ..message_queue import queue_killmail_message
 from ....bot_info import get_bot_info_data
+from .clock import km_clock
+from .enriched_cache import enriched_cache
 from .processor import KillmailProcessor
+from .record import KillmailRecord
+from .timing import stage_timings
 from .validator_v2 import KillmailValidatorV2
 
 # 限制同时渲染的 KM 图片数量，防止并发过多页面撑死服务器
 _render_semaphore = asyncio.Semaphore(3)
 
+# 达到该价值的击杀跳过消息队列立即推送，同时在 KM 工作队列中走高优先级通道
+IMMEDIATE_PUSH_VALUE = 8_000_000_000
+
 
 class KillmailHelper:
     """Killmail 主处理类，协调验证、处理和发送流程"""
 
+    dry_send = False  # 回放/压测时置为 True，跳过最终投递到消息队列
+
     def __init__(self):
         self.session = get_session()
         self.subscription_manager = KillmailSubscriptionManagerV2(self.session)
         self.validator = KillmailValidatorV2(self.subscription_manager)
         self.processor = KillmailProcessor()
+        self.render_backlog = 0  # 正在等待或进行中的渲染数量
 
     async def get(self, kill_id: int) -> dict:
         """
@@ -36,17 +46,30 @@ class KillmailHelper:
         Returns:
             处理后的 killmail 数据
         """
-        raw_data = await get_zkb_killmail(kill_id)
-        return await self.processor.process_killmail_data(raw_data)
 
-    async def check(self, data: dict[str, Any]):
+        async def compute():
+            return await self.processor.process_killmail_data(await get_zkb_killmail(kill_id))
+
+        return await self._get_enriched(kill_id, compute)
+
+    async def _get_enriched(self, kill_id, compute) -> dict:
+        """经补全缓存获取处理后的数据，并刷新与当前时间相关的字段；回放或跳过投递时不读写缓存，耗时反映真实补全"""
+        if km_clock.replaying or self.dry_send:
+            html_data = await compute()
+        else:
+            html_data = await enriched_cache.get(kill_id, compute)
+        self.processor.refresh_time_difference(html_data)
+        return html_data
+
+    async def check(self, data: dict[str, Any] | KillmailRecord):
         """
         处理接收到的 killmail 数据并检查是否需要推送
 
         Args:
-            data: zkillboard 推送的 killmail 数据
+            data: 紧凑 killmail 记录或 zkillboard 推送的 killmail 数据
         """
-        killmail_id = data.get("killmail_id")
+        record = KillmailRecord.of(data)
+        killmail_id = record.killmail_id
         try:
             if not killmail_id:
                 logger.warning("收到无效的 killmail 数据: 缺少 killmail_id")
@@ -54,10 +77,13 @@ class KillmailHelper:
             logger.debug(f"[{killmail_id}] https://zkillboard.com/kill/{killmail_id}/")
 
             # 验证并匹配订阅
-            matched_sessions = await self.validator.validate_and_match(data)
+            with stage_timings.measure("match"):
+                matched_sessions = await self.validator.validate_and_match(record)
 
             if matched_sessions:
-                await self._send_matched_killmail(killmail_id, data, matched_sessions)
+                # 只有需要渲染时才解码完整 JSON
+                await self._send_matched_killmail(killmail_id, record.data, matched_sessions)
+                record.release()
 
         except Exception as e:
             logger.exception(f"[{killmail_id}]处理 Killmail 失败: {e}")
@@ -67,18 +93,26 @@ class KillmailHelper:
         logger.info(f"[{killmail_id}] 将推送到 {len(matched_sessions)} 个会话")
 
         # 处理 killmail 数据
-        html_data = await self.processor.process_killmail_data(data)
+        with stage_timings.measure("enrich"):
+            html_data = await self._get_enriched(
+                killmail_id, lambda: self.processor.process_killmail_data(data)
+            )
 
         # 渲染图片（限制并发数）
         html_data["bot_info"] = get_bot_info_data()
-        async with _render_semaphore:
-            pic = await render_template(
-                template_path=templates_path / "killmail",
-                template_name="killmail_v3.html.jinja2",
-                data=html_data,
-                width=1060,
-                height=100,
-            )
+        self.render_backlog += 1
+        try:
+            with stage_timings.measure("render"):
+                async with _render_semaphore:
+                    pic = await render_template(
+                        template_path=templates_path / "killmail",
+                        template_name="killmail_v3.html.jinja2",
+                        data=html_data,
+                        width=1060,
+                        height=100,
+                    )
+        finally:
+            self.render_backlog -= 1
 
         tasks = []
         for (platform, bot_id, session_id, session_type, total_value), reasons in matched_sessions.items():
@@ -89,7 +123,8 @@ class KillmailHelper:
             )
 
         if tasks:
-            await asyncio.gather(*tasks, return_exceptions=True)
+            with stage_timings.measure("send"):
+                await asyncio.gather(*tasks, return_exceptions=True)
 
     @classmethod
     async def send_killmail(
@@ -106,6 +141,8 @@ class KillmailHelper:
         """发送击杀邮件到指定会话"""
         try:
             logger.info(f"{session_type}:{session_id}: {reason}")
+            if cls.dry_send:
+                return
 
             await queue_killmail_message(
                 platform=platform,
@@ -115,7 +152,7 @@ class KillmailHelper:
                 pic=pic,
                 reason=reason,
                 kill_id=kill_id,
-                immediate=True if reason == "高价值击杀" or total_value >= 8_000_000_000 else False,
+                immediate=True if reason == "高价值击杀" or total_value >= IMMEDIATE_PUSH_VALUE else False,
             )
 
         except Exception as e:
@@ -1,29 +1,61 @@
 import asyncio
+from collections import OrderedDict, deque
+import json
+from pathlib import Path
+import shutil
+import socket
 import traceback
 import time
 
 from httpx import ReadTimeout
 from nonebot import logger
+from nonebot_plugin_orm import get_session
 
 from ...api.killmail import get_zkb_killmail
-from ...config import plugin_config
+from ...config import DATA_PATH, plugin_config
 from ...utils.common.cache import cache as redis_cache
 from ...utils.common.http_client import get_client
-from .killmail import km
-
-MAX_CONCURRENT = 5   # 同时处理 km.check 的最大并发数
-WORKER_COUNT = 5    # 消费者 worker 数量
-KM_PROCESS_RATE = 3.0  # 每秒最多触发 km.check() 的次数（令牌桶限速）
+from ..message_queue import message_sender
+from ..subscription_v2 import KillmailSubscriptionManagerV2
+from .clock import km_clock
+from .cluster import CLUSTER_LEADER_TTL, KillmailCluster
+from .concurrency import AdaptiveController
+from .journal import KillmailPriorityQueue
+from .killmail import IMMEDIATE_PUSH_VALUE, KillmailHelper, km
+from .record import KillmailRecord
+from .timing import stage_timings
+
+WORKER_COUNT = 5    # 初始消费者 worker 数量（即 km.check 并发数），由自适应控制器调整
+KM_PROCESS_RATE = 3.0  # 初始每秒最多触发 km.check() 的次数（令牌桶限速），由自适应控制器调整
+KM_CONTROL_INTERVAL = 5  # 自适应控制器调整间隔（秒）
+KM_BOUNDS_REFRESH_INTERVAL = 60  # 订阅全局下界兜底刷新间隔（秒），用于感知其他实例的订阅修改
 KM_DEDUP_EXPIRE = 600  # killmail_id 去重缓存有效期（秒）
 KM_DEDUP_PREFIX = "zkb:km_seen:"  # Redis 去重 key 前缀
+KM_DEDUP_BUCKETS = 10  # 进程内去重过滤器的时间分桶数
 QUEUE_DEPTH_LOG_INTERVAL = 30  # 队列深度监控日志最短间隔（秒）
 QUEUE_DEPTH_WARN_THRESHOLD = 200  # 队列积压超过此值时告警
+KM_JOURNAL_PATH = DATA_PATH / "zkb_journal"  # KM 入队日志目录
+KM_PRIORITY_LABELS = frozenset({"isk:10b+", "isk:100b+", "isk:1t+", "extremeisk"})  # 带这些标签直接进入高优先级
+KM_PRIORITY_MAX_AGE = 3600  # 超过该时长（秒）的旧 killmail 不进入高优先级
+KM_PRIORITY_HIGH_BURST = 4  # 低优先级有积压时，最多连续处理多少条高优先级
+KM_REPLAY_JOURNAL_PATH = DATA_PATH / "zkb_replay_journal"  # 回放模式使用的独立队列日志目录，避免混入线上队列
+KM_CLUSTER_JOURNAL_PATH = DATA_PATH / "zkb_cluster_journal"  # 集群模式本地缓冲目录，启动时清空
+KM_CLUSTER_PREFETCH = 2  # 集群模式下本地缓冲上限 = worker 数 × 此倍数，其余留在 Stream 给其他节点
 
 R2Z2_BASE_URL = "https://r2z2.zkillboard.com/ephemeral"  # R2Z2 API 基础地址
 R2Z2_SEQUENCE_KEY = "zkb:r2z2:last_sequence"  # Redis 中持久化 sequence 的 key
 R2Z2_POLL_INTERVAL = 0.1  # 成功拉取后的轮询间隔（秒），对应 10次/秒
 R2Z2_EMPTY_WAIT = 6  # 收到 404 后等待秒数（官方要求最少 6 秒）
 R2Z2_RATE_LIMIT_WAIT = 10  # 收到 429 后等待秒数
+R2Z2_FORBIDDEN_WAIT = 60  # 收到 403 后等待秒数
+R2Z2_MAX_RATE = 10.0  # R2Z2 请求速率上限（次/秒），追赶模式下所有在途请求共享
+R2Z2_PREFETCH_WINDOW = 16  # 追赶模式下同时在途的 sequence 请求数
+R2Z2_CATCHUP_TRIGGER = 20  # 单步轮询连续命中多少次后判定为落后，切换到追赶模式
+
+KM_SOURCES = ("r2z2", "redisQ")  # "both" 模式下并发运行的数据源
+KM_SOURCE_STALL_TIMEOUT = 180  # 数据源超过该时长（秒）没有一次成功响应即判定为停滞并重启
+KM_SOURCE_WATCHDOG_INTERVAL = 30  # 数据源健康检查间隔（秒）
+KM_ARRIVAL_TRACK_SIZE = 5000  # 记录首达来源的 killmail_id 数量上限
 
 
 class _TokenBucket:
@@ -49,6 +81,76 @@ class _TokenBucket:
             else:
                 self._tokens -= 1.0
 
+    def set_rate(self, rate: float):
+        """调整速率，已积累的令牌不超过新的桶容量"""
+        self._rate = rate
+        self._tokens = min(self._tokens, rate)
+
+
+class _DedupFilter:
+    """进程内 killmail_id 去重过滤器，按时间分桶的集合，条目至少保留 expire 秒"""
+
+    def __init__(self, expire: float, buckets: int):
+        self._expire = expire
+        self._span = expire / buckets  # 每个桶覆盖的时长
+        self._buckets: deque[tuple[float, set]] = deque()
+
+    def _rotate(self) -> set:
+        """淘汰过期桶，返回当前写入桶"""
+        now = time.monotonic()
+        while self._buckets and now - self._buckets[0][0] >= self._expire + self._span:
+            self._buckets.popleft()
+        if not self._buckets or now - self._buckets[-1][0] >= self._span:
+            self._buckets.append((now, set()))
+        return self._buckets[-1][1]
+
+    def __contains__(self, killmail_id) -> bool:
+        self._rotate()
+        return any(killmail_id in ids for _, ids in self._buckets)
+
+    def add(self, killmail_id):
+        self._rotate().add(killmail_id)
+
+
+class _SourceStats:
+    """单个数据源的到达与健康统计"""
+
+    def __init__(self):
+        self.received = 0  # 收到的 killmail 条数
+        self.first = 0  # 先于其他数据源到达的条数
+        self.duplicate = 0  # 已由其他数据源送达的条数
+        self.errors = 0  # 请求失败、限流等错误次数
+        self.restarts = 0  # 被健康检查判定停滞后重启的次数
+        self.last_ok = time.monotonic()  # 最近一次成功响应（含无数据的空响应）
+        self.lag: float | None = None  # 首达时距击杀时间的延迟（秒，指数滑动平均）
+        self.behind: float | None = None  # 重复到达时落后首达来源的时长（秒，指数滑动平均）
+
+    @staticmethod
+    def _ewma(old: float | None, value: float) -> float:
+        return value if old is None else old * 0.9 + value * 0.1
+
+    def record_lag(self, seconds: float):
+        self.lag = self._ewma(self.lag, seconds)
+
+    def record_behind(self, seconds: float):
+        self.behind = self._ewma(self.behind, seconds)
+
+    def stalled(self) -> bool:
+        return time.monotonic() - self.last_ok > KM_SOURCE_STALL_TIMEOUT
+
+    def snapshot(self) -> dict:
+        return {
+            "received": self.received,
+            "first": self.first,
+            "duplicate": self.duplicate,
+            "errors": self.errors,
+            "restarts": self.restarts,
+            "healthy": not self.stalled(),
+            "idle_seconds": round(time.monotonic() - self.last_ok, 1),
+            "lag": round(self.lag, 1) if self.lag is not None else None,
+            "behind": round(self.behind, 2) if self.behind is not None else None,
+        }
+
 
 class ZkbListener:
     _instance = None
@@ -67,62 +169,260 @@ class ZkbListener:
             self.max_reconnect_delay = 300  # 最大重连延迟（秒）
 
             # ── 并发 & 队列控制 ──
-            self._semaphore = asyncio.Semaphore(MAX_CONCURRENT)
-            self._queue: asyncio.Queue[dict] = asyncio.Queue()  # 无界队列，所有 km 都会被处理
-            self._workers: list[asyncio.Task] = []
+            self._controller = AdaptiveController(
+                workers=WORKER_COUNT,
+                rate=KM_PROCESS_RATE,
+                min_workers=plugin_config.zkb_workers_min,
+                max_workers=plugin_config.zkb_workers_max,
+                min_rate=plugin_config.zkb_rate_min,
+                max_rate=plugin_config.zkb_rate_max,
+                latency_target=plugin_config.zkb_check_latency_target,
+                backlog_limit=plugin_config.zkb_downstream_backlog_limit,
+            )
+            self._control_task: asyncio.Task | None = None
+            # 持久化优先级队列：按批追加到磁盘日志，worker 处理完 ack，重启后从确认水位重放
+            # 集群模式：leader 发布到 Redis Stream，各节点经消费组领取后放入本地缓冲
+            self._cluster = (
+                KillmailCluster(plugin_config.zkb_cluster_node_id or None) if plugin_config.zkb_cluster else None
+            )
+            self._stream_ids: dict[tuple[str, int], bytes] = {}  # 本地队列条目 -> Stream 条目 ID
+            self._recovered: set[tuple[str, int]] = set()  # 接手/接回的 Stream 条目对应的本地队列条目
+            self._queue = self._create_queue(KM_CLUSTER_JOURNAL_PATH if self._cluster else KM_JOURNAL_PATH)
+            self._replaying = False  # 回放模式：不读写 Redis 去重标记，不限速
+            self._enqueued_at: dict[tuple[str, int], float] = {}  # 分阶段计时开启时，本地队列条目的入队时间
+            self._workers: dict[int, asyncio.Task] = {}
             self._active_tasks: set[asyncio.Task] = set()
             self._last_depth_log: float = 0
             self._stats_deduped: int = 0
+            self._stats_filtered: int = 0
+            self._bounds_task: asyncio.Task | None = None
             self._stats_processed: int = 0
             self._stats_enqueued: int = 0
-            self._rate_limiter = _TokenBucket(KM_PROCESS_RATE)
+            self._rate_limiter = _TokenBucket(self._controller.rate)
+            self._r2z2_rate_limiter = _TokenBucket(R2Z2_MAX_RATE)
+            self._r2z2_pause_until: float = 0  # 429/403 退避截止时间（monotonic）
+
+            # ── 去重 ──
+            self._seen_local = _DedupFilter(KM_DEDUP_EXPIRE, KM_DEDUP_BUCKETS)  # 本进程已入队的 killmail_id
+            self._claim_pending: list[tuple[int | str, bool, asyncio.Future]] = []  # 待合并发送的 Redis 认领
+            self._claim_task: asyncio.Task | None = None
+            # 认领者标识，重启后保持不变，日志重放时可认回本实例崩溃前认领的条目
+            self._claim_owner = (
+                self._cluster.node_id if self._cluster else f"{socket.gethostname()}:{KM_JOURNAL_PATH}"
+            )
+
+            # ── 多数据源 ──
+            self._sources: dict[str, _SourceStats] = {name: _SourceStats() for name in KM_SOURCES}
+            # killmail_id -> (首达来源, 时间)
+            self._first_arrival: OrderedDict[int | str, tuple[str, float]] = OrderedDict()
+            self._reconnect_delays: dict[str, float] = {}  # 各数据源当前的重连延迟，互不影响
 
             self._initialized = True
 
-    # ── 去重：利用 Redis 缓存已见过的 killmail_id ──────────
+    @staticmethod
+    def _create_queue(path: Path) -> KillmailPriorityQueue:
+        return KillmailPriorityQueue(
+            path,
+            max_in_memory=plugin_config.zkb_queue_memory_size,
+            high_value=IMMEDIATE_PUSH_VALUE,
+            high_labels=KM_PRIORITY_LABELS,
+            max_high_age=KM_PRIORITY_MAX_AGE,
+            high_burst=KM_PRIORITY_HIGH_BURST,
+            fsync=plugin_config.zkb_journal_fsync,
+        )
+
+    # ── 去重：进程内过滤器 + Redis 跨实例认领 ──────────────
+
+    async def _claim_km(self, killmail_id: int | str, takeover: bool = False) -> bool:
+        """
+        在 Redis 中认领 killmail_id（SET NX EX 后读回认领者），跨实例去重只需这一次往返。
+        同时就绪的 worker 的认领合并为一次 pipeline，Redis 不可用时视为认领成功。
+
+        Args:
+            killmail_id: killmail ID
+            takeover: 接手宕机节点（或本节点重启前）未确认的条目，原认领者已无法完成处理，直接覆盖认领
 
-    async def _is_km_seen(self, killmail_id: int | str) -> bool:
-        """检查 killmail_id 是否已经处理过（Redis 去重）"""
+        Returns:
+            是否由本实例处理；False 表示其他实例已认领
+        """
+        if not redis_cache._initialized:
+            return True
+        future = asyncio.get_running_loop().create_future()
+        self._claim_pending.append((killmail_id, takeover, future))
+        if self._claim_task is None or self._claim_task.done():
+            self._claim_task = asyncio.create_task(self._flush_claims())
+        return await future
+
+    async def _flush_claims(self):
+        """将积累的认领用 pipeline 发送，发送期间新到的认领在下一轮发送"""
+        while self._claim_pending:
+            await asyncio.sleep(0)  # 让同一轮就绪的 worker 一起认领
+            pending, self._claim_pending = self._claim_pending, []
+            try:
+                pipeline = redis_cache.redis.pipeline(transaction=False)
+                for killmail_id, takeover, _ in pending:
+                    key = redis_cache._get_key(f"{KM_DEDUP_PREFIX}{killmail_id}")
+                    pipeline.set(key, self._claim_owner, nx=not takeover, ex=KM_DEDUP_EXPIRE)
+                    pipeline.get(key)
+                replies = await pipeline.execute()
+                owners = replies[1::2]
+            except Exception as e:
+                logger.warning(f"批量认领 KM 失败 ({len(pending)} 条)，按未认领处理: {e}")
+                owners = [self._claim_owner] * len(pending)
+            for (_, _, future), owner in zip(pending, owners):
+                if isinstance(owner, bytes):
+                    owner = owner.decode()
+                if not future.done():
+                    future.set_result(owner is None or owner == self._claim_owner)
+
+    async def _release_km(self, killmail_id: int | str):
+        """处理失败时释放认领，允许其他实例重新处理"""
+        if not redis_cache._initialized:
+            return
         try:
-            if not redis_cache._initialized:
-                return False
-            key = f"{KM_DEDUP_PREFIX}{killmail_id}"
-            return await redis_cache.exists(key)
-        except Exception:
-            return False
+            await redis_cache.redis.delete(redis_cache._get_key(f"{KM_DEDUP_PREFIX}{killmail_id}"))
+        except Exception as e:
+            logger.warning(f"[{killmail_id}] 释放 KM 认领失败: {e}")
+
+    # ── 入口预过滤：任何订阅都不可能匹配的 km 不入队 ────────
 
-    async def _mark_km_seen(self, killmail_id: int | str):
-        """标记 killmail_id 为已处理"""
+    @staticmethod
+    async def _refresh_ingress_bounds():
         try:
-            if not redis_cache._initialized:
-                return
-            key = f"{KM_DEDUP_PREFIX}{killmail_id}"
-            await redis_cache.set(key, 1, expire=KM_DEDUP_EXPIRE)
-        except Exception:
-            pass
+            async with get_session() as session:
+                await KillmailSubscriptionManagerV2(session).refresh_ingress_bounds()
+        except Exception as e:
+            logger.warning(f"刷新订阅全局下界失败: {e}")
+
+    async def _bounds_refresh_loop(self):
+        """兜底定时刷新订阅全局下界（本进程内的订阅修改会即时刷新）"""
+        while self.running:
+            await asyncio.sleep(KM_BOUNDS_REFRESH_INTERVAL)
+            await self._refresh_ingress_bounds()
+
+    @staticmethod
+    def _passes_ingress_filter(total_value: float, timestamp: float | None = None) -> bool:
+        """
+        按所有启用订阅的最低价值与最大时效判断 killmail 是否可能被匹配，下界未加载时放行
+
+        Args:
+            total_value: zkb 总价值
+            timestamp: 击杀时间戳，未知时不做时效判断
+        """
+        bounds = KillmailSubscriptionManagerV2.ingress_bounds
+        if bounds is None:
+            return True
+        if not bounds["count"]:
+            return False
+
+        if total_value < bounds["min_value"]:
+            return False
+
+        if timestamp is not None and (km_clock.now() - timestamp) // 86400 > bounds["max_age_days"]:
+            return False
+        return True
 
     # ── 入队 ──────────────────────────────────────────────
 
-    async def _enqueue(self, data: dict):
+    def _source_ok(self, source: str):
+        """记录数据源一次成功响应"""
+        stats = self._sources[source]
+        if stats.stalled():
+            logger.info(f"KM 数据源 {source} 已恢复")
+        stats.last_ok = time.monotonic()
+
+    def _source_error(self, source: str):
+        """记录数据源一次错误"""
+        self._sources[source].errors += 1
+
+    async def _backoff(self, source: str):
+        """按数据源等待当前重连延迟，并将该数据源的延迟翻倍（不超过上限）"""
+        delay = self._reconnect_delays.get(source, self.reconnect_delay)
+        await asyncio.sleep(delay)
+        self._reconnect_delays[source] = min(delay * 2, self.max_reconnect_delay)
+
+    def _record_arrival(self, source: str, killmail_id: int | str | None, timestamp: float | None = None) -> bool:
+        """
+        记录 killmail 到达，统计各数据源的首达次数与延迟
+
+        Args:
+            source: 数据源名称
+            killmail_id: killmail ID
+            timestamp: 击杀时间戳，已知时用于计算距击杀时间的延迟
+
+        Returns:
+            是否为首次到达
+        """
+        stats = self._sources.setdefault(source, _SourceStats())
+        stats.received += 1
+        if not killmail_id:
+            return True
+
+        now = time.monotonic()
+        first = self._first_arrival.get(killmail_id)
+        if first is not None:
+            if first[0] != source:
+                stats.duplicate += 1
+                stats.record_behind(now - first[1])
+            return False
+
+        self._first_arrival[killmail_id] = (source, now)
+        if len(self._first_arrival) > KM_ARRIVAL_TRACK_SIZE:
+            self._first_arrival.popitem(last=False)
+        stats.first += 1
+
+        if timestamp is not None:
+            stats.record_lag(km_clock.now() - timestamp)
+        return True
+
+    async def _enqueue(self, record: KillmailRecord, source: str = "r2z2"):
         """
-        将 killmail 数据入队，所有 km 都会保留，由 worker 慢慢消费。
-        仅做 killmail_id 去重过滤。
+        将 killmail 记录写入持久化队列，由 worker 慢慢消费。
+        先做订阅下界预过滤，再做 killmail_id 去重过滤（进程内过滤器，不访问网络；跨实例去重在 worker 中确认）。
+        多个数据源并发运行时，先到达的一份入队，后到的在去重时丢弃。
+
+        Args:
+            record: 入口处构建的紧凑 killmail 记录
+            source: 数据源名称
         """
-        killmail_id = data.get("killmail_id")
+        killmail_id = record.killmail_id
+        self._record_arrival(source, killmail_id, record.timestamp)
 
-        if killmail_id and await self._is_km_seen(killmail_id):
-            self._stats_deduped += 1
-            logger.debug(f"[{killmail_id}] 已处理过，跳过（去重）")
+        if not self._passes_ingress_filter(record.total_value, record.timestamp):
+            self._stats_filtered += 1
             return
 
-        await self._queue.put(data)
+        if killmail_id:
+            with stage_timings.measure("dedup"):
+                seen = killmail_id in self._seen_local
+                if not seen:
+                    self._seen_local.add(killmail_id)
+            if seen:
+                self._stats_deduped += 1
+                logger.debug(f"[{killmail_id}] 已处理过，跳过（去重）")
+                return
+
+        if self._cluster is not None and not self._replaying:
+            try:
+                await self._cluster.publish(record)
+                self._stats_enqueued += 1
+                return
+            except Exception as e:
+                logger.warning(f"[{killmail_id}] 发布到集群 Stream 失败，改为本地处理: {e}")
+
+        token = self._queue.put(record)
+        lane = token[0]
+        if stage_timings.enabled:
+            self._enqueued_at[token] = time.perf_counter()
         self._stats_enqueued += 1
+        if lane == "high":
+            logger.debug(f"[{killmail_id}] 进入高优先级通道")
 
         depth = self._queue.qsize()
         now = time.monotonic()
         if depth >= QUEUE_DEPTH_WARN_THRESHOLD and now - self._last_depth_log > QUEUE_DEPTH_LOG_INTERVAL:
             logger.warning(
-                f"KM 队列积压: {depth} 条待处理 | "
+                f"KM 队列积压: {depth} 条待处理 (内存 {self._queue.in_memory()} 条) | "
                 f"已入队: {self._stats_enqueued}, 已处理: {self._stats_processed}, 去重: {self._stats_deduped}"
             )
             self._last_depth_log = now
@@ -132,34 +432,43 @@ class ZkbListener:
     # ── Worker ────────────────────────────────────────────
 
     async def _worker(self, worker_id: int):
-        """消费者 worker，从队列取出 km 数据并在信号量限制下处理"""
+        """消费者 worker，从队列取出 km 数据并在令牌桶限速下处理；编号超出控制器目标时退出"""
         logger.debug(f"KM Worker-{worker_id} 已启动")
-        while self.running:
+        while self.running and worker_id < self._controller.workers:
             try:
                 try:
-                    data = await asyncio.wait_for(self._queue.get(), timeout=2.0)
+                    entry_id, record = await asyncio.wait_for(self._queue.get(), timeout=2.0)
                 except asyncio.TimeoutError:
                     continue
 
-                killmail_id = data.get("killmail_id")
-
-                # 二次去重
-                if killmail_id and await self._is_km_seen(killmail_id):
-                    self._stats_deduped += 1
-                    self._queue.task_done()
-                    continue
+                killmail_id = record.killmail_id
+                enqueued_at = self._enqueued_at.pop(entry_id, None)
+                if enqueued_at is not None:
+                    stage_timings.record("queue", time.perf_counter() - enqueued_at)
+
+                # 跨实例去重：认领失败说明其他实例已处理；接手的条目覆盖原认领（回放模式跳过）
+                claimed = False
+                if killmail_id and not self._replaying:
+                    with stage_timings.measure("dedup"):
+                        claimed = await self._claim_km(killmail_id, entry_id in self._recovered)
+                    if not claimed:
+                        self._stats_deduped += 1
+                        self._ack(entry_id)
+                        continue
 
-                async with self._semaphore:
-                    await self._rate_limiter.acquire()  # 令牌桶限速
-                    try:
-                        await km.check(data)
-                        self._stats_processed += 1
-                        if killmail_id:
-                            await self._mark_km_seen(killmail_id)
-                    except Exception as e:
-                        logger.error(f"[{killmail_id}] Worker-{worker_id} 处理 killmail 失败: {e}")
+                if not self._replaying:
+                    await self._rate_limiter.acquire()  # 令牌桶限速，回放时全速处理
+                started = time.monotonic()
+                try:
+                    await km.check(record)
+                    self._stats_processed += 1
+                except Exception as e:
+                    logger.error(f"[{killmail_id}] Worker-{worker_id} 处理 killmail 失败: {e}")
+                    if claimed:
+                        await self._release_km(killmail_id)
+                self._controller.record_latency(time.monotonic() - started)
 
-                self._queue.task_done()
+                self._ack(entry_id)
 
             except asyncio.CancelledError:
                 logger.debug(f"KM Worker-{worker_id} 被取消")
@@ -169,12 +478,67 @@ class ZkbListener:
 
         logger.debug(f"KM Worker-{worker_id} 已退出")
 
+    def _ack(self, token: tuple[str, int]):
+        """确认本地队列条目，集群模式下同时确认对应的 Stream 条目"""
+        self._queue.ack(token)
+        stream_id = self._stream_ids.pop(token, None)
+        self._recovered.discard(token)
+        if stream_id is not None:
+            self._cluster.ack(stream_id)
+
+    def _scale_workers(self):
+        """按控制器目标补齐 worker，多余的 worker 会在取下一条前自行退出"""
+        for worker_id, task in list(self._workers.items()):
+            if task.done():
+                del self._workers[worker_id]
+        for worker_id in range(self._controller.workers):
+            if worker_id not in self._workers:
+                self._workers[worker_id] = asyncio.create_task(self._worker(worker_id))
+
+    async def _control_loop(self):
+        """定时根据耗时、队列深度和下游积压调整并发与速率"""
+        while self.running:
+            await asyncio.sleep(KM_CONTROL_INTERVAL)
+            before = (self._controller.workers, self._controller.rate)
+            decision = self._controller.adjust(
+                queue_depth=self._queue.qsize(),
+                downstream_backlog=km.render_backlog + message_sender.pending_count(),
+            )
+            self._rate_limiter.set_rate(self._controller.rate)
+            self._scale_workers()
+            if before != (self._controller.workers, self._controller.rate):
+                logger.info(
+                    f"KM 并发调整 [{decision['action']}]: workers={decision['workers']}, rate={decision['rate']}/s | "
+                    f"p90={decision['p90_latency']}s, 队列={decision['queue_depth']}, "
+                    f"下游积压={decision['downstream_backlog']}"
+                )
+
     def _start_workers(self):
         """启动 worker 池"""
-        for i in range(WORKER_COUNT):
-            task = asyncio.create_task(self._worker(i))
-            self._workers.append(task)
-        logger.info(f"已启动 {WORKER_COUNT} 个 KM Worker，最大并发={MAX_CONCURRENT}")
+        self._scale_workers()
+        self._control_task = asyncio.create_task(self._control_loop())
+        self._bounds_task = asyncio.create_task(self._bounds_refresh_loop())
+        logger.info(f"已启动 {self._controller.workers} 个 KM Worker，限速 {self._controller.rate}/s")
+
+    def get_stats(self) -> dict:
+        """监听器运行状态与自适应控制器当前决策"""
+        return {
+            "active": self.active,
+            "method": plugin_config.zkb_listener_method,
+            "enqueued": self._stats_enqueued,
+            "processed": self._stats_processed,
+            "deduped": self._stats_deduped,
+            "filtered": self._stats_filtered,
+            "ingress_bounds": KillmailSubscriptionManagerV2.ingress_bounds,
+            "queue_depth": self._queue.qsize(),
+            "queue_high": self._queue.qsize("high"),
+            "queue_in_memory": self._queue.in_memory(),
+            "render_backlog": km.render_backlog,
+            "send_backlog": message_sender.pending_count(),
+            "controller": self._controller.snapshot(),
+            "sources": {name: stats.snapshot() for name, stats in self._sources.items()},
+            "cluster": self._cluster.snapshot() if self._cluster is not None else None,
+        }
 
     async def _stop_workers(self):
         """优雅停止所有 worker"""
@@ -182,23 +546,43 @@ class ZkbListener:
             await asyncio.wait_for(self._queue.join(), timeout=30)
         except asyncio.TimeoutError:
             remaining = self._queue.qsize()
-            logger.warning(f"等待队列排空超时，剩余 {remaining} 条未处理")
+            logger.warning(f"等待队列排空超时，剩余 {remaining} 条未处理，已保留在日志中，下次启动时继续处理")
+
+        for task in (self._control_task, self._bounds_task):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._control_task = None
+        self._bounds_task = None
 
-        for task in self._workers:
+        for task in self._workers.values():
             task.cancel()
         if self._workers:
-            await asyncio.gather(*self._workers, return_exceptions=True)
+            await asyncio.gather(*self._workers.values(), return_exceptions=True)
         self._workers.clear()
 
+        if self._claim_task is not None:
+            await asyncio.gather(self._claim_task, return_exceptions=True)
+            self._claim_task = None
+
+        if self._cluster is not None:
+            await self._cluster.flush_acks()
+            await self._cluster.resign()
+            self._stream_ids.clear()
+            self._recovered.clear()
+
         for task in self._active_tasks:
             task.cancel()
         if self._active_tasks:
             await asyncio.gather(*self._active_tasks, return_exceptions=True)
         self._active_tasks.clear()
 
+        await self._queue.close()
+
         logger.info(
             f"KM Workers 已全部停止 | "
-            f"已入队: {self._stats_enqueued}, 已处理: {self._stats_processed}, 去重: {self._stats_deduped}"
+            f"已入队: {self._stats_enqueued}, 已处理: {self._stats_processed}, 去重: {self._stats_deduped}, "
+            f"预过滤: {self._stats_filtered}"
         )
 
     # ── R2Z2 序列号持久化 ─────────────────────────────────
@@ -224,19 +608,128 @@ class ZkbListener:
 
     # ── R2Z2 监听器 ──────────────────────────────────────
 
+    @staticmethod
+    def _parse_r2z2_payload(raw: dict) -> KillmailRecord:
+        """
+        R2Z2 格式转换：将 esi 展开到顶层，保留 zkb，并构建紧凑记录
+        R2Z2: { killmail_id, hash, esi: { attackers, killmail_id, ... }, zkb: {...}, ... }
+        目标: { attackers, killmail_id, killmail_time, solar_system_id, victim, zkb }
+        """
+        esi_data = raw.get("esi", {})
+        data = {**esi_data}
+        if "zkb" in raw:
+            data["zkb"] = raw["zkb"]
+        # 确保顶层有 killmail_id
+        if "killmail_id" not in data and "killmail_id" in raw:
+            data["killmail_id"] = raw["killmail_id"]
+        return KillmailRecord(data)
+
+    async def _r2z2_fetch(self, client, sequence: int) -> tuple[int | None, dict | None]:
+        """
+        追赶模式下拉取单个 sequence，遵守共享的速率上限与 429/403 退避
+
+        Returns:
+            (状态码, 原始数据)；网络错误时状态码为 None
+        """
+        while self.running:
+            wait = self._r2z2_pause_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            await self._r2z2_rate_limiter.acquire()
+            try:
+                r = await client.get(f"{R2Z2_BASE_URL}/{sequence}.json", timeout=15)
+            except Exception as e:
+                logger.warning(f"R2Z2: 追赶模式请求 {sequence}.json 失败: {e}")
+                self._source_error("r2z2")
+                return None, None
+
+            if r.status_code == 429:
+                self._source_error("r2z2")
+                logger.warning(f"R2Z2: 追赶模式触发限流 (429)，暂停 {R2Z2_RATE_LIMIT_WAIT} 秒")
+                self._r2z2_pause_until = max(self._r2z2_pause_until, time.monotonic() + R2Z2_RATE_LIMIT_WAIT)
+                continue
+
+            if r.status_code == 403:
+                self._source_error("r2z2")
+                logger.error(f"R2Z2: 追赶模式访问被拒绝 (403)，暂停 {R2Z2_FORBIDDEN_WAIT} 秒")
+                self._r2z2_pause_until = max(self._r2z2_pause_until, time.monotonic() + R2Z2_FORBIDDEN_WAIT)
+                continue
+
+            if r.status_code == 404:
+                self._source_ok("r2z2")
+                return 404, None
+
+            try:
+                r.raise_for_status()
+                raw = r.json()
+            except Exception as e:
+                logger.warning(f"R2Z2: 追赶模式解析 {sequence}.json 失败: {e}")
+                self._source_error("r2z2")
+                return None, None
+            self._source_ok("r2z2")
+            return r.status_code, raw
+
+        return None, None
+
+    async def _r2z2_catch_up(self, client, sequence: int) -> tuple[int, bool]:
+        """
+        追赶模式：保持 R2Z2_PREFETCH_WINDOW 个 sequence 请求同时在途，
+        按 sequence 顺序交付给 _enqueue（以 sequence 为键的任务表即重排缓冲区）。
+        队首 sequence 返回 404 或出错时退出，交还单步轮询。
+
+        Returns:
+            (下一个待拉取的 sequence, 是否因队首 404 退出)
+        """
+        logger.info(f"R2Z2: 进入追赶模式，起始 sequence = {sequence}，窗口 = {R2Z2_PREFETCH_WINDOW}")
+        pending: dict[int, asyncio.Task] = {}
+        next_issue = sequence
+        delivered = 0
+        status = None
+
+        try:
+            while self.running:
+                while len(pending) < R2Z2_PREFETCH_WINDOW:
+                    pending[next_issue] = asyncio.create_task(self._r2z2_fetch(client, next_issue))
+                    next_issue += 1
+
+                status, raw = await pending.pop(sequence)
+                if status != 200 or raw is None:
+                    break
+
+                await self._enqueue(self._parse_r2z2_payload(raw), source="r2z2")
+                delivered += 1
+
+                if sequence % 10 == 0:
+                    await self._save_sequence(sequence)
+                sequence += 1
+        finally:
+            for task in pending.values():
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending.values(), return_exceptions=True)
+
+        logger.info(f"R2Z2: 退出追赶模式，共交付 {delivered} 条，当前 sequence = {sequence}")
+        return sequence, status == 404
+
     async def _start_r2z2(self):
         """
         R2Z2 Ephemeral API 监听器
         基于递增 sequence_id 轮询 Cloudflare R2 Bucket 获取 killmail
         参考: https://github.com/zKillboard/zKillboard/wiki/API-(R2Z2)
+
+        重启续传或连续命中时切换到追赶模式并发预取，追到队首（404）后回到单步轮询
         """
         client = get_client()
         sequence: int | None = None
+        consecutive_hits = 0
 
         # 尝试从 Redis 恢复上次的 sequence（断点续传）
         saved_seq = await self._get_saved_sequence()
         if saved_seq is not None:
             sequence = saved_seq
+            consecutive_hits = R2Z2_CATCHUP_TRIGGER  # 续传时通常有积压，直接进入追赶模式
             logger.info(f"R2Z2: 从 Redis 恢复 sequence = {sequence}")
 
         while self.running:
@@ -254,63 +747,69 @@ class ZkbListener:
                         logger.info(f"R2Z2: 获取起始 sequence = {sequence}")
                     except Exception as e:
                         logger.error(f"R2Z2: 获取 sequence.json 失败: {e}")
-                        await asyncio.sleep(self.reconnect_delay)
-                        self.reconnect_delay = min(self.reconnect_delay * 2, self.max_reconnect_delay)
+                        self._source_error("r2z2")
+                        await self._backoff("r2z2")
                         continue
 
+                # 连续命中说明落后于队首，切换到追赶模式
+                if consecutive_hits >= R2Z2_CATCHUP_TRIGGER:
+                    consecutive_hits = 0
+                    sequence, at_head = await self._r2z2_catch_up(client, sequence)
+                    if at_head:
+                        # 队首刚返回 404，同样等待至少 6 秒再单步轮询
+                        await asyncio.sleep(R2Z2_EMPTY_WAIT)
+                    continue
+
                 # 拉取当前 sequence 的 killmail
                 try:
                     r = await client.get(f"{R2Z2_BASE_URL}/{sequence}.json", timeout=15)
                 except ReadTimeout:
                     logger.warning(f"R2Z2: 请求 {sequence}.json 超时")
+                    self._source_error("r2z2")
                     await asyncio.sleep(R2Z2_EMPTY_WAIT)
                     continue
                 except Exception as e:
                     logger.error(f"R2Z2: 请求 {sequence}.json 网络错误: {e}")
-                    await asyncio.sleep(self.reconnect_delay)
-                    self.reconnect_delay = min(self.reconnect_delay * 2, self.max_reconnect_delay)
+                    self._source_error("r2z2")
+                    await self._backoff("r2z2")
                     continue
 
                 if r.status_code == 404:
                     # 没有更多 killmail，等待至少 6 秒
+                    self._source_ok("r2z2")
+                    consecutive_hits = 0
                     await asyncio.sleep(R2Z2_EMPTY_WAIT)
                     continue
 
                 if r.status_code == 429:
                     # 触发限流
+                    self._source_error("r2z2")
+                    consecutive_hits = 0
                     logger.warning(f"R2Z2: 触发限流 (429)，等待 {R2Z2_RATE_LIMIT_WAIT} 秒")
                     await asyncio.sleep(R2Z2_RATE_LIMIT_WAIT)
                     continue
 
                 if r.status_code == 403:
-                    logger.error("R2Z2: 访问被拒绝 (403)，可能因轮询过快被封禁，60 秒后重试")
-                    await asyncio.sleep(60)
+                    self._source_error("r2z2")
+                    consecutive_hits = 0
+                    logger.error(f"R2Z2: 访问被拒绝 (403)，可能因轮询过快被封禁，{R2Z2_FORBIDDEN_WAIT} 秒后重试")
+                    await asyncio.sleep(R2Z2_FORBIDDEN_WAIT)
                     continue
 
                 r.raise_for_status()
                 raw = r.json()
+                self._source_ok("r2z2")
                 # logger.debug(raw)
 
-                # R2Z2 格式转换：将 esi 展开到顶层，保留 zkb
-                # R2Z2: { killmail_id, hash, esi: { attackers, killmail_id, ... }, zkb: {...}, ... }
-                # 目标: { attackers, killmail_id, killmail_time, solar_system_id, victim, zkb }
-
-                esi_data = raw.get("esi", {})
-                data = {**esi_data}
-                if "zkb" in raw:
-                    data["zkb"] = raw["zkb"]
-                # 确保顶层有 killmail_id
-                if "killmail_id" not in data and "killmail_id" in raw:
-                    data["killmail_id"] = raw["killmail_id"]
-
                 # 入队处理
-                await self._enqueue(data)
+                await self._enqueue(self._parse_r2z2_payload(raw), source="r2z2")
 
                 if sequence % 10 == 0:
                     await self._save_sequence(sequence)
 
                 # 成功，重置重连延迟
-                self.reconnect_delay = 5
+                self._reconnect_delays.pop("r2z2", None)
+                consecutive_hits += 1
 
                 # 递增 sequence 并短暂等待（官方建议 10次/秒）
                 sequence += 1
@@ -324,9 +823,10 @@ class ZkbListener:
 
             except Exception as e:
                 logger.error(f"R2Z2: 未知错误: {e}\n{traceback.format_exc()}")
+                self._source_error("r2z2")
                 sequence = None
-                await asyncio.sleep(self.reconnect_delay)
-                self.reconnect_delay = min(self.reconnect_delay * 2, self.max_reconnect_delay)
+                consecutive_hits = 0
+                await self._backoff("r2z2")
 
         # 正常退出时保存 sequence
         if sequence is not None:
@@ -335,6 +835,14 @@ class ZkbListener:
 
     # ── RedisQ 监听器 ────────────────────────────────────
 
+    @staticmethod
+    def _package_value(package: dict) -> float:
+        """RedisQ package 中的 zkb 总价值，无法解析时视为无穷大（放行）"""
+        try:
+            return float((package.get("zkb") or {}).get("totalValue", 0))
+        except (TypeError, ValueError):
+            return float("inf")
+
     async def _start_redis_q(self):
         """redisQ 监听器"""
         client = get_client()
@@ -345,26 +853,271 @@ class ZkbListener:
                 # https://github.com/zKillboard/RedisQ?tab=readme-ov-file#limitations
                 if r.status_code == 429:
                     logger.warning("请求过于频繁, https://github.com/zKillboard/RedisQ?tab=readme-ov-file#limitations")
+                    self._source_error("redisQ")
                     await asyncio.sleep(5)
                     continue
 
                 r.raise_for_status()
+                self._source_ok("redisQ")
+                self._reconnect_delays.pop("redisQ", None)
                 data = r.json().get("package", None)
-                if data:
-                    zkb_data = await get_zkb_killmail(data.get("killID", 0))
+                killmail_id = data.get("killID") if data else None
+                if data and not self._passes_ingress_filter(self._package_value(data)):
+                    # 价值已低于所有订阅下界，无需再拉取完整 killmail
+                    self._record_arrival("redisQ", killmail_id)
+                    self._stats_filtered += 1
+                elif killmail_id and killmail_id in self._seen_local:
+                    # 已由其他数据源送达，无需再拉取完整 killmail
+                    self._record_arrival("redisQ", killmail_id)
+                    self._stats_deduped += 1
+                elif data:
+                    zkb_data = await get_zkb_killmail(killmail_id or 0)
                     zkb_data["zkb"] = data.get("zkb")
-                    await self._enqueue(zkb_data)
+                    await self._enqueue(KillmailRecord(zkb_data), source="redisQ")
                 else:
                     await asyncio.sleep(5)
 
             except ReadTimeout:
                 logger.warning("请求超时")
+                self._source_error("redisQ")
                 await asyncio.sleep(5)
 
             except Exception as e:
                 logger.error(f"获取 redisQ 连接失败: {e}\n{traceback.format_exc()}")
+                self._source_error("redisQ")
+                await self._backoff("redisQ")
+
+    async def _start_multi_source(self):
+        """
+        多数据源模式：R2Z2 与 RedisQ 并发写入同一队列，先到达者入队，后到者去重丢弃。
+        定时检查各数据源，长时间无成功响应或任务意外退出时重启该数据源，其余数据源照常供数。
+        """
+        runners = {"r2z2": self._start_r2z2, "redisQ": self._start_redis_q}
+        tasks = {name: asyncio.create_task(runner()) for name, runner in runners.items()}
+        try:
+            while self.running:
+                await asyncio.sleep(KM_SOURCE_WATCHDOG_INTERVAL)
+                if not self.running:
+                    break
+                for name, task in tasks.items():
+                    stats = self._sources[name]
+                    if not task.done() and not stats.stalled():
+                        continue
+                    reason = "意外退出" if task.done() else f"超过 {KM_SOURCE_STALL_TIMEOUT} 秒无成功响应"
+                    logger.warning(f"KM 数据源 {name} {reason}，由其他数据源继续供数并重启 {name}")
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    stats.restarts += 1
+                    stats.last_ok = time.monotonic()  # 给重启后的数据源一个完整的超时窗口
+                    self._reconnect_delays.pop(name, None)
+                    tasks[name] = asyncio.create_task(runners[name]())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+    # ── 回放模式 ─────────────────────────────────────────
+
+    @staticmethod
+    def _read_replay_file(path: Path):
+        """逐行读取 JSONL，兼容 R2Z2 原始格式与已展开的 killmail"""
+        with open(path, encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    payload = json.loads(line)
+                except ValueError:
+                    logger.warning(f"KM 回放: 第 {line_no} 行不是合法 JSON，已跳过")
+                    continue
+                if "esi" in payload:
+                    yield ZkbListener._parse_r2z2_payload(payload)
+                else:
+                    yield KillmailRecord(payload)
+
+    async def _start_replay(self, path: Path, speed: float) -> int:
+        """
+        按击杀时间把 JSONL 中的 killmail 送入队列
+
+        Args:
+            path: JSONL 文件路径，每行一个 R2Z2 payload
+            speed: 相对真实时间的倍速，0 表示不限速
+
+        Returns:
+            读取的条数
+        """
+        started = time.monotonic()
+        first_ts: float | None = None
+        count = 0
+        for record in self._read_replay_file(path):
+            if not self.running:
+                break
+            if speed > 0 and record.timestamp is not None:
+                if first_ts is None:
+                    first_ts = record.timestamp
+                delay = (record.timestamp - first_ts) / speed - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            km_clock.observe(record.timestamp)
+            await self._enqueue(record, source="replay")
+            count += 1
+            # 不限速时也让出事件循环，worker 才能边读边消费
+            await asyncio.sleep(0)
+        return count
+
+    async def replay(self, path: Path, speed: float = 0, dry_send: bool = True) -> dict | None:
+        """
+        离线回放：从本地 JSONL 驱动完整流水线（预过滤、去重、匹配、数据处理、渲染、投递），
+        结束后汇报吞吐量和分阶段耗时。使用独立的队列日志，不读写 Redis 去重标记与 R2Z2 sequence。
+
+        Args:
+            path: JSONL 文件路径，每行一个 R2Z2 payload
+            speed: 相对真实时间的倍速，1 为实时，0 为尽可能快
+            dry_send: 为 True 时跳过最终投递
+
+        Returns:
+            回放报告；监听器运行中时返回 None
+        """
+        if self.active:
+            logger.warning("Killmail 监听器运行中，无法开始回放")
+            return None
+        if not await asyncio.to_thread(path.exists):
+            logger.error(f"KM 回放: 文件不存在: {path}")
+            return None
+
+        logger.info(f"KM 回放: {path} (倍速: {speed or '不限'}, 跳过投递: {dry_send})")
+        live_queue = self._queue
+        shutil.rmtree(KM_REPLAY_JOURNAL_PATH, ignore_errors=True)
+        self._queue = self._create_queue(KM_REPLAY_JOURNAL_PATH)
+        self._seen_local = _DedupFilter(KM_DEDUP_EXPIRE, KM_DEDUP_BUCKETS)
+        self._replaying = True
+        self.running = True
+        self.active = True
+        self._stats_enqueued = 0
+        self._stats_deduped = 0
+        self._stats_processed = 0
+        self._stats_filtered = 0
+        self._sources = {}
+        self._first_arrival.clear()
+        self._enqueued_at.clear()
+        km_clock.start_replay(speed)
+        stage_timings.reset()
+        stage_timings.enabled = True
+        KillmailHelper.dry_send = dry_send
+
+        read = 0
+        started = time.monotonic()
+        try:
+            await self._refresh_ingress_bounds()
+            await self._queue.open()
+            self._start_workers()
+            read = await self._start_replay(path, speed)
+            await self._queue.join()
+        finally:
+            elapsed = time.monotonic() - started
+            self.running = False
+            self.active = False
+            await self._stop_workers()
+            self._queue = live_queue
+            self._seen_local = _DedupFilter(KM_DEDUP_EXPIRE, KM_DEDUP_BUCKETS)
+            self._replaying = False
+            self._enqueued_at.clear()
+            km_clock.stop_replay()
+            stage_timings.enabled = False
+            KillmailHelper.dry_send = False
+            shutil.rmtree(KM_REPLAY_JOURNAL_PATH, ignore_errors=True)
+
+        report = {
+            "file": str(path),
+            "speed": speed,
+            "dry_send": dry_send,
+            "read": read,
+            "enqueued": self._stats_enqueued,
+            "processed": self._stats_processed,
+            "deduped": self._stats_deduped,
+            "filtered": self._stats_filtered,
+            "elapsed": round(elapsed, 2),
+            "throughput": round(self._stats_processed / elapsed, 2) if elapsed > 0 else 0,
+            "stages": stage_timings.summary(),
+        }
+        logger.info(f"KM 回放完成: {report}")
+        return report
+
+    # ── 集群模式 ─────────────────────────────────────────
+
+    async def _run_source(self, method: str):
+        """运行指定的数据源"""
+        if method == "redisQ":
+            await self._start_redis_q()
+        elif method == "r2z2":
+            await self._start_r2z2()
+        elif method == "both":
+            await self._start_multi_source()
+
+    async def _cluster_leader_loop(self, method: str):
+        """竞选并续约 leader，成为 leader 时运行数据源，失去租约时立即停止"""
+        source_task: asyncio.Task | None = None
+        try:
+            while self.running:
+                try:
+                    leading = await self._cluster.try_lead()
+                except Exception as e:
+                    logger.warning(f"KM 集群: leader 续约失败，停止拉取: {e}")
+                    self._cluster.is_leader = False
+                    leading = False
+
+                if leading and (source_task is None or source_task.done()):
+                    logger.info(f"KM 集群: 节点 {self._cluster.node_id} 成为 leader，开始拉取 ({method})")
+                    source_task = asyncio.create_task(self._run_source(method))
+                elif not leading and source_task is not None:
+                    logger.warning(f"KM 集群: 节点 {self._cluster.node_id} 失去 leader 租约，停止拉取")
+                    source_task.cancel()
+                    await asyncio.gather(source_task, return_exceptions=True)
+                    source_task = None
+
+                await asyncio.sleep(CLUSTER_LEADER_TTL / 3)
+        finally:
+            if source_task is not None:
+                source_task.cancel()
+                await asyncio.gather(source_task, return_exceptions=True)
+            await self._cluster.resign()
+
+    async def _cluster_consume_loop(self):
+        """经消费组领取 killmail 放入本地缓冲，缓冲满时不再领取，让其他节点分摊"""
+        while self.running:
+            try:
+                await self._cluster.flush_acks()
+                capacity = self._controller.workers * KM_CLUSTER_PREFETCH - self._queue.qsize()
+                if capacity <= 0:
+                    await asyncio.sleep(0.2)
+                    continue
+
+                for stream_id, record, recovered in await self._cluster.read(capacity):
+                    token = self._queue.put(record)
+                    self._stream_ids[token] = stream_id
+                    if recovered:
+                        self._recovered.add(token)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"KM 集群: 领取 killmail 失败: {e}")
                 await asyncio.sleep(self.reconnect_delay)
-                self.reconnect_delay = min(self.reconnect_delay * 2, self.max_reconnect_delay)
+
+    async def _start_cluster(self, method: str) -> bool:
+        """集群模式主循环：leader 选举与消费并行运行"""
+        if not redis_cache._initialized:
+            logger.error("KM 集群模式需要 Redis")
+            return False
+        try:
+            await self._cluster.ensure_group()
+        except Exception as e:
+            logger.error(f"KM 集群: 创建消费组失败: {e}")
+            return False
+
+        logger.info(f"KM 集群: 节点 {self._cluster.node_id} 已加入")
+        await asyncio.gather(self._cluster_leader_loop(method), self._cluster_consume_loop())
+        return True
 
     # ── 生命周期 ─────────────────────────────────────────
 
@@ -375,7 +1128,11 @@ class ZkbListener:
             return False
 
         method = plugin_config.zkb_listener_method
-        logger.info(f"正在启动 Killmail 监听器 (模式: {method})...")
+        if method not in ("r2z2", "redisQ", "both"):
+            logger.error(f"未知的监听模式: {method}，支持的模式: r2z2, redisQ, both")
+            return False
+
+        logger.info(f"正在启动 Killmail 监听器 (模式: {method}{', 集群' if self._cluster else ''})...")
         self.running = True
         self.active = True
 
@@ -383,19 +1140,30 @@ class ZkbListener:
         self._stats_enqueued = 0
         self._stats_deduped = 0
         self._stats_processed = 0
+        self._stats_filtered = 0
+        self._sources = {name: _SourceStats() for name in KM_SOURCES}
+        self._first_arrival.clear()
+
+        # 加载订阅全局下界，用于入队前预过滤
+        await self._refresh_ingress_bounds()
+
+        # 打开持久化队列，重放上次未确认的 killmail
+        # 集群模式下以 Stream 中未确认的条目为准，本地缓冲直接清空
+        if self._cluster is not None:
+            shutil.rmtree(KM_CLUSTER_JOURNAL_PATH, ignore_errors=True)
+            self._stream_ids.clear()
+            self._recovered.clear()
+        await self._queue.open()
 
         # 启动 worker 池
         self._start_workers()
 
-        if method == "redisQ":
-            await self._start_redis_q()
-        elif method == "r2z2":
-            await self._start_r2z2()
+        if self._cluster is not None:
+            if not await self._start_cluster(method):
+                await self.stop()
+                return False
         else:
-            logger.error(f"未知的监听模式: {method}，支持的模式: r2z2, redisQ")
-            self.running = False
-            self.active = False
-            return False
+            await self._run_source(method)
         return True
 
     async def stop(self):
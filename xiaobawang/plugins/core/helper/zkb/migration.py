@@ -18,6 +18,7 @@ from xiaobawang.plugins.core.db.models.killmail import (
     KillmailHighValueSubscription,
     KillmailSubscription,
 )
+from xiaobawang.plugins.core.helper.subscription_cache import subscription_cache
 
 
 async def migrate_high_value_subscriptions(session: AsyncSession) -> tuple[int, int]:
@@ -261,6 +262,8 @@ async def migrate_all_subscriptions(session: AsyncSession) -> dict[str, Any]:
         result["total_success"] = hv_success + cond_success
         result["total_fail"] = hv_fail + cond_fail
         result["end_time"] = datetime.now()
+        if result["total_success"]:
+            await subscription_cache.bump()
 
         logger.info("=" * 50)
         logger.info("迁移完成!")
@@ -7,12 +7,26 @@ import math
 from typing import Any
 
 from nonebot import logger
+import numpy as np
 
+from xiaobawang.plugins.sde.celestials import celestials, format_distance
 from xiaobawang.plugins.sde.oper import sde_search
 
 from ...api.esi.market import market
 from ...api.esi.universe import esi_client
 from ...utils.common import clean_colored_text, is_blueprint
+from ..universe import get_system_info
+from .enrichment import EnrichmentGraph
+
+ENRICH_ESI_TIMEOUT = 10  # 名称、星系等必需 ESI 查询的超时（秒）
+ENRICH_PRICE_TIMEOUT = 5  # 市场价格查询超时（秒），超时不显示价格
+ENRICH_SDE_TIMEOUT = 5  # 本地 SDE 查询超时（秒）
+ENRICH_DETAIL_TIMEOUT = 3  # 头衔、最近天体等次要信息的超时（秒）
+
+LARGE_FLEET_THRESHOLD = 200  # 攻击者超过该数量时走大舰队聚合路径
+LARGE_FLEET_TOP_ATTACKERS = 50  # 大舰队只完整格式化伤害最高的攻击者（模板最多展示 20 名）
+LARGE_FLEET_TOP_GROUPS = 30  # 大舰队势力/舰船统计保留的分组数，其余合并为一行
+PLACEHOLDER_ICON = "https://images.newdoublex.space/types/670/icon?size=64"
 
 
 def _format_isk(value: float) -> str:
@@ -99,35 +113,103 @@ class KillmailProcessor:
             victim_items = victim.get("items", [])
             collect_item_ids(victim_items)
 
-            entity_names = {}
-            system_info = {}
-            item_names = {}
-            type_categories: dict[int, int] = {}
-
-            # 批量查询名称
-            if ids_to_query:
-                names_data = await esi_client.get_names(list(ids_to_query))
-
-                for category, items in names_data.items():
-                    for entity_id, name in items.items():
-                        entity_names[int(entity_id)] = {"category": category, "name": name}
+            ids_list = list(ids_to_query)
+            type_ids_list = list(type_ids_to_query)
+            zkb_data = killmail_data.get("zkb", {})
+            victim_position = victim.get("position")
+
+            async def fetch_names() -> dict[int, dict]:
+                entity_names = {}
+                if ids_list:
+                    names_data = await esi_client.get_names(ids_list) or {}
+                    for category, items in names_data.items():
+                        for entity_id, name in items.items():
+                            entity_names[int(entity_id)] = {"category": category, "name": name}
+                return entity_names
+
+            async def fetch_type_names() -> dict[int, dict]:
+                return await sde_search.get_type_names(type_ids_list) if type_ids_list else {}
+
+            async def fetch_type_categories() -> dict[int, int]:
+                return await sde_search.get_type_category_ids(type_ids_list) if type_ids_list else {}
+
+            async def fetch_prices() -> dict[int, Any]:
+                return await market.get_price(type_ids_list) if type_ids_list else {}
+
+            async def fetch_system() -> dict[str, Any]:
+                return await get_system_info(solar_system_id) if solar_system_id else {}
+
+            async def fetch_victim_title() -> str | None:
+                victim_id = victim.get("character_id")
+                if not victim_id:
+                    return None
+                victim_info = await esi_client.get_character_public_info(victim_id) or {}
+                victim_title = victim_info.get("title")
+                return clean_colored_text(victim_title) if victim_title else None
+
+            async def fetch_ship_group() -> str:
+                return await sde_search.get_type_group(victim.get("ship_type_id", 0))
+
+            async def fetch_nearest_celestial() -> dict[str, Any] | None:
+                if not victim_position:
+                    return None
+                return await self._calculate_nearest_celestial(
+                    victim_position, zkb_data.get("locationID", 0), solar_system_id
+                )
 
-            item_prices: dict[int, Any] = {}
-            if type_ids_to_query:
-                item_names = await sde_search.get_type_names(list(type_ids_to_query))
-                type_categories = await sde_search.get_type_category_ids(list(type_ids_to_query))
-                try:
-                    item_prices = await market.get_price(list(type_ids_to_query))
-                except Exception as e:
-                    logger.warning(f"获取市场价格失败，物品价格将不显示: {e}")
+            async def format_slots(item_names, type_categories, item_prices, flag_info) -> list[dict]:
+                slot_data = self._format_items(
+                    victim.get("items", []), item_names, flag_info, item_prices, type_categories
+                )
+                slot_list = slot_data.get("slotList", [])
+                # 为每个物品添加市场价格
+                for slot in slot_list:
+                    for item in slot.get("slot_items", []):
+                        self._add_price_to_item(item, item_prices)
+                        for nested in (item.get("nested_items") or []):
+                            self._add_price_to_item(nested, item_prices)
+                return slot_list
+
+            graph = (
+                EnrichmentGraph()
+                .add("names", fetch_names, timeout=ENRICH_ESI_TIMEOUT)
+                .add("type_names", fetch_type_names, timeout=ENRICH_SDE_TIMEOUT)
+                .add("type_categories", fetch_type_categories, timeout=ENRICH_SDE_TIMEOUT)
+                .add("prices", fetch_prices, timeout=ENRICH_PRICE_TIMEOUT)
+                .add("flags", sde_search.get_flag_info, timeout=ENRICH_SDE_TIMEOUT)
+                .add("system", fetch_system, timeout=ENRICH_ESI_TIMEOUT)
+                .add("victim_title", fetch_victim_title, timeout=ENRICH_DETAIL_TIMEOUT, fallback=lambda: None)
+                .add("ship_group", fetch_ship_group, timeout=ENRICH_SDE_TIMEOUT, fallback=lambda: "Unknown")
+                .add(
+                    "labels",
+                    lambda: self._process_km_labels(zkb_data.get("labels", [])),
+                    timeout=ENRICH_SDE_TIMEOUT,
+                    fallback=list,
+                )
+                .add(
+                    "nearest_celestial",
+                    fetch_nearest_celestial,
+                    timeout=ENRICH_DETAIL_TIMEOUT,
+                    fallback=lambda: {"location_name": "Unknown", "distance_str": 0},
+                )
+                # 物品槽位格式化只依赖 SDE 与价格，可与仍在等待的 ESI 查询重叠
+                .add(
+                    "slots",
+                    format_slots,
+                    deps=("type_names", "type_categories", "prices", "flags"),
+                    fallback=list,
+                )
+            )
+            enriched = await graph.run()
 
-            if solar_system_id:
-                system_info = await esi_client.get_system_info(solar_system_id)
+            entity_names = enriched["names"]
+            item_names = enriched["type_names"]
+            item_prices = enriched["prices"]
+            system_info = enriched["system"] or {}
+            slot_list_raw = enriched["slots"]
 
             # 处理时间
             killmail_time = datetime.fromisoformat(killmail_data.get("killmail_time", "").replace("Z", "+00:00"))
-            current_time = datetime.now()
-            time_difference = self._format_time_difference(killmail_time, current_time)
             formatted_time = killmail_time.strftime("%Y-%m-%d %H:%M:%S")
 
             # 处理安全等级
@@ -138,43 +220,30 @@ class KillmailProcessor:
             attacker_number = len(attackers)
 
             # 处理价值
-            zkb_data = killmail_data.get("zkb", {})
             total_value = zkb_data.get("totalValue", 0)
             drop_value = zkb_data.get("droppedValue", 0)
             formatted_total_value = f"{total_value:,.2f}"
             formatted_drop_value = f"{drop_value:,.2f}"
 
-            # 处理物品
-            slot_data = self._format_items(victim.get("items", []), item_names, await sde_search.get_flag_info(), item_prices, type_categories)
-            slot_list_raw = slot_data.get("slotList", [])
-
-            # 为每个物品添加市场价格
-            for slot in slot_list_raw:
-                for item in slot.get("slot_items", []):
-                    self._add_price_to_item(item, item_prices)
-                    for nested in (item.get("nested_items") or []):
-                        self._add_price_to_item(nested, item_prices)
-
             result = {
                 "killmail_id": killmail_data.get("killmail_id"),
                 "killmail_time": killmail_data.get("killmail_time"),
                 "time": formatted_time,
-                "time_difference": time_difference,
                 "solar_system_id": solar_system_id,
                 "solar_system": system_info.get("system_name", "未知星系"),
                 "constellation": system_info.get("constellation_name", "未知星座"),
                 "region": system_info.get("region_name", "未知区域"),
                 "sec_color": sec_color,
                 "sec": sec_formatted,
-                "victim": await self._format_victim(victim, entity_names, item_names),
+                "victim": self._format_victim(
+                    victim, entity_names, item_names, enriched["victim_title"], enriched["ship_group"]
+                ),
                 "attacker_number": attacker_number,
-                "attackMember": (attack_members := self._format_attackers(attackers, entity_names, item_names)),
-                "faction_stats": self._compute_faction_stats(attack_members),
-                "ship_stats": self._compute_ship_stats(attack_members),
+                **self._summarize_attackers(attackers, entity_names, item_names),
                 "slot_list": slot_list_raw,
                 "slot_list_merged": self._merge_slot_items(slot_list_raw),
                 "zkb": killmail_data.get("zkb", {}),
-                "labels": await self._process_km_labels(zkb_data.get("labels", [])),
+                "labels": enriched["labels"],
                 "total_value": formatted_total_value,
                 "drop_value": formatted_drop_value,
                 "total_value_abbr": _format_isk(total_value),
@@ -184,13 +253,13 @@ class KillmailProcessor:
                     ((item_prices.get(victim.get("ship_type_id", 0)) or {}).get("highest_buy") or {}).get("price") or 0
                 ),
                 "position": killmail_data.get("position", {}),
+                "enrich_degraded": graph.degraded,  # 使用了降级值的补全节点，非空时不缓存
             }
+            self.refresh_time_difference(result)
 
-            # 计算最近天体
-            if killmail_data.get("victim").get("position"):
-                result["nearest_celestial"] = await self._calculate_nearest_celestial(
-                    killmail_data.get("victim").get("position"), killmail_data["zkb"].get("locationID", 0)
-                )
+            # 最近天体
+            if victim_position:
+                result["nearest_celestial"] = enriched["nearest_celestial"]
                 result["location_name"] = result["nearest_celestial"].get("location_name", "未知位置")
                 result["distance_str"] = result["nearest_celestial"].get("distance_str", "未知距离")
 
@@ -204,25 +273,31 @@ class KillmailProcessor:
             return {}
 
     @classmethod
-    async def _format_victim(
-        cls, victim: dict[str, Any], entity_names: dict[int, dict], item_names: dict[int, dict]
+    def refresh_time_difference(cls, html_data: dict[str, Any]) -> None:
+        """按当前时间（重新）计算距击杀发生的时长，缓存的处理结果在使用前调用"""
+        killmail_time = html_data.get("killmail_time")
+        if not killmail_time:
+            return
+        html_data["time_difference"] = cls._format_time_difference(
+            datetime.fromisoformat(killmail_time.replace("Z", "+00:00")), datetime.now()
+        )
+
+    @classmethod
+    def _format_victim(
+        cls,
+        victim: dict[str, Any],
+        entity_names: dict[int, dict],
+        item_names: dict[int, dict],
+        victim_title: str | None,
+        ship_group_name: str,
     ) -> dict[str, Any]:
-        """格式化受害者信息"""
+        """格式化受害者信息，头衔与舰船群组由补全图预先查询"""
         victim_id = victim.get("character_id", 0)
         corp_id = victim.get("corporation_id", 0)
         alliance_id = victim.get("alliance_id", 0)
         ship_type_id = victim.get("ship_type_id", 0)
-        ship_group_name = await sde_search.get_type_group(victim.get("ship_type_id", 0))
         damage_taken = victim.get("damage_taken", 0)
 
-        if victim_id:
-            victim_info = await esi_client.get_character_public_info(victim_id)
-            victim_title = victim_info.get("title", None)
-            if victim_title:
-                victim_title = clean_colored_text(victim_title)
-        else:
-            victim_title = None
-
         result = {
             "victim_id": victim_id,
             "victim_title": victim_title,
@@ -239,42 +314,59 @@ class KillmailProcessor:
 
         return result
 
+    def _summarize_attackers(
+        self, attackers: list[dict], entity_names: dict[int, dict], item_names: dict[int, dict]
+    ) -> dict[str, Any]:
+        """攻击者列表与势力/舰船统计，攻击者过多时走大舰队聚合路径"""
+        if len(attackers) > LARGE_FLEET_THRESHOLD:
+            return self._aggregate_large_fleet(attackers, entity_names, item_names)
+        attack_members = self._format_attackers(attackers, entity_names, item_names)
+        return {
+            "attackMember": attack_members,
+            "faction_stats": self._compute_faction_stats(attack_members),
+            "ship_stats": self._compute_ship_stats(attack_members),
+        }
+
+    @classmethod
+    def _format_attacker(
+        cls, attacker: dict, entity_names: dict[int, dict], item_names: dict[int, dict], total_damage: float
+    ) -> dict[str, Any]:
+        """格式化单个攻击者"""
+        character_id = attacker.get("character_id", 0)
+        corporation_id = attacker.get("corporation_id", 0)
+        alliance_id = attacker.get("alliance_id", 0)
+        ship_type_id = attacker.get("ship_type_id", 0)
+        weapon_type_id = attacker.get("weapon_type_id", 0)
+        damage_done = attacker.get("damage_done", 0)
+
+        return {
+            "attacker_id": character_id,
+            "attacker_name": entity_names.get(character_id, {}).get("name", "Unknown"),
+            "attacker_corp_id": corporation_id,
+            "attacker_corp": entity_names.get(corporation_id, {}).get("name", "Unknown"),
+            "attacker_alliance_id": alliance_id,
+            "attacker_alliance": entity_names.get(alliance_id, {}).get("name", ""),
+            "ship_type_id": ship_type_id,
+            "ship_type_name": item_names.get(ship_type_id, {}).get("translation", "Unknown Ship"),
+            "weapon_type_id": weapon_type_id,
+            "weapon_type_name": item_names.get(weapon_type_id, {}).get("translation", "Unknown Weapon"),
+            "damage_done": f"{damage_done:,.0f}",
+            "damage_percent": round((damage_done / total_damage * 100) if total_damage else 0, 2),
+            "final_blow": attacker.get("final_blow", False),
+        }
+
     @classmethod
     def _format_attackers(
         cls, attackers: list[dict], entity_names: dict[int, dict], item_names: dict[int, dict]
     ) -> list[dict]:
         """格式化攻击者信息"""
-        formatted_attackers = []
-
         sorted_attackers = sorted(attackers, key=lambda a: a.get("damage_done", 0), reverse=True)
 
         total_damage = sum(attacker.get("damage_done", 0) for attacker in attackers)
 
-        for attacker in sorted_attackers:
-            character_id = attacker.get("character_id", 0)
-            corporation_id = attacker.get("corporation_id", 0)
-            alliance_id = attacker.get("alliance_id", 0)
-            ship_type_id = attacker.get("ship_type_id", 0)
-            weapon_type_id = attacker.get("weapon_type_id", 0)
-            damage_done = attacker.get("damage_done", 0)
-
-            formatted_attacker = {
-                "attacker_id": character_id,
-                "attacker_name": entity_names.get(character_id, {}).get("name", "Unknown"),
-                "attacker_corp_id": corporation_id,
-                "attacker_corp": entity_names.get(corporation_id, {}).get("name", "Unknown"),
-                "attacker_alliance_id": alliance_id,
-                "attacker_alliance": entity_names.get(alliance_id, {}).get("name", ""),
-                "ship_type_id": ship_type_id,
-                "ship_type_name": item_names.get(ship_type_id, {}).get("translation", "Unknown Ship"),
-                "weapon_type_id": weapon_type_id,
-                "weapon_type_name": item_names.get(weapon_type_id, {}).get("translation", "Unknown Weapon"),
-                "damage_done": f"{damage_done:,.0f}",
-                "damage_percent": round((damage_done / total_damage * 100) if total_damage else 0, 2),
-                "final_blow": attacker.get("final_blow", False),
-            }
-
-            formatted_attackers.append(formatted_attacker)
+        formatted_attackers = [
+            cls._format_attacker(attacker, entity_names, item_names, total_damage) for attacker in sorted_attackers
+        ]
 
         final_blow_index = next((i for i, a in enumerate(formatted_attackers) if a.get("final_blow")), 0)
         if final_blow_index > 0:
@@ -586,18 +678,26 @@ class KillmailProcessor:
         return formatted_items
 
     @classmethod
-    async def _calculate_nearest_celestial(cls, position: dict[str, float], location_id: int) -> dict[str, Any]:
+    async def _calculate_nearest_celestial(
+        cls, position: dict[str, float], location_id: int, solar_system_id: int | None = None
+    ) -> dict[str, Any]:
         """
-        计算距离最近的天体
+        计算距离最近的天体，优先用 SDE 天体坐标在本地计算，星系没有数据时回退到 ESI 查询 zkb 给出的 locationID
 
         Args:
-            location_id: 天体ID
             position: 击杀事件发生的位置坐标
+            location_id: 天体ID
+            solar_system_id: 星系ID
 
         Returns:
             包含最近天体信息的字典
         """
         try:
+            if solar_system_id:
+                nearest = celestials.nearest(solar_system_id, position)
+                if nearest is not None:
+                    return nearest
+
             data = await esi_client.get_moon_info(location_id)
 
             dx = math.fabs(position["x"] - data["position"]["x"])
@@ -605,16 +705,9 @@ class KillmailProcessor:
             dz = math.fabs(position["z"] - data["position"]["z"])
             distance = math.sqrt(dx**2 + dy**2 + dz**2)
 
-            if distance > 149597870700 * 0.1:
-                distance_au = distance / 149597870700
-                distance_str = f"{distance_au:.2f} AU"
-            else:
-                distance_km = distance / 1000
-                distance_str = f"{distance_km:,.2f} km"
-
             return {
                 "location_name": data.get("name", "Unknown"),
-                "distance_str": distance_str,
+                "distance_str": format_distance(distance),
             }
 
         except Exception as e:
@@ -755,6 +848,92 @@ class KillmailProcessor:
         years = months // 12
         return f"{years}年前"
 
+    @classmethod
+    def _aggregate_large_fleet(
+        cls, attackers: list[dict], entity_names: dict[int, dict], item_names: dict[int, dict]
+    ) -> dict[str, Any]:
+        """
+        大舰队路径：把 ID/伤害取成 NumPy 列，一次向量化计算伤害排序与势力、舰船分布，
+        只完整格式化伤害最高的 LARGE_FLEET_TOP_ATTACKERS 名攻击者（以及最后一击），其余汇总为 attackers_omitted
+        （人数与合计伤害，卡片的"未展示参与者"一行中显示）
+
+        Returns:
+            与 _summarize_attackers 相同的字段，外加 attackers_omitted
+        """
+        n = len(attackers)
+        damage = np.fromiter((a.get("damage_done", 0) or 0 for a in attackers), dtype=np.float64, count=n)
+        corp_ids = np.fromiter((a.get("corporation_id", 0) or 0 for a in attackers), dtype=np.int64, count=n)
+        alliance_ids = np.fromiter((a.get("alliance_id", 0) or 0 for a in attackers), dtype=np.int64, count=n)
+        ship_ids = np.fromiter((a.get("ship_type_id", 0) or 0 for a in attackers), dtype=np.int64, count=n)
+        total_damage = float(damage.sum())
+
+        # 伤害降序（稳定排序，与 _format_attackers 一致），最后一击放在首位
+        order = np.argsort(-damage, kind="stable")
+        top = order[:LARGE_FLEET_TOP_ATTACKERS].tolist()
+        final_blow = next((i for i, a in enumerate(attackers) if a.get("final_blow")), None)
+        if final_blow is not None:
+            if final_blow in top:
+                top.remove(final_blow)
+            else:
+                top.pop()
+            top.insert(0, final_blow)
+        attack_members = [cls._format_attacker(attackers[i], entity_names, item_names, total_damage) for i in top]
+
+        omitted_damage = total_damage - float(damage[top].sum())
+
+        # 有联盟按联盟、否则按军团统计；军团以负数编码，与联盟 ID 区分
+        faction_keys = np.where(alliance_ids != 0, alliance_ids, -corp_ids)
+        faction_stats = [
+            {
+                "name": entity_names.get(abs(key), {}).get("name", "" if key > 0 else "Unknown"),
+                "logo_url": (
+                    f"https://images.newdoublex.space/alliances/{key}/logo?size=64"
+                    if key > 0
+                    else f"https://images.newdoublex.space/corporations/{-key}/logo?size=64"
+                ),
+                "count": count,
+            }
+            for key, count in cls._histogram(faction_keys)
+        ]
+        ship_stats = [
+            {
+                "name": item_names.get(ship_id, {}).get("translation", "Unknown Ship"),
+                "ship_id": ship_id,
+                "count": count,
+            }
+            for ship_id, count in cls._histogram(ship_ids)
+        ]
+
+        return {
+            "attackMember": attack_members,
+            "faction_stats": cls._fold_groups(faction_stats, {"logo_url": PLACEHOLDER_ICON}),
+            # 合并行没有对应的舰船，模板不显示图标
+            "ship_stats": cls._fold_groups(ship_stats, {"ship_id": 0}),
+            "attackers_omitted": {
+                "count": n - len(top),
+                "damage_done": f"{omitted_damage:,.0f}",
+                "damage_percent": round(omitted_damage / total_damage * 100 if total_damage else 0, 2),
+            },
+        }
+
+    @staticmethod
+    def _histogram(keys: np.ndarray) -> list[tuple[int, int]]:
+        """按出现次数降序的 (键, 次数)，次数相同时按首次出现的顺序"""
+        unique, first_index, counts = np.unique(keys, return_index=True, return_counts=True)
+        order = np.lexsort((first_index, -counts))
+        return list(zip(unique[order].tolist(), counts[order].tolist()))
+
+    @staticmethod
+    def _fold_groups(groups: list[dict], placeholder: dict[str, Any]) -> list[dict]:
+        """只保留前 LARGE_FLEET_TOP_GROUPS 个分组，其余合并为一行"""
+        if len(groups) <= LARGE_FLEET_TOP_GROUPS:
+            return groups
+        rest = groups[LARGE_FLEET_TOP_GROUPS:]
+        return [
+            *groups[:LARGE_FLEET_TOP_GROUPS],
+            {"name": f"其他 {len(rest)} 组", "count": sum(g["count"] for g in rest), **placeholder},
+        ]
+
     @classmethod
     def _compute_faction_stats(cls, attack_members: list[dict]) -> list[dict]:
         """按联盟/军团分组统计攻击者，无联盟时按军团统计"""
@@ -0,0 +1,140 @@
+"""
+紧凑的 killmail 记录
+
+入队时一次性从 killmail JSON 中抽取匹配所需字段：受害者字段、最后一击下标、
+攻击者 ID 列（array 类型数组）、标签（frozenset）、价值和时间（基本类型）。
+完整 JSON 只以 bytes 保存，渲染时才按需解码，避免大规模舰队战的嵌套 dict 常驻队列内存。
+"""
+
+from array import array
+from datetime import datetime
+import json
+from typing import Any
+
+# 实体类型 -> 攻击者 ID 列
+ATTACKER_COLUMNS = {
+    "character": "attacker_character_ids",
+    "corporation": "attacker_corporation_ids",
+    "alliance": "attacker_alliance_ids",
+    "ship": "attacker_ship_type_ids",
+}
+
+
+def parse_killmail_time(killmail_time: str | None) -> float | None:
+    """将 ESI 时间字符串解析为 UTC 时间戳，无法解析时返回 None"""
+    if not killmail_time:
+        return None
+    try:
+        return datetime.fromisoformat(killmail_time.replace("Z", "+00:00")).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class KillmailRecord:
+    """匹配热路径使用的紧凑 killmail 表示"""
+
+    __slots__ = (
+        "_data",
+        "attacker_alliance_ids",
+        "attacker_character_ids",
+        "attacker_corporation_ids",
+        "attacker_ship_type_ids",
+        "final_blow_index",
+        "killmail_id",
+        "killmail_time",
+        "labels",
+        "raw",
+        "solar_system_id",
+        "timestamp",
+        "total_value",
+        "victim_alliance_id",
+        "victim_character_id",
+        "victim_corporation_id",
+        "victim_ship_type_id",
+    )
+
+    def __init__(self, data: dict[str, Any], raw: bytes | None = None):
+        """
+        Args:
+            data: 展开后的 killmail 数据 { attackers, killmail_id, killmail_time, solar_system_id, victim, zkb }
+            raw: data 对应的 JSON bytes，已有时直接复用
+        """
+        self.killmail_id: int | None = data.get("killmail_id")
+        self.killmail_time: str | None = data.get("killmail_time")
+        self.timestamp: float | None = parse_killmail_time(self.killmail_time)
+        self.solar_system_id: int | None = data.get("solar_system_id")
+
+        zkb = data.get("zkb") or {}
+        try:
+            self.total_value = float(zkb.get("totalValue", 0) or 0)
+        except (TypeError, ValueError):
+            self.total_value = 0.0
+        self.labels: frozenset[str] = frozenset(zkb.get("labels") or ())
+
+        victim = data.get("victim") or {}
+        self.victim_character_id: int = victim.get("character_id") or 0
+        self.victim_corporation_id: int = victim.get("corporation_id") or 0
+        self.victim_alliance_id: int = victim.get("alliance_id") or 0
+        self.victim_ship_type_id: int = victim.get("ship_type_id") or 0
+
+        # 攻击者按列存放，缺失的 ID 记为 0
+        attackers = data.get("attackers") or []
+        self.attacker_character_ids = array("q", (a.get("character_id") or 0 for a in attackers))
+        self.attacker_corporation_ids = array("q", (a.get("corporation_id") or 0 for a in attackers))
+        self.attacker_alliance_ids = array("q", (a.get("alliance_id") or 0 for a in attackers))
+        self.attacker_ship_type_ids = array("q", (a.get("ship_type_id") or 0 for a in attackers))
+        self.final_blow_index: int = next((i for i, a in enumerate(attackers) if a.get("final_blow")), -1)
+
+        self.raw: bytes = raw if raw is not None else json.dumps(data, separators=(",", ":")).encode()
+        self._data: dict | None = None
+
+    @classmethod
+    def of(cls, data: "dict[str, Any] | KillmailRecord") -> "KillmailRecord":
+        """dict 转为记录，已是记录时原样返回"""
+        return data if isinstance(data, cls) else cls(data)
+
+    @classmethod
+    def from_bytes(cls, raw: bytes) -> "KillmailRecord":
+        """从 killmail JSON bytes 构建记录，raw 原样保留"""
+        return cls(json.loads(raw), raw=raw)
+
+    @property
+    def data(self) -> dict[str, Any]:
+        """完整的 killmail 数据，首次访问时才解码"""
+        if self._data is None:
+            self._data = json.loads(self.raw)
+        return self._data
+
+    def release(self):
+        """丢弃已解码的完整数据，只保留紧凑字段和 raw"""
+        self._data = None
+
+    @property
+    def attacker_count(self) -> int:
+        return len(self.attacker_character_ids)
+
+    def attacker_ids(self, entity_type: str) -> array:
+        """
+        获取攻击者某一类实体的 ID 列
+
+        Args:
+            entity_type: character/corporation/alliance/ship
+
+        Returns:
+            ID 数组，未知类型返回空数组
+        """
+        column = ATTACKER_COLUMNS.get(entity_type)
+        return getattr(self, column) if column else array("q")
+
+    def victim_id(self, entity_type: str) -> int:
+        """受害者某一类实体的 ID，缺失为 0"""
+        if entity_type == "ship":
+            return self.victim_ship_type_id
+        return getattr(self, f"victim_{entity_type}_id", 0)
+
+    def final_blow_id(self, entity_type: str) -> int:
+        """最后一击某一类实体的 ID，缺失为 0"""
+        if self.final_blow_index < 0:
+            return 0
+        column = self.attacker_ids(entity_type)
+        return column[self.final_blow_index] if column else 0
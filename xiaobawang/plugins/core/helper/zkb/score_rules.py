@@ -4,7 +4,8 @@
 定义所有条件类型的积分倍率（权重）
 积分计算方案: 基础分数为 1，每个匹配的规则叠加倍率，最终积分 = 基础 * 倍率1 * 倍率2 * ...
 
-注意：本文件仅定义规则，积分计算功能暂未实现
+注意：积分计算功能暂未实现；实体与标签的倍率目前用作条件满足概率的先验（见 selectivity.py），
+倍率越高的条件范围越大、越容易满足，订阅匹配时会被排在更靠后的位置
 """
 
 
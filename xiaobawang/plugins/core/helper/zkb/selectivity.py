@@ -0,0 +1,85 @@
+"""
+条件选择性估计
+
+统计每个触发键（条件类型 + 值，与订阅倒排索引的键一致）在 killmail 中出现的比例，
+作为条件满足概率的估计；样本不足时以 ScoreRules 的权重作为先验（权重越高的条件范围越大、越容易满足）。
+编译订阅条件时据此重排 AND/OR 子项：AND 先执行最可能失败的廉价检查，OR 先执行最可能满足的。
+统计量每个周期衰减一半以跟随战场变化，周期号变化后已编译的条件会在下次使用时按新估计重排。
+"""
+
+from collections.abc import Iterable
+
+from .score_rules import ScoreRules
+
+SELECTIVITY_FIRST_EPOCH = 1_000  # 第一个周期的 killmail 数，之后按 SELECTIVITY_EPOCH_SIZE 滚动
+SELECTIVITY_EPOCH_SIZE = 20_000  # 每个统计周期的 killmail 数
+SELECTIVITY_PRIOR_WEIGHT = 50  # 先验相当于多少个 killmail 样本
+ENTITY_PRIOR_UNIT = 0.01  # 实体权重 -> 先验概率
+LABEL_PRIOR_UNIT = 0.1  # 标签权重 -> 先验概率
+ATTACKER_PRIOR_FACTOR = 2  # 任一攻击者条件比受害者/最后一击更容易满足
+MAX_PRIOR = 0.9
+
+
+def entity_prior(entity_type: str, role: str | None = None) -> float:
+    """实体/位置/舰船条件的先验满足概率"""
+    weight = ScoreRules.get_entity_score("ship" if entity_type == "group" else entity_type)
+    prior = weight * ENTITY_PRIOR_UNIT
+    if role == "any_attacker":
+        prior *= ATTACKER_PRIOR_FACTOR
+    return min(prior, MAX_PRIOR)
+
+
+def label_prior(label: str) -> float:
+    """标签的先验出现概率"""
+    return min(ScoreRules.get_label_score(label) * LABEL_PRIOR_UNIT, MAX_PRIOR)
+
+
+class SelectivityStats:
+    """触发键出现次数统计"""
+
+    def __init__(self):
+        self.epoch = 0  # 统计周期号，变化时已编译的条件需要重排
+        self._kills = 0.0
+        self._hits: dict[tuple, float] = {}
+        self._next_epoch = SELECTIVITY_FIRST_EPOCH
+
+    def observe(self, keys: Iterable[tuple]):
+        """
+        记录一个 killmail 命中的触发键
+
+        Args:
+            keys: 该 killmail 命中、且有订阅使用的触发键（无重复）
+        """
+        hits = self._hits
+        for key in keys:
+            hits[key] = hits.get(key, 0) + 1
+        self._kills += 1
+        if self._kills >= self._next_epoch:
+            self._roll()
+
+    def _roll(self):
+        """进入新周期：旧样本衰减一半，已编译条件在下次使用时重排"""
+        self._kills /= 2
+        self._hits = {key: count / 2 for key, count in self._hits.items() if count >= 1}
+        self._next_epoch = self._kills + SELECTIVITY_EPOCH_SIZE
+        self.epoch += 1
+
+    def hit_rate(self, key: tuple, prior: float) -> float:
+        """
+        触发键的满足概率估计（以先验平滑）
+
+        Args:
+            key: 触发键
+            prior: 样本不足时使用的先验概率
+        """
+        hits = self._hits.get(key, 0)
+        return (hits + prior * SELECTIVITY_PRIOR_WEIGHT) / (self._kills + SELECTIVITY_PRIOR_WEIGHT)
+
+    def reset(self):
+        self.__init__()
+
+    def __len__(self) -> int:
+        return len(self._hits)
+
+
+selectivity = SelectivityStats()
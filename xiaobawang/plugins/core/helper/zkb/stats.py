@@ -9,6 +9,7 @@ from ...api.killmail import get_zkb_killmail
 from ...api.zkillboard import zkb_api
 from ...utils.common import format_value
 from ...utils.render import render_template, templates_path
+from ..universe import get_system_info
 from .label import ZkbLabelHelper
 
 
@@ -137,7 +138,7 @@ class ZkbStats:
             query_ids.add(victim.get("ship_type_id", 0))
             query_ids.add(data.get("solar_system_id", 0))
 
-            system_data = await esi_client.get_system_info(data.get("solar_system_id", 0))
+            system_data = await get_system_info(data.get("solar_system_id", 0))
             region_name = system_data.get("region_name", "")
 
             await self._query_names(query_ids)
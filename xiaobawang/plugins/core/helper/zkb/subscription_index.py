@@ -0,0 +1,331 @@
+"""
+订阅倒排索引
+
+对每个订阅的 condition_groups 求出一组"触发键"：killmail 不含其中任何一个键时，该订阅不可能匹配。
+- 实体条件:   (entity_type, role, entity_id)，如 ("corporation", "any_attacker", 98000001)
+- 位置条件:   ("system" | "constellation" | "region", id)
+- 跳数条件:   展开为范围内全部星系的 ("system", id)
+- 舰船条件:   ("ship", ship_role, type_id)；群组条件: ("group", group_id)
+- 标签条件:   ("label", label)，仅 required_labels 可索引
+AND 取任一子项的触发键（选最小的一组），OR 取所有子项的并集；
+只含价值/排除标签等无法索引的订阅放入常驻候选，每个 killmail 都完整匹配。
+
+订阅的标量字段（启用状态、min_value、max_age_days、会话下标）同时按列存入 NumPy 数组，
+全局过滤对每个 killmail 只做一次向量化比较，与倒排索引的候选取交集后才逐个匹配条件。
+"""
+
+from collections.abc import Iterable
+import json
+from typing import Any
+
+from nonebot import logger
+import numpy as np
+
+from xiaobawang.plugins.sde.jumps import jump_distances
+
+from .clock import km_clock
+from .record import KillmailRecord
+from .selectivity import SelectivityStats, selectivity
+
+IndexKey = tuple
+
+LOCATION_TYPES = ("constellation", "region")  # 需要查询星系归属的位置类型
+ENTITY_ROLES = ("victim", "final_blow", "any_attacker")
+ENTITY_TYPES = ("character", "corporation", "alliance")
+
+DEFAULT_MIN_VALUE = 1_000_000  # 订阅未设置 min_value 时的最低价值
+DEFAULT_MAX_AGE_DAYS = 10  # 订阅未设置或设置了无效 max_age_days 时的时效（天）
+
+SessionKey = tuple[str, str, str, str]  # (platform, bot_id, session_id, session_type)
+
+
+def _norm_id(value: Any) -> Any:
+    """统一 ID 为 int，索引只需宽松匹配，最终结果以完整匹配为准"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _leaf_keys(condition: dict) -> set[IndexKey] | None:
+    """
+    单个条件的触发键
+
+    Returns:
+        触发键集合；None 表示无需任何键即可能匹配；空集表示永远不会匹配
+    """
+    cond_type = str(condition.get("type", "")).lower()
+
+    if cond_type == "entity":
+        entity_type = str(condition.get("entity_type", "")).lower()
+        entity_id = condition.get("entity_id")
+        if not entity_type or not entity_id:
+            return set()
+        entity_id = _norm_id(entity_id)
+
+        if entity_type in ("system", *LOCATION_TYPES, "group"):
+            return {(entity_type, entity_id)}
+        if entity_type == "ship":
+            return {("ship", condition.get("ship_role", "victim_ship"), entity_id)}
+
+        role = str(condition.get("role", "")).lower()
+        if entity_type not in ENTITY_TYPES or role not in ENTITY_ROLES:
+            return set()
+        return {(entity_type, role, entity_id)}
+
+    if cond_type == "label":
+        required = condition.get("required_labels") or []
+        if not required:
+            return None
+        return {("label", label) for label in required}
+
+    if cond_type == "value":
+        return None
+
+    if cond_type == "proximity":
+        # 展开为范围内的全部星系；矩阵未加载或星系未知时无法索引
+        try:
+            systems = jump_distances.within(_norm_id(condition.get("entity_id")), int(condition.get("jumps", 0)))
+        except (TypeError, ValueError):
+            return set()
+        if systems is None:
+            return None
+        return {("system", system_id) for system_id in systems}
+
+    return set()
+
+
+def _min_value_of(subscription: dict) -> float:
+    """全局过滤的最低价值，无法比较的值视为永不满足"""
+    try:
+        return float(subscription.get("min_value", DEFAULT_MIN_VALUE))
+    except (TypeError, ValueError):
+        return np.inf
+
+
+def _max_age_of(subscription: dict) -> int:
+    """全局过滤的时效天数"""
+    max_age_days = subscription.get("max_age_days")
+    if max_age_days is None:
+        return DEFAULT_MAX_AGE_DAYS
+    try:
+        return int(max_age_days)
+    except (TypeError, ValueError):
+        logger.warning(f"订阅 {subscription.get('id')} 无效的 max_age_days 值: {max_age_days}，使用默认 10")
+        return DEFAULT_MAX_AGE_DAYS
+
+
+def group_keys(group: dict) -> set[IndexKey] | None:
+    """
+    条件组的触发键
+
+    Args:
+        group: {"logic": "AND|OR", "conditions": [...], "groups": [...]}
+
+    Returns:
+        触发键集合；None 表示不可索引
+    """
+    logic = str(group.get("logic", "AND")).upper()
+    children = [_leaf_keys(c) for c in group.get("conditions", [])]
+    children += [group_keys(g) for g in group.get("groups", [])]
+
+    # 空条件组视为通过
+    if not children:
+        return None
+
+    if logic == "AND":
+        indexed = [keys for keys in children if keys is not None]
+        if not indexed:
+            return None
+        # 任一子项的触发键都是必要条件，选最小的一组
+        return min(indexed, key=len)
+
+    if logic == "OR":
+        if any(keys is None for keys in children):
+            return None
+        return set().union(*children)
+
+    return set()
+
+
+class SubscriptionIndex:
+    """订阅触发键倒排索引与全局过滤列存表，订阅集合变化时重建"""
+
+    def __init__(self, stats: SelectivityStats | None = None):
+        """
+        Args:
+            stats: 记录触发键命中的选择性统计，默认为进程级实例
+        """
+        self._stats = selectivity if stats is None else stats
+        self._signature: int | None = None
+        self._version: int | None = None
+        self._subscriptions: list[dict] = []
+        self._postings: dict[IndexKey, np.ndarray] = {}  # 触发键 -> 订阅下标
+        self._always = np.empty(0, dtype=np.intp)  # 无法索引、每次都要完整匹配的订阅下标
+        self.key_types: frozenset[str] = frozenset()  # 索引中出现过的键类型，用于跳过不需要的查询
+
+        # 全局过滤列，与 _subscriptions 按下标对齐
+        self._enabled = np.empty(0, dtype=np.bool_)
+        self._min_value = np.empty(0, dtype=np.float64)
+        self._max_age_days = np.empty(0, dtype=np.int64)
+        self._session_idx = np.empty(0, dtype=np.int32)
+        self._sessions: list[SessionKey] = []  # 去重后的推送会话
+
+    @staticmethod
+    def _signature_of(subscriptions: list[dict]) -> int:
+        return hash(
+            tuple(
+                (
+                    sub.get("id"),
+                    str(sub.get("updated_at")),
+                    sub.get("is_enabled"),
+                    sub.get("min_value"),
+                    sub.get("max_age_days"),
+                )
+                for sub in subscriptions
+            )
+        )
+
+    def ensure(self, subscriptions: list[dict], version: int | None = None) -> bool:
+        """
+        订阅集合（id、updated_at 或全局过滤字段）变化时重建索引
+
+        Args:
+            subscriptions: 订阅列表
+            version: 订阅快照版本号，与上次相同且是同一个列表时直接跳过，不必逐个计算签名
+
+        Returns:
+            是否重建了索引
+        """
+        if version is not None and version == self._version and subscriptions is self._subscriptions:
+            return False
+        self._version = version
+
+        signature = self._signature_of(subscriptions)
+        if signature == self._signature:
+            # 内容未变，只替换为最新的订阅对象
+            self._subscriptions = subscriptions
+            return False
+        self._build(subscriptions)
+        self._signature = signature
+        return True
+
+    def _build(self, subscriptions: list[dict]):
+        postings: dict[IndexKey, list[int]] = {}
+        always: list[int] = []
+        sessions: dict[SessionKey, int] = {}
+        session_idx: list[int] = []
+        for pos, sub in enumerate(subscriptions):
+            session_key = (sub.get("platform"), sub.get("bot_id"), sub.get("session_id"), sub.get("session_type"))
+            session_idx.append(sessions.setdefault(session_key, len(sessions)))
+
+            condition_groups = sub.get("condition_groups") or {}
+            try:
+                if isinstance(condition_groups, str):
+                    condition_groups = json.loads(condition_groups)
+                keys = group_keys(condition_groups or {})
+            except Exception as e:
+                logger.warning(f"订阅 {sub.get('id')} 条件无法建立索引，改为完整匹配: {e}")
+                keys = None
+
+            if keys is None:
+                always.append(pos)
+            else:
+                for key in keys:
+                    postings.setdefault(key, []).append(pos)
+
+        self._subscriptions = subscriptions
+        self._postings = {key: np.array(hit, dtype=np.intp) for key, hit in postings.items()}
+        self._always = np.array(always, dtype=np.intp)
+        self.key_types = frozenset(key[0] for key in postings)
+
+        self._enabled = np.array([bool(sub.get("is_enabled", True)) for sub in subscriptions], dtype=np.bool_)
+        self._min_value = np.array([_min_value_of(sub) for sub in subscriptions], dtype=np.float64)
+        self._max_age_days = np.array([_max_age_of(sub) for sub in subscriptions], dtype=np.int64)
+        self._session_idx = np.array(session_idx, dtype=np.int32)
+        self._sessions = list(sessions)
+        logger.debug(
+            f"订阅索引已重建: {len(subscriptions)} 个订阅, {len(postings)} 个触发键, "
+            f"{len(always)} 个常驻候选, {len(sessions)} 个会话"
+        )
+
+    def prefilter(self, record: KillmailRecord) -> np.ndarray:
+        """
+        全局过滤：启用状态、最低价值与时效，一次向量化比较
+
+        Args:
+            record: 紧凑 killmail 记录
+
+        Returns:
+            与订阅下标对齐的布尔掩码
+        """
+        if not record.killmail_time or record.timestamp is None:
+            logger.warning(f"[KM:{record.killmail_id}] 缺少或无法解析击杀时间: {record.killmail_time}")
+            return np.zeros(len(self._subscriptions), dtype=np.bool_)
+
+        age_days = int((km_clock.now() - record.timestamp) // 86400)
+        return self._enabled & (self._min_value <= record.total_value) & (self._max_age_days >= age_days)
+
+    @staticmethod
+    def killmail_keys(
+        record: KillmailRecord,
+        constellation_id: int | None = None,
+        region_id: int | None = None,
+        group_id: int | None = None,
+    ) -> Iterable[IndexKey]:
+        """
+        killmail 命中的所有触发键
+
+        Args:
+            record: 紧凑 killmail 记录
+            constellation_id: 所在星座，未查询时为 None
+            region_id: 所在星域，未查询时为 None
+            group_id: 受害舰船群组，未查询时为 None
+        """
+        yield "system", record.solar_system_id
+        if constellation_id is not None:
+            yield "constellation", constellation_id
+        if region_id is not None:
+            yield "region", region_id
+        if group_id is not None:
+            yield "group", _norm_id(group_id)
+
+        yield "ship", "victim_ship", record.victim_ship_type_id
+        yield "ship", "final_blow_ship", record.final_blow_id("ship")
+
+        for entity_type in ENTITY_TYPES:
+            yield entity_type, "victim", record.victim_id(entity_type)
+            yield entity_type, "final_blow", record.final_blow_id(entity_type)
+            for entity_id in set(record.attacker_ids(entity_type)):
+                yield entity_type, "any_attacker", entity_id
+
+        for label in record.labels:
+            yield "label", label
+
+    def candidates(self, keys: Iterable[IndexKey], mask: np.ndarray) -> list[int]:
+        """
+        通过全局过滤且可能匹配的订阅下标，保持原有顺序
+
+        Args:
+            keys: killmail 命中的触发键
+            mask: prefilter() 得到的全局过滤掩码
+        """
+        postings = self._postings
+        hit_keys = [key for key in keys if key in postings]
+        # 只统计有订阅使用的触发键，用于条件重排的选择性估计
+        self._stats.observe(hit_keys)
+        hits = [postings[key] for key in hit_keys]
+        hits.append(self._always)
+        hit = np.zeros(len(self._subscriptions), dtype=np.bool_)
+        hit[np.concatenate(hits)] = True
+        return np.flatnonzero(hit & mask).tolist()
+
+    def subscription(self, pos: int) -> dict:
+        return self._subscriptions[pos]
+
+    def session_key(self, pos: int) -> SessionKey:
+        """订阅的推送会话 (platform, bot_id, session_id, session_type)"""
+        return self._sessions[self._session_idx[pos]]
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
@@ -0,0 +1,79 @@
+"""
+KM 流水线分阶段耗时统计
+
+默认关闭，仅在回放/压测时开启，关闭时 measure() 只有一次布尔判断的开销。
+"""
+
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+import math
+import time
+from typing import Any
+
+STAGE_SAMPLE_SIZE = 10000  # 每个阶段保留的最近样本数
+
+
+class StageTimings:
+    """按阶段收集耗时样本并汇总分位数"""
+
+    def __init__(self, maxlen: int = STAGE_SAMPLE_SIZE):
+        self.enabled = False
+        self._maxlen = maxlen
+        self._samples: dict[str, deque[float]] = {}
+        self._counts: dict[str, int] = {}
+
+    def reset(self):
+        self._samples.clear()
+        self._counts.clear()
+
+    def record(self, stage: str, seconds: float):
+        """记录一次阶段耗时"""
+        if not self.enabled:
+            return
+        samples = self._samples.get(stage)
+        if samples is None:
+            samples = self._samples[stage] = deque(maxlen=self._maxlen)
+        samples.append(seconds)
+        self._counts[stage] = self._counts.get(stage, 0) + 1
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        """统计 with 块耗时，异常退出也会计入"""
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    @staticmethod
+    def _percentile(ordered: list[float], q: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(len(ordered) * q) - 1))]
+
+    def summary(self) -> dict[str, dict[str, Any]]:
+        """
+        各阶段耗时汇总（毫秒）
+
+        Returns:
+            {阶段: {count, avg, p50, p95, p99, max}}
+        """
+        result = {}
+        for stage, samples in self._samples.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            result[stage] = {
+                "count": self._counts.get(stage, len(ordered)),
+                "avg": round(sum(ordered) / len(ordered) * 1000, 2),
+                "p50": round(self._percentile(ordered, 0.5) * 1000, 2),
+                "p95": round(self._percentile(ordered, 0.95) * 1000, 2),
+                "p99": round(self._percentile(ordered, 0.99) * 1000, 2),
+                "max": round(ordered[-1] * 1000, 2),
+            }
+        return result
+
+
+stage_timings = StageTimings()
@@ -1,38 +1,53 @@
-from datetime import datetime, timezone
 from typing import Any
 
 from nonebot import logger
 
 from ..subscription_v2 import KillmailSubscriptionManagerV2
+from .clock import km_clock
+from .condition_compiler import NEED_LOCATION, NEED_SHIP_CLASS, CompiledConditionCache, compiled_conditions
 from .condition_matcher import ConditionMatcher
+from .record import KillmailRecord
+from .subscription_index import LOCATION_TYPES, SubscriptionIndex
 
 
 class KillmailValidatorV2:
     """新的Killmail验证器 - 支持灵活的条件组合"""
 
-    def __init__(self, subscription_manager: KillmailSubscriptionManagerV2):
+    def __init__(
+        self,
+        subscription_manager: KillmailSubscriptionManagerV2,
+        conditions: CompiledConditionCache | None = None,
+        matcher_cls: type[ConditionMatcher] = ConditionMatcher,
+    ):
         """
         初始化验证器
 
         Args:
             subscription_manager: 新的订阅管理器
+            conditions: 编译结果缓存，默认为进程级实例；压测时传入独立实例，不影响线上状态
+            matcher_cls: 匹配上下文类型，压测时替换为使用合成数据的子类
         """
         self.subscription_manager = subscription_manager
+        self.conditions = compiled_conditions if conditions is None else conditions
+        self.matcher_cls = matcher_cls
+        self.index = SubscriptionIndex(self.conditions.stats)
 
-    async def validate_and_match(self, data: dict[str, Any]) -> dict[tuple, list[str]] | None:
+    async def validate_and_match(self, data: dict[str, Any] | KillmailRecord) -> dict[tuple, list[str]] | None:
         """
         验证killmail并匹配新式订阅
 
         Args:
-            data: zkillboard推送的killmail数据
+            data: 紧凑 killmail 记录或 zkillboard 推送的 killmail 数据
 
         Returns:
             匹配的会话信息字典 {(platform, bot_id, session_id, session_type, total_value): [reasons]}
             如果不符合要求则返回None
         """
         try:
+            record = KillmailRecord.of(data)
+
             # 检查价值
-            if not self._check_killmail_value(data):
+            if not self._check_killmail_value(record):
                 return None
 
             # 获取所有新式订阅
@@ -42,51 +57,40 @@ class KillmailValidatorV2:
                 return None
 
             # 检查时间
-            if not self._check_killmail_time(data):
+            if not self._check_killmail_time(record):
                 logger.debug("超过限制时间")
                 return None
 
-            # 生成标签
-            labels = data.get("zkb", {}).get("labels", [])
+            # 订阅集合变化时重建倒排索引与全局过滤列，并丢弃已删除订阅的编译结果
+            index = self.index
+            if index.ensure(all_subscriptions, self.subscription_manager.subscriptions_version):
+                self.conditions.retain(sub.get("id") for sub in all_subscriptions)
 
-            # 创建匹配器
-            matcher = ConditionMatcher(data)
+            # 全局过滤（启用状态/价值/时效）一次向量化完成
+            mask = index.prefilter(record)
+            if not mask.any():
+                return None
+
+            # 创建匹配上下文，经倒排索引只保留通过全局过滤且可能匹配的候选
+            matcher = self.matcher_cls(record, conditions=self.conditions)
+            positions = index.candidates(await self._killmail_keys(matcher), mask)
+            if not positions:
+                return None
+
+            # 一次性查询候选订阅所需的上下文数据，之后同步匹配
+            candidates = [index.subscription(pos) for pos in positions]
+            await matcher.resolve(set().union(*(self.conditions.needs_of(sub) for sub in candidates)))
 
-            # 匹配订阅 - 批量并发处理
             matched_sessions = {}
-            # 过滤启用的订阅
-            enabled_subs = [sub for sub in all_subscriptions if sub["is_enabled"]]
-
-            # 分批处理,每批100个
-            batch_size = 100
-            total_value = float(data.get("zkb", {}).get("totalValue", 0))
-
-            for i in range(0, len(enabled_subs), batch_size):
-                batch = enabled_subs[i:i + batch_size]
-                # 并发匹配当前批次
-                import asyncio
-                tasks = [matcher.match_subscription(sub) for sub in batch]
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-
-                # 处理匹配结果
-                for sub, result in zip(batch, results):
-                    if isinstance(result, Exception):
-                        logger.error(f"订阅 {sub['id']} ({sub['name']}) 匹配出错: {result}")
-                        continue
-
-                    matched, reasons = result
-                    if matched:
-                        session_key = (
-                            sub["platform"],
-                            sub["bot_id"],
-                            sub["session_id"],
-                            sub["session_type"],
-                            total_value
-                        )
-                        # 添加订阅名称到原因列表
-                        full_reasons = [f"[{sub['name']}]"] + reasons
-                        matched_sessions.setdefault(session_key, []).extend(full_reasons)
-                        logger.debug(f"订阅 {sub['id']} ({sub['name']}) 匹配成功")
+            total_value = record.total_value
+            for pos, sub in zip(positions, candidates):
+                matched, reasons = matcher.match_conditions(sub)
+                if matched:
+                    session_key = (*index.session_key(pos), total_value)
+                    # 添加订阅名称到原因列表
+                    full_reasons = [f"[{sub['name']}]"] + reasons
+                    matched_sessions.setdefault(session_key, []).extend(full_reasons)
+                    logger.debug(f"订阅 {sub['id']} ({sub['name']}) 匹配成功")
 
             return matched_sessions if matched_sessions else None
 
@@ -94,41 +98,37 @@ class KillmailValidatorV2:
             logger.error(f"验证和匹配过程出错: {e}")
             return None
 
-    def _check_killmail_value(self, data: dict) -> bool:
+    async def _killmail_keys(self, matcher: ConditionMatcher) -> list[tuple]:
+        """killmail 命中的索引触发键，只在索引用得到时才查询星系归属和舰船群组"""
+        needs = set()
+        if self.index.key_types.intersection(LOCATION_TYPES):
+            needs.add(NEED_LOCATION)
+        if "group" in self.index.key_types:
+            needs.add(NEED_SHIP_CLASS)
+        await matcher.resolve(needs)
+        return list(
+            self.index.killmail_keys(matcher.record, matcher.constellation_id, matcher.region_id, matcher.group_id)
+        )
+
+    def _check_killmail_value(self, record: KillmailRecord) -> bool:
         """检查killmail价值"""
-        try:
-            total_value = float(data.get("zkb", {}).get("totalValue", 0))
-            if total_value < 1_000_000:
-                logger.debug(f"价值过低: {total_value:,.0f} ISK")
-                return False
-            return True
-        except Exception as e:
-            logger.error(f"价值检查出错: {e}")
+        if record.total_value < 1_000_000:
+            logger.debug(f"价值过低: {record.total_value:,.0f} ISK")
             return False
+        return True
 
-    def _check_killmail_time(self, data: dict) -> bool:
+    def _check_killmail_time(self, record: KillmailRecord) -> bool:
         """检查killmail时间 - 只处理最近10天内的"""
-        try:
-            killmail_time = data.get("killmail_time")
-            if not killmail_time:
-                return True
-
-            # 解析时间
-            kill_dt = datetime.strptime(killmail_time, "%Y-%m-%dT%H:%M:%SZ")
-            kill_dt = kill_dt.replace(tzinfo=timezone.utc)
-
-            # 计算时间差
-            now = datetime.now(timezone.utc)
-            age_days = (now - kill_dt).days
+        if record.timestamp is None:
+            return True
 
-            if age_days > 10:
-                logger.debug(f"killmail时间过久: {age_days} 天前")
-                return False
+        # 计算时间差
+        age_days = int((km_clock.now() - record.timestamp) // 86400)
+        if age_days > 10:
+            logger.debug(f"killmail时间过久: {age_days} 天前")
+            return False
 
-            return True
-        except Exception as e:
-            logger.error(f"时间检查出错: {e}")
-            return True
+        return True
 
 
 # ============================================
@@ -149,7 +149,7 @@ class KillmailValidatorLegacy:
         self.subscription_manager = subscription_manager
         self.v2_validator = KillmailValidatorV2(subscription_manager)
 
-    async def validate_and_match(self, data: dict[str, Any]) -> dict[tuple, list[str]] | None:
+    async def validate_and_match(self, data: dict[str, Any] | KillmailRecord) -> dict[tuple, list[str]] | None:
         """
         验证killmail并匹配订阅 (兼容旧系统)
 
@@ -33,6 +33,7 @@ from .sources import (
     fetch_warbeacon_auto,
     fetch_warbeacon_hash,
 )
+from ...api.esi.names import name_store
 from ..common.http_client import get_client
 from ..render import render_template
 
@@ -124,8 +125,8 @@ def _is_alliance_entity(entity_id: int, teams: list[set[str]]) -> bool:
 
 async def _fetch_esi_names(ids: list[int]) -> dict[int, str]:
     """
-    批量从 ESI /universe/names/ 获取 ID → 名称映射。
-    自动分块（每批最多 1000 个）。
+    批量获取 ID → 名称映射。
+    经本地名称库查询，只有未知的 ID 才分批（每批最多 1000 个）请求 ESI /universe/names/。
     """
     if not ids:
         return {}
@@ -134,22 +135,8 @@ async def _fetch_esi_names(ids: list[int]) -> dict[int, str]:
     if not valid_ids:
         return {}
 
-    result: dict[int, str] = {}
-    chunk_size = 1000
-    client = get_client()
-    for i in range(0, len(valid_ids), chunk_size):
-        chunk = valid_ids[i : i + chunk_size]
-        try:
-            resp = await client.post(
-                f"{ESI_BASE}/universe/names/?datasource=tranquility",
-                json=chunk,
-            )
-            if resp.status_code == 200:
-                for item in resp.json():
-                    result[item["id"]] = item["name"]
-        except Exception:
-            pass
-    return result
+    names = await name_store.get_names(valid_ids)
+    return {entity_id: name for category_names in names.values() for entity_id, name in category_names.items()}
 
 
 async def _fetch_esi_tickers(
@@ -6,10 +6,13 @@ from nonebot_plugin_apscheduler import scheduler
 
 from ..core.helper.message_queue import message_sender
 from .cache import cache
+from .celestials import celestials
 from .config import SDE_DB_PATH, plugin_config
 from .config import Config as Config
 from .db import close_engine, init_engine
+from .jumps import jump_distances
 from .oper import sde_search as sde_search
+from .universe import universe
 from .upgrade import check_sde_update, download_and_extract_sde
 from .upgrade import get_current_sde_version as get_current_sde_version
 from .upgrade import get_latest_sde_version as get_latest_sde_version
@@ -42,6 +45,9 @@ async def startup():
 
     await init_engine(db_path)
     await cache.init()
+    await universe.load()
+    await celestials.load()
+    await jump_distances.load(db_path)
     await message_sender.start()
 
 
@@ -71,6 +77,9 @@ async def update_sde():
     # 重新初始化数据库
     await init_engine(db_path)
     await cache.init()
+    await universe.load()
+    await celestials.load()
+    await jump_distances.load(db_path, rebuild=True)
 
     logger.info("SDE数据库更新完成")
 
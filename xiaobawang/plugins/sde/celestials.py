@@ -0,0 +1,124 @@
+"""
+星系天体坐标表
+
+启动时（以及 SDE 更新后）从 mapDenormalize 读取全部恒星、行星、卫星、小行星带、星门和空间站的坐标，
+按星系排序存入 NumPy 数组，最近天体直接在本地按星系切片计算，不再请求 ESI。
+每个星系的天体只有几十到几百个，向量化的暴力比较已在微秒级，无需 KD 树。
+名称以 UTF-8 拼接为一个字节串加偏移数组保存，避免数十万个 Python 字符串对象。
+"""
+
+from typing import Any
+
+from nonebot import logger
+import numpy as np
+from sqlalchemy import select
+
+from .db import get_session
+from .models import MapDenormalize
+
+CELESTIAL_GROUP_IDS = (6, 7, 8, 9, 10, 15)  # 恒星、行星、卫星、小行星带、星门、空间站
+AU_METERS = 149_597_870_700  # 1 AU（米）
+AU_DISPLAY_THRESHOLD = 0.1  # 超过该 AU 数时以 AU 显示距离，否则以 km 显示
+
+
+def format_distance(distance: float) -> str:
+    """将距离（米）格式化为 AU 或 km"""
+    if distance > AU_METERS * AU_DISPLAY_THRESHOLD:
+        return f"{distance / AU_METERS:.2f} AU"
+    return f"{distance / 1000:,.2f} km"
+
+
+class _CelestialData:
+    """一次加载的完整数据，整体替换以保证并发读取时的一致性"""
+
+    __slots__ = ("coords", "item_ids", "name_blob", "name_offsets", "system_ids")
+
+    def __init__(self):
+        self.system_ids = np.empty(0, dtype=np.int64)  # 每行所属星系（升序）
+        self.item_ids = np.empty(0, dtype=np.int64)
+        self.coords = np.empty((0, 3), dtype=np.float64)
+        self.name_offsets = np.zeros(1, dtype=np.int64)  # 第 i 行名称为 name_blob[offsets[i]:offsets[i+1]]
+        self.name_blob = b""
+
+
+class CelestialTable:
+    """按星系切片的天体坐标表"""
+
+    def __init__(self):
+        self._data = _CelestialData()
+
+    @property
+    def loaded(self) -> bool:
+        return len(self._data.item_ids) > 0
+
+    async def load(self):
+        """从 SDE 重新加载，失败时保留旧数据"""
+        try:
+            async with await get_session() as session:
+                result = await session.execute(
+                    select(
+                        MapDenormalize.solarSystemID,
+                        MapDenormalize.itemID,
+                        MapDenormalize.x,
+                        MapDenormalize.y,
+                        MapDenormalize.z,
+                        MapDenormalize.itemName,
+                    )
+                    .where(MapDenormalize.groupID.in_(CELESTIAL_GROUP_IDS))
+                    .where(MapDenormalize.solarSystemID.is_not(None))
+                    .order_by(MapDenormalize.solarSystemID)
+                )
+                rows = result.all()
+        except Exception as e:
+            logger.error(f"加载天体坐标失败，最近天体将回退到 ESI: {e}")
+            return
+
+        data = _CelestialData()
+        if rows:
+            system_ids, item_ids, xs, ys, zs, names = zip(*rows)
+            data.system_ids = np.array(system_ids, dtype=np.int64)
+            data.item_ids = np.array(item_ids, dtype=np.int64)
+            data.coords = np.column_stack([np.array(axis, dtype=np.float64) for axis in (xs, ys, zs)])
+            encoded = [(name or "").encode() for name in names]
+            data.name_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(name) for name in encoded], out=data.name_offsets[1:])
+            data.name_blob = b"".join(encoded)
+
+        self._data = data
+        logger.info(f"天体坐标已加载: {len(data.item_ids)} 个天体")
+
+    def nearest(self, system_id: int, position: dict[str, float]) -> dict[str, Any] | None:
+        """
+        星系内距离给定坐标最近的天体
+
+        Args:
+            system_id: 星系ID
+            position: 击杀坐标 {"x", "y", "z"}（米）
+
+        Returns:
+            {"location_id", "location_name", "distance", "distance_str"}，星系没有天体数据时为 None
+        """
+        data = self._data
+        start, end = np.searchsorted(data.system_ids, [system_id, system_id + 1])
+        if start == end:
+            return None
+
+        point = np.array([position["x"], position["y"], position["z"]], dtype=np.float64)
+        diff = data.coords[start:end] - point
+        squared = np.einsum("ij,ij->i", diff, diff)
+        row = start + int(squared.argmin())
+        distance = float(np.sqrt(squared[row - start]))
+
+        name = data.name_blob[data.name_offsets[row] : data.name_offsets[row + 1]].decode()
+        return {
+            "location_id": int(data.item_ids[row]),
+            "location_name": name or "Unknown",
+            "distance": distance,
+            "distance_str": format_distance(distance),
+        }
+
+    def __len__(self) -> int:
+        return len(self._data.item_ids)
+
+
+celestials = CelestialTable()
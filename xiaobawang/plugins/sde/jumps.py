@@ -0,0 +1,181 @@
+"""
+星系跳数距离表
+
+由 mapSolarSystemJumps 预先计算全部星系对之间的最短跳数，保存为 uint8 矩阵文件并以内存映射方式读取，
+"X 星系 N 跳内" 之类的查询为 O(1)。矩阵随 SDE 数据库生成，数据库文件变化（升级）后重新计算。
+
+计算使用按位并行的 BFS：每批 64 个起点的访问状态压缩进一个 uint64，
+每一层通过 CSR 邻接表一次 bitwise_or.reduceat 扩展全部节点。
+"""
+
+import asyncio
+import json
+from pathlib import Path
+
+from nonebot import logger
+import numpy as np
+from sqlalchemy import select
+
+from .db import get_session
+from .models import MapSolarSystemJumps
+
+JUMP_UNREACHABLE = 255  # 不连通（虫洞、深渊等没有星门连接的星系）
+JUMP_MATRIX_FILE = "jump_distances.u8"  # 距离矩阵，行列顺序同 JUMP_IDS_FILE
+JUMP_IDS_FILE = "jump_distances.ids.npy"  # 矩阵行号对应的星系 ID（升序）
+JUMP_META_FILE = "jump_distances.json"  # 生成时的 SDE 文件标识，变化后重新生成
+
+_BATCH = 64  # 每批并行 BFS 的起点数（一个 uint64 的位数）
+
+
+def _compute_matrix(edges: np.ndarray, path: Path) -> np.ndarray:
+    """
+    计算全部星系对的最短跳数并写入 path
+
+    Args:
+        edges: (E, 2) 星门连接，两个方向各一行
+        path: 矩阵文件路径
+
+    Returns:
+        升序的星系 ID
+    """
+    ids, inverse = np.unique(edges, return_inverse=True)
+    inverse = inverse.reshape(edges.shape)
+    n = len(ids)
+
+    # CSR 邻接表：按起点排序后，indices[indptr[v]:indptr[v+1]] 为 v 的邻居
+    order = np.argsort(inverse[:, 0], kind="stable")
+    indices = inverse[order, 1]
+    indptr = np.searchsorted(inverse[order, 0], np.arange(n + 1))
+    starts = indptr[:-1]  # 每个星系至少有一条星门连接，reduceat 不会遇到空区间
+
+    matrix = np.memmap(path, dtype=np.uint8, mode="w+", shape=(n, n))
+    bits = np.left_shift(np.uint64(1), np.arange(_BATCH, dtype=np.uint64))
+
+    for first in range(0, n, _BATCH):
+        sources = np.arange(first, min(first + _BATCH, n))
+        block = np.full((len(sources), n), JUMP_UNREACHABLE, dtype=np.uint8)
+        block[np.arange(len(sources)), sources] = 0
+
+        frontier = np.zeros(n, dtype=np.uint64)
+        frontier[sources] = bits[: len(sources)]
+        visited = frontier.copy()
+        distance = 0
+        while frontier.any() and distance < JUMP_UNREACHABLE - 1:
+            distance += 1
+            reached = np.bitwise_or.reduceat(frontier[indices], starts)
+            frontier = reached & ~visited
+            visited |= frontier
+            nodes = np.flatnonzero(frontier)
+            if not len(nodes):
+                break
+            # 展开新到达节点的位：(节点数, 64) -> 对应起点
+            hit = np.unpackbits(frontier[nodes].view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+            node_idx, source_idx = np.nonzero(hit[:, : len(sources)])
+            block[source_idx, nodes[node_idx]] = distance
+
+        matrix[sources] = block
+
+    matrix.flush()
+    del matrix
+    return ids
+
+
+class JumpDistances:
+    """内存映射的星系跳数矩阵"""
+
+    def __init__(self):
+        self._ids: np.ndarray | None = None
+        self._index: dict[int, int] = {}  # 星系 ID -> 行号
+        self._matrix: np.ndarray | None = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._matrix is not None
+
+    @staticmethod
+    def _stamp(db_path: Path) -> str:
+        stat = db_path.stat()
+        return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+    async def load(self, db_path: Path, rebuild: bool = False):
+        """
+        加载距离矩阵，文件缺失、SDE 已变化或 rebuild 时重新生成；失败时保留旧数据
+
+        Args:
+            db_path: SDE 数据库路径，矩阵文件存放在同一目录
+            rebuild: 强制重新生成
+        """
+        directory = db_path.parent
+        matrix_path = directory / JUMP_MATRIX_FILE
+        ids_path = directory / JUMP_IDS_FILE
+        meta_path = directory / JUMP_META_FILE
+
+        try:
+            stamp = self._stamp(db_path)
+            try:
+                meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                meta = {}
+            if rebuild or meta.get("stamp") != stamp or not matrix_path.exists() or not ids_path.exists():
+                await self._build(matrix_path, ids_path)
+                meta_path.write_text(json.dumps({"stamp": stamp}), encoding="utf-8")
+
+            ids = np.load(ids_path)
+            matrix = np.memmap(matrix_path, dtype=np.uint8, mode="r", shape=(len(ids), len(ids)))
+        except Exception as e:
+            logger.error(f"加载星系跳数矩阵失败，跳数条件将无法匹配: {e}")
+            return
+
+        self._ids = ids
+        self._index = {int(system_id): row for row, system_id in enumerate(ids.tolist())}
+        self._matrix = matrix
+        logger.info(f"星系跳数矩阵已加载: {len(ids)} 个星系")
+
+    async def _build(self, matrix_path: Path, ids_path: Path):
+        async with await get_session() as session:
+            result = await session.execute(
+                select(MapSolarSystemJumps.fromSolarSystemID, MapSolarSystemJumps.toSolarSystemID)
+            )
+            edges = np.array(result.all(), dtype=np.int64).reshape(-1, 2)
+        # 保证双向
+        edges = np.unique(np.concatenate([edges, edges[:, ::-1]]), axis=0)
+
+        logger.info(f"开始生成星系跳数矩阵: {len(edges)} 条星门连接")
+        # 先写临时文件再替换，避免其他进程读到一半的矩阵
+        tmp_matrix = matrix_path.with_suffix(".tmp")
+        ids = await asyncio.to_thread(_compute_matrix, edges, tmp_matrix)
+        # 旧映射可能仍在使用中，先解除引用
+        self._matrix = None
+        self._index = {}
+        np.save(ids_path, ids)
+        tmp_matrix.replace(matrix_path)
+        logger.info("星系跳数矩阵生成完成")
+
+    def distance(self, from_system: int, to_system: int) -> int | None:
+        """
+        两星系间的最短跳数
+
+        Returns:
+            跳数；不连通时为 JUMP_UNREACHABLE；任一星系不在矩阵中（或矩阵未加载）时为 None
+        """
+        index = self._index
+        row = index.get(from_system)
+        col = index.get(to_system)
+        if row is None or col is None:
+            return None
+        return int(self._matrix[row, col])
+
+    def within(self, system_id: int, jumps: int) -> list[int] | None:
+        """
+        N 跳内（含自身）的全部星系
+
+        Returns:
+            星系 ID 列表；星系不在矩阵中（或矩阵未加载）时为 None
+        """
+        row = self._index.get(system_id)
+        if row is None:
+            return None
+        return self._ids[np.flatnonzero(self._matrix[row] <= jumps)].tolist()
+
+
+jump_distances = JumpDistances()
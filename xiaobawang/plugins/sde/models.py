@@ -81,3 +81,61 @@ class MapSolarSystemJumps(Base):
     toSolarSystemID = Column(Integer, primary_key=True)
     toConstellationID = Column(Integer)
     toRegionID = Column(Integer)
+
+
+class MapRegions(Base):
+    __tablename__ = "mapRegions"
+
+    regionID = Column(Integer, primary_key=True)
+    regionName = Column(String(100))
+    x = Column(Float)
+    y = Column(Float)
+    z = Column(Float)
+    factionID = Column(Integer)
+
+
+class MapConstellations(Base):
+    __tablename__ = "mapConstellations"
+
+    regionID = Column(Integer)
+    constellationID = Column(Integer, primary_key=True)
+    constellationName = Column(String(100))
+    x = Column(Float)
+    y = Column(Float)
+    z = Column(Float)
+    factionID = Column(Integer)
+
+
+class MapSolarSystems(Base):
+    __tablename__ = "mapSolarSystems"
+
+    regionID = Column(Integer)
+    constellationID = Column(Integer)
+    solarSystemID = Column(Integer, primary_key=True)
+    solarSystemName = Column(String(100))
+    x = Column(Float)
+    y = Column(Float)
+    z = Column(Float)
+    security = Column(Float)
+    securityClass = Column(String(2))
+    factionID = Column(Integer)
+
+
+class MapDenormalize(Base):
+    __tablename__ = "mapDenormalize"
+
+    itemID = Column(Integer, primary_key=True)
+    typeID = Column(Integer)
+    groupID = Column(Integer)
+    solarSystemID = Column(Integer)
+    constellationID = Column(Integer)
+    regionID = Column(Integer)
+    orbitID = Column(Integer)
+    x = Column(Float)
+    y = Column(Float)
+    z = Column(Float)
+    radius = Column(Float)
+    itemName = Column(String(100))
+    security = Column(Float)
+    celestialIndex = Column(Integer)
+    orbitIndex = Column(Integer)
@@ -0,0 +1,125 @@
+"""
+宇宙拓扑表
+
+启动时（以及 SDE 更新后）从 SDE 一次性读取 星系 -> 星座 -> 星域 的归属、名称和安全等级，
+以紧凑数组常驻内存，提供 O(1) 的同步查询；SDE 中没有的星系由调用方（core.helper.universe）回退到 ESI。
+"""
+
+from array import array
+from typing import Any
+
+from nonebot import logger
+from sqlalchemy import select
+
+from .db import get_session
+from .models import MapConstellations, MapRegions, MapSolarSystems
+
+
+class _UniverseData:
+    """一次加载的完整数据，整体替换以保证并发读取时的一致性"""
+
+    __slots__ = (
+        "constellation_names",
+        "region_names",
+        "system_constellation",
+        "system_index",
+        "system_names",
+        "system_region",
+        "system_security",
+    )
+
+    def __init__(self):
+        self.system_index: dict[int, int] = {}  # 星系 ID -> 行号
+        self.system_names: list[str] = []
+        self.system_constellation = array("q")
+        self.system_region = array("q")
+        self.system_security = array("d")
+        self.constellation_names: dict[int, str] = {}
+        self.region_names: dict[int, str] = {}
+
+
+class UniverseTable:
+    """星系/星座/星域拓扑的内存表"""
+
+    def __init__(self):
+        self._data = _UniverseData()
+
+    async def load(self):
+        """从 SDE 重新加载，失败时保留旧数据"""
+        data = _UniverseData()
+        try:
+            async with await get_session() as session:
+                regions = await session.execute(select(MapRegions.regionID, MapRegions.regionName))
+                data.region_names = dict(regions.all())
+
+                constellations = await session.execute(
+                    select(MapConstellations.constellationID, MapConstellations.constellationName)
+                )
+                data.constellation_names = dict(constellations.all())
+
+                systems = await session.execute(
+                    select(
+                        MapSolarSystems.solarSystemID,
+                        MapSolarSystems.solarSystemName,
+                        MapSolarSystems.constellationID,
+                        MapSolarSystems.regionID,
+                        MapSolarSystems.security,
+                    )
+                )
+                for system_id, name, constellation_id, region_id, security in systems:
+                    data.system_index[system_id] = len(data.system_names)
+                    data.system_names.append(name)
+                    data.system_constellation.append(constellation_id or 0)
+                    data.system_region.append(region_id or 0)
+                    data.system_security.append(security or 0.0)
+        except Exception as e:
+            logger.error(f"加载宇宙拓扑失败，星系查询将回退到 ESI: {e}")
+            return
+
+        self._data = data
+        logger.info(
+            f"宇宙拓扑已加载: {len(data.system_names)} 个星系, "
+            f"{len(data.constellation_names)} 个星座, {len(data.region_names)} 个星域"
+        )
+
+    def locate(self, system_id: int) -> tuple[int, int] | None:
+        """
+        星系所属的星座与星域
+
+        Returns:
+            (constellation_id, region_id)，SDE 中没有该星系时为 None
+        """
+        data = self._data
+        row = data.system_index.get(system_id)
+        if row is None:
+            return None
+        return data.system_constellation[row], data.system_region[row]
+
+    def get_system(self, system_id: int) -> dict[str, Any] | None:
+        """
+        星系、星座和星域信息，字段与 esi_client.get_system_info 一致
+
+        Returns:
+            包含星系信息的字典，SDE 中没有该星系时为 None
+        """
+        data = self._data
+        row = data.system_index.get(system_id)
+        if row is None:
+            return None
+        constellation_id = data.system_constellation[row]
+        region_id = data.system_region[row]
+        return {
+            "system_id": system_id,
+            "system_name": data.system_names[row],
+            "constellation_id": constellation_id,
+            "constellation_name": data.constellation_names.get(constellation_id),
+            "region_id": region_id,
+            "region_name": data.region_names.get(region_id),
+            "security_status": data.system_security[row],
+        }
+
+    def __len__(self) -> int:
+        return len(self._data.system_names)
+
+
+universe = UniverseTable()